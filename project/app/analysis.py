@@ -0,0 +1,232 @@
+'''
+Vectorized line-throughput and bottleneck analysis over operation cycle times.
+
+The cycle times of many processes are loaded into one padded 2-D array (a row per process,
+a column per operation in op_number order, NaN padding). The baseline's throughput, bottlenecks
+and takt compliance are plain NumPy reductions along the operation axis, with no per-row Python
+loops; each what-if scenario then recomputes only the rows of the processes it changes, so the
+cost grows with the changes rather than with scenarios x processes x operations.
+
+A line's throughput is set by its slowest station: with `k` parallel stations at an operation its
+effective cycle time is (cycle_time + delta) / k, and units per hour = 3600 / max(effective).
+Balance efficiency is the work content over (stations used x bottleneck time).
+'''
+from dataclasses import dataclass
+from dataclasses import field
+
+import numpy as np
+
+from app.models import ManufacturingProcess
+from app.models import Operation
+
+@dataclass
+class Scenario:
+  name: str
+  # op_number -> number of parallel stations (1 = unchanged)
+  stations: dict = field(default_factory=dict)
+  # op_number -> change to the cycle time, in seconds
+  cycle_time_deltas: dict = field(default_factory=dict)
+
+class CycleTimeMatrix:
+  '''
+  Cycle times (seconds) of several processes, shape (processes, max operations), NaN padded.
+  `op_numbers` has the same shape (0 where padded); `process_ids` labels the rows.
+  '''
+  def __init__(self, process_ids, op_numbers, cycle_times):
+    self.process_ids = np.asarray(process_ids, dtype=np.int64)
+    self.op_numbers = np.asarray(op_numbers, dtype=np.int64)
+    self.cycle_times = np.asarray(cycle_times, dtype=np.float64)
+    self.operation_counts = (~np.isnan(self.cycle_times)).sum(axis=1)
+
+    # op_number -> (row, column); op_number is globally unique, so a sorted flat index suffices
+    rows, columns = np.nonzero(~np.isnan(self.cycle_times))
+    flat_op_numbers = self.op_numbers[rows, columns]
+    order = np.argsort(flat_op_numbers)
+    self._sorted_op_numbers = flat_op_numbers[order]
+    self._rows = rows[order]
+    self._columns = columns[order]
+
+  @classmethod
+  def load(cls, process_ids=None):
+    '''
+    Reads the operations of the given processes (all processes when None) with one query,
+    plus one for the process ids when none are given. Processes without operations get empty rows.
+    '''
+    if process_ids is None:
+      process_ids = ManufacturingProcess.objects.order_by('pk').values_list('pk', flat=True)
+    process_ids = np.unique(np.fromiter(process_ids, dtype=np.int64))
+
+    rows = list(
+      Operation.objects.filter(process_id__in=process_ids.tolist())
+      .order_by('process_id', 'op_number')
+      .values_list('process_id', 'op_number', 'cycle_time')
+    )
+    if not rows:
+      empty = np.full((len(process_ids), 0), np.nan)
+      return cls(process_ids, empty.astype(np.int64), empty)
+
+    parents, op_numbers, cycle_times = zip(*rows)
+    parents = np.fromiter(parents, dtype=np.int64, count=len(rows))
+    op_numbers = np.fromiter(op_numbers, dtype=np.int64, count=len(rows))
+    seconds = np.array(cycle_times, dtype='timedelta64[us]').astype(np.float64) / 1e6
+
+    # Rows arrive sorted by process, so each operation's column is its offset from the first
+    # operation of its process
+    row_index = np.searchsorted(process_ids, parents)
+    counts = np.bincount(row_index, minlength=len(process_ids))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    column_index = np.arange(len(rows)) - starts[row_index]
+
+    shape = (len(process_ids), counts.max())
+    matrix = np.full(shape, np.nan)
+    matrix[row_index, column_index] = seconds
+    numbers = np.zeros(shape, dtype=np.int64)
+    numbers[row_index, column_index] = op_numbers
+    return cls(process_ids, numbers, matrix)
+
+  def locate(self, op_numbers):
+    '''Returns the (rows, columns) of the given op_numbers; raises ValueError for unknown ones.'''
+    op_numbers = np.asarray(op_numbers, dtype=np.int64)
+    positions = np.searchsorted(self._sorted_op_numbers, op_numbers)
+    positions = np.minimum(positions, max(len(self._sorted_op_numbers) - 1, 0))
+    found = (
+      self._sorted_op_numbers[positions] == op_numbers
+      if len(self._sorted_op_numbers) else np.zeros(len(op_numbers), dtype=bool)
+    )
+    if not found.all():
+      missing = sorted(set(op_numbers[~found].tolist()))
+      raise ValueError(f'Unknown op_number(s) for the selected processes: {missing}')
+    return self._rows[positions], self._columns[positions]
+
+@dataclass
+class ThroughputResult:
+  '''Arrays of shape (scenarios, processes); NaN where a process has no operations.'''
+  scenarios: list
+  process_ids: np.ndarray
+  operation_counts: np.ndarray
+  bottleneck_cycle_time: np.ndarray
+  bottleneck_op_number: np.ndarray
+  throughput_per_hour: np.ndarray
+  balance_efficiency: np.ndarray
+  takt_time: float = None
+  takt_compliant: np.ndarray = None
+  operations_over_takt: np.ndarray = None
+
+  def as_list(self):
+    # JSON-friendly: one entry per process, with one result per scenario.
+    # Arrays are converted to Python lists in bulk; per-value NumPy calls would dominate the cost.
+    def numbers(values):
+      values = np.round(np.where(np.isfinite(values), values, np.nan), 6).T.tolist()
+      return [[None if value != value else value for value in row] for row in values]
+
+    names = [scenario.name for scenario in self.scenarios]
+    counts = self.operation_counts.tolist()
+    throughput = numbers(self.throughput_per_hour)
+    bottleneck_time = numbers(self.bottleneck_cycle_time)
+    balance = numbers(self.balance_efficiency)
+    bottleneck_op = self.bottleneck_op_number.T.tolist()
+    if self.takt_time is not None:
+      compliant = self.takt_compliant.T.tolist()
+      over_takt = self.operations_over_takt.T.tolist()
+    else:
+      compliant = over_takt = [[None] * len(names)] * len(counts)
+
+    return [
+      {
+        'process': process_id,
+        'operation_count': count,
+        'scenarios': [
+          {
+            'scenario': name,
+            'throughput_per_hour': throughput[p][s],
+            'bottleneck_op_number': bottleneck_op[p][s] if count else None,
+            'bottleneck_cycle_time': bottleneck_time[p][s],
+            'balance_efficiency': balance[p][s],
+            'takt_compliant': compliant[p][s] if count else None,
+            'operations_over_takt': over_takt[p][s],
+          }
+          for s, name in enumerate(names)
+        ],
+      }
+      for p, (process_id, count) in enumerate(zip(self.process_ids.tolist(), counts))
+    ]
+
+def reduce_rows(effective, work, stations, op_numbers, takt_time):
+  # Per row of (row x operation) arrays, NaN padded: the bottleneck's time and op_number, the work
+  # content, the stations used and the operations over takt (None without a takt time)
+  padded = np.isnan(effective)
+  column = np.argmax(np.where(padded, -np.inf, effective), axis=1)[:, None]
+  return (
+    np.take_along_axis(effective, column, axis=1)[:, 0],
+    np.take_along_axis(op_numbers, column, axis=1)[:, 0],
+    np.nansum(work, axis=1),
+    np.nansum(stations, axis=1),
+    np.sum(~padded & (effective > takt_time), axis=1) if takt_time is not None else None,
+  )
+
+def evaluate(matrix, scenarios=(), takt_time=None):
+  '''
+  Evaluates the baseline plus every scenario for every process in `matrix`. Each scenario only
+  recomputes the processes it changes. Cycle times never go below zero after applying deltas.
+  '''
+  scenarios = [Scenario('baseline')] + list(scenarios)
+  cycle_times, op_numbers = matrix.cycle_times, matrix.op_numbers
+  if not cycle_times.shape[1]:
+    # No operations at all: a padding column keeps the reductions defined
+    cycle_times = np.full((len(cycle_times), 1), np.nan)
+    op_numbers = np.zeros(cycle_times.shape, dtype=np.int64)
+
+  # The baseline of every process, repeated for every scenario
+  single = np.where(np.isnan(cycle_times), np.nan, 1.0)
+  results = [
+    np.repeat(values[None], len(scenarios), axis=0)
+    for values in reduce_rows(cycle_times, cycle_times, single, op_numbers, takt_time) if values is not None
+  ]
+
+  # Gather every modification of every scenario into flat arrays
+  scenario_index, changed, stations, deltas = [], [], [], []
+  for s, scenario in enumerate(scenarios):
+    for op_number in set(scenario.stations) | set(scenario.cycle_time_deltas):
+      scenario_index.append(s)
+      changed.append(op_number)
+      stations.append(scenario.stations.get(op_number, 1))
+      deltas.append(scenario.cycle_time_deltas.get(op_number, 0.0))
+
+  if changed:
+    rows, columns = matrix.locate(changed)
+    # One row per (scenario, process) pair a scenario changes, rebuilt from the baseline
+    pairs, pair_index = np.unique(np.asarray(scenario_index) * len(cycle_times) + rows, return_inverse=True)
+    pair_scenarios, pair_rows = np.divmod(pairs, len(cycle_times))
+    work = cycle_times[pair_rows]
+    parallel = single[pair_rows]
+    work[pair_index, columns] = np.maximum(cycle_times[rows, columns] + np.asarray(deltas, dtype=np.float64), 0.0)
+    parallel[pair_index, columns] = stations
+    values = reduce_rows(work / parallel, work, parallel, op_numbers[pair_rows], takt_time)
+    for result, value in zip(results, (value for value in values if value is not None)):
+      result[pair_scenarios, pair_rows] = value
+
+  bottleneck, bottleneck_op_number, work_content, stations_used = results[:4]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    throughput = np.where(bottleneck > 0, 3600.0 / bottleneck, np.inf)
+    # Work content over (stations used x bottleneck time): 1.0 means a perfectly balanced line
+    balance = work_content / (stations_used * bottleneck)
+
+  empty = matrix.operation_counts == 0
+  throughput[:, empty] = np.nan
+  bottleneck[:, empty] = np.nan
+  balance[:, empty] = np.nan
+
+  result = ThroughputResult(
+    scenarios=scenarios,
+    process_ids=matrix.process_ids,
+    operation_counts=matrix.operation_counts,
+    bottleneck_cycle_time=bottleneck,
+    bottleneck_op_number=bottleneck_op_number,
+    throughput_per_hour=throughput,
+    balance_efficiency=balance,
+  )
+  if takt_time is not None:
+    result.takt_time = takt_time
+    result.takt_compliant = bottleneck <= takt_time
+    result.operations_over_takt = results[4]
+  return result
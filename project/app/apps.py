@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        # Connect signal receivers
+        from app import signals  # noqa: F401
+        # Register system checks
+        from app import checks  # noqa: F401
@@ -0,0 +1,85 @@
+'''
+ASGI handler that runs the synchronous parts of requests on a fixed set of threads.
+
+Django's ASGIHandler gives every request its own thread for sync code (ORM queries, including
+those behind the async ORM API, sync views and signals) by entering a new ThreadSensitiveContext
+per request, so the number of threads still grows with the number of requests in flight.
+Here each request is instead assigned to one of `threads` long-lived lanes; asgiref runs the sync
+code of all requests in a lane on that lane's single thread, and Django's own
+ThreadSensitiveContext then leaves the lane in place (it only applies when none is set).
+
+Each lane thread holds its own database connection, so `threads` also bounds the connections a
+worker process opens. Requests sharing a lane interleave between their sync calls, which is safe
+as long as no transaction spans an `await`; sync views (and their transactions) run in one call.
+
+Streaming responses (the /export/ download) are read from on the lane thread too: Django 4.1
+iterates them on the event loop, where the queries behind their content are not allowed to run.
+
+GET /events/, the Server-Sent Events stream of app/events.py, is served ahead of Django.
+'''
+from itertools import islice
+
+from asgiref.sync import SyncToAsync
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+class Lane:
+  def __init__(self):
+    self.requests = 0
+
+class ThreadPoolASGIHandler(ASGIHandler):
+  # Parts of a streaming response read per thread hop; the export yields one per process
+  stream_batch = 100
+
+  def __init__(self, threads):
+    super().__init__()
+    self.lanes = [Lane() for _ in range(threads)]
+    # Needs the app registry, which get_asgi_application() has loaded by now
+    from app import events
+    self.events = events
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'http' and scope['path'].removeprefix(scope.get('root_path', '')) == self.events.PATH:
+      # Event streams are async throughout and last as long as the client stays: they get no lane
+      return await self.events.event_stream(scope, receive, send)
+    lane = min(self.lanes, key=lambda lane: lane.requests)
+    lane.requests += 1
+    token = SyncToAsync.thread_sensitive_context.set(lane)
+    try:
+      await super().__call__(scope, receive, send)
+    finally:
+      SyncToAsync.thread_sensitive_context.reset(token)
+      lane.requests -= 1
+
+  async def send_response(self, response, send):
+    if not response.streaming:
+      return await super().send_response(response, send)
+    # As ASGIHandler.send_response(), with the parts read `stream_batch` at a time off the loop
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers(response)})
+    parts = iter(response)
+    read = sync_to_async(lambda: list(islice(parts, self.stream_batch)), thread_sensitive=True)
+    while True:
+      batch = await read()
+      if not batch:
+        break
+      for part in batch:
+        for chunk, _ in self.chunk_bytes(part):
+          await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body'})
+    await sync_to_async(response.close, thread_sensitive=True)()
+
+def response_headers(response):
+  # Headers and cookies, as ASGIHandler.send_response() sends them
+  headers = [
+    (header.encode('ascii') if isinstance(header, str) else header, value.encode('latin1') if isinstance(value, str) else value)
+    for header, value in response.items()
+  ]
+  return headers + [(b'Set-Cookie', cookie.output(header='').encode('ascii').strip()) for cookie in response.cookies.values()]
+
+def get_asgi_application():
+  # Like django.core.asgi.get_asgi_application()
+  import django
+  from django.conf import settings
+
+  django.setup(set_prefix=False)
+  return ThreadPoolASGIHandler(settings.ASGI_THREADS)
@@ -0,0 +1,205 @@
+'''
+Async versions of the read endpoints, served when the project runs under ASGI with ASYNC_READS
+(see project/asgi.py and project/async_urls.py).
+
+Each view awaits Django's async ORM (aget / aexists / async iteration) instead of blocking a worker
+thread for the whole request. They answer GET and HEAD with JSON only; every other method and
+media type (e.g. the browsable API) is handed to the synchronous APIView of the same route, so
+the API surface is unchanged. Response-cache keys and ETags are derived from the synchronous view's
+name, so both paths share cached bytes and validators.
+'''
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from app import views
+from app.cache import coalesce_async
+from app.cache import get_cached_response
+from app.cache import get_validators
+from app.cache import response_cache_key
+from app.cache import set_validators
+from app.cache import store_response
+from app.fast_serializers import FastManufacturingProcessSerializer
+from app.fast_serializers import FastOperationSerializer
+from app.metrics import timing
+from app.models import ManufacturingProcess
+from app.models import Operation
+from app.serializers import ManufacturingProcessSerializer
+from app.serializers import OperationSerializer
+
+class AsyncReadView:
+  # The synchronous APIView of the same route
+  sync_view = None
+  # Conditional GET lookup, as passed to @conditional_response on the synchronous view
+  lookup = None
+  # Share the synchronous view's @cache_response entries
+  cache = False
+
+  def __init_subclass__(cls, **kwargs):
+    # Subclasses define `async def get(self, request, **kwargs)`, which returns the data to render
+    # and raises exceptions.NotFound (etc.) for error responses
+    super().__init_subclass__(**kwargs)
+    if not asyncio.iscoroutinefunction(getattr(cls, 'get', None)):
+      raise TypeError(f'{cls.__name__} must define `async def get()`.')
+
+  @classmethod
+  def as_view(cls):
+    sync_view = cls.sync_view.as_view()
+
+    async def view(request, *args, **kwargs):
+      return await cls().dispatch(request, sync_view, *args, **kwargs)
+
+    # Like APIView.as_view(): session auth enforces CSRF itself, and drf-yasg finds the endpoint
+    # (and documents it from the synchronous view) through `cls`
+    view.csrf_exempt = True
+    view.cls = cls.sync_view
+    view.initkwargs = {}
+    return view
+
+  async def dispatch(self, request, sync_view, *args, **kwargs):
+    if request.method not in ('GET', 'HEAD'):
+      return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+    # An instance of the synchronous view sets the request up and runs its own checks, so its
+    # authenticators, renderers, permissions and throttles (and any overrides of them) apply here too
+    self.api_view = api_view = self.sync_view()
+    api_view.args, api_view.kwargs = args, kwargs
+    request = api_view.initialize_request(request, *args, **kwargs)
+    api_view.request, api_view.headers = request, api_view.default_response_headers
+    api_view.format_kwarg = api_view.get_format_suffix(**kwargs)
+    # Only take plain JSON ourselves; other formats (msgpack, columnar, the browsable API) and the
+    # errors of unknown ones (a ?format= DRF answers with 404) come from the synchronous view
+    try:
+      renderer, _ = api_view.perform_content_negotiation(request)
+    except (exceptions.NotAcceptable, Http404):
+      renderer = None
+    if type(renderer) is not JSONRenderer:
+      return await sync_to_async(sync_view)(request._request, *args, **kwargs)
+
+    try:
+      # APIView.initial(): negotiation, versioning, authentication (the token cache or the
+      # database), permissions and throttles
+      await sync_to_async(api_view.initial)(request, *args, **kwargs)
+      return await self.get_response(request, **kwargs)
+    except exceptions.APIException as exc:
+      return self.handle_exception(request, exc)
+
+  async def get_response(self, request, **kwargs):
+    view_name = self.sync_view.__name__
+    validators = state = None
+    if self.lookup is not None:
+      state = await sync_to_async(self.lookup)(**kwargs)
+      validators = get_validators(view_name, request, state)
+      if validators is not None:
+        response = get_conditional_response(request._request, **validators)
+        if response is not None:
+          set_validators(response, **validators)
+          return self.finalize_response(response)
+
+    key = response = None
+    if self.cache:
+      validator = state[1] if state is not None else None
+      key = await sync_to_async(response_cache_key)(view_name, request, kwargs['pk'], validator)
+      response = await sync_to_async(get_cached_response)(key)
+
+    if key is None:
+      response = self.render(request, await self.get(request, **kwargs))
+    elif response is None:
+      # Concurrent misses share one computation, with the synchronous view's as well
+      async def compute():
+        response = self.render(request, await self.get(request, **kwargs))
+        return response, await sync_to_async(store_response)(key, response)
+      response = await coalesce_async(key, compute)
+
+    if validators is not None:
+      set_validators(response, **validators)
+    return self.finalize_response(response)
+
+  def render(self, request, data, status_code=status.HTTP_200_OK):
+    # What DRF's Response.rendered_content does for a JSONRenderer (which has no charset)
+    with timing('render'):
+      content = request.accepted_renderer.render(
+        data, request.accepted_media_type, {'request': request, 'view': self}
+      )
+    return HttpResponse(content, content_type=request.accepted_media_type, status=status_code)
+
+  def finalize_response(self, response):
+    # The headers APIView.finalize_response() adds
+    response['Allow'] = ', '.join(self.api_view.allowed_methods)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+  def handle_exception(self, request, exc):
+    # Mirrors APIView.handle_exception() + rest_framework.views.exception_handler()
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = self.render(request, data, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+      authenticate_header = self.api_view.get_authenticate_header(request)
+      if authenticate_header:
+        response['WWW-Authenticate'] = authenticate_header
+      else:
+        response.status_code = status.HTTP_403_FORBIDDEN
+    if getattr(exc, 'wait', None):
+      response['Retry-After'] = '%d' % exc.wait
+    return self.finalize_response(response)
+
+class RootView(AsyncReadView):
+  sync_view = views.RootView
+
+  async def get(self, request, **kwargs):
+    return {"message": "Welcome to ozymandias API"}
+
+class ManufacturingProcessList(AsyncReadView):
+  sync_view = views.ManufacturingProcessList
+  lookup = staticmethod(views.process_list_state)
+
+  async def get(self, request, **kwargs):
+    serializer = FastManufacturingProcessSerializer(request, **views.process_fieldset(request))
+    paginator = self.sync_view.pagination_class()
+    page = await paginator.apaginate_queryset(serializer.rows(ManufacturingProcess.objects.all()), request, view=self)
+    operations = [row async for row in serializer.operations(page)]
+    return paginator.get_paginated_response(serializer.data(page, operations)).data
+
+class ManufacturingProcessDetail(AsyncReadView):
+  sync_view = views.ManufacturingProcessDetail
+  lookup = staticmethod(views.process_state)
+  cache = True
+
+  async def get(self, request, pk, **kwargs):
+    fieldset = views.process_fieldset(request)
+    try:
+      process = await views.process_queryset(ManufacturingProcess.objects.all(), **fieldset).aget(pk=pk)
+    except ManufacturingProcess.DoesNotExist:
+      raise exceptions.NotFound()
+    return ManufacturingProcessSerializer(process, context={'request': request}, **fieldset).data
+
+class OperationList(AsyncReadView):
+  sync_view = views.OperationList
+  lookup = staticmethod(views.process_state)
+  cache = True
+
+  async def get(self, request, pk, **kwargs):
+    if not await ManufacturingProcess.objects.filter(pk=pk).aexists():
+      raise exceptions.NotFound()
+    serializer = FastOperationSerializer(request)
+    paginator = self.sync_view.pagination_class()
+    page = await paginator.apaginate_queryset(serializer.rows(Operation.objects.filter(process_id=pk)), request, view=self)
+    return paginator.get_paginated_response(serializer.data(page)).data
+
+class OperationDetail(AsyncReadView):
+  sync_view = views.OperationDetail
+  lookup = staticmethod(views.operation_state)
+  cache = True
+
+  async def get(self, request, pk, op_number, **kwargs):
+    try:
+      operation = await Operation.objects.aget(process_id=pk, op_number=op_number)
+    except Operation.DoesNotExist:
+      raise exceptions.NotFound()
+    return OperationSerializer(operation, context={'request': request}).data
@@ -0,0 +1,47 @@
+from django.conf import settings
+from rest_framework import authentication
+from rest_framework.authentication import TokenAuthentication
+from app.cache import TTLCache
+from app.metrics import timing
+
+# token key -> (user, token)
+# The user instance is shared by every request that presents the token, so the permission sets
+# Django's ModelBackend memoizes on it (`_perm_cache` and friends) are computed once per entry.
+token_cache = TTLCache(
+  max_size=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 1024),
+  ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300),
+)
+
+class TimedAuthenticationMixin:
+  # Counts towards the `auth` time of the request metrics (see app/metrics.py)
+  def authenticate(self, request):
+    with timing('auth'):
+      return super().authenticate(request)
+
+class CachedTokenAuthentication(TimedAuthenticationMixin, TokenAuthentication):
+  '''
+  Token authentication that resolves each token to its user once and then serves it from memory.
+  Credentials are checked with PBKDF2 only when the token is issued (see `auth/token/`), so
+  a cache hit costs no password hashing and no database queries.
+  Entries are dropped when a user's password, active flag, groups or permissions change, or when
+  the token is deleted (see app/signals.py).
+  '''
+  def authenticate_credentials(self, key):
+    cached = token_cache.get(key)
+    if cached is not None:
+      return cached
+    user, token = super().authenticate_credentials(key)
+    token_cache.set(key, (user, token))
+    return user, token
+
+class BasicAuthentication(TimedAuthenticationMixin, authentication.BasicAuthentication):
+  pass
+
+def invalidate_user(user_pk):
+  token_cache.delete_where(lambda entry: entry[0].pk == user_pk)
+
+def invalidate_token(key):
+  token_cache.delete(key)
+
+def invalidate_all():
+  token_cache.clear()
@@ -0,0 +1,98 @@
+'''
+Benchmarks run with `./manage.py benchmark <name>` (see app/management/commands/benchmark.py).
+
+Each benchmark module exposes `add_arguments(parser)` and `run(options, stdout)`. Benchmarks that
+need data run against a throwaway test database created from DATABASES (see `test_database()`),
+so production data is never touched.
+'''
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test.utils import override_settings
+from django.test.utils import setup_databases
+from django.test.utils import setup_test_environment
+from django.test.utils import teardown_databases
+from django.test.utils import teardown_test_environment
+from rest_framework.authtoken.models import Token
+
+@contextmanager
+def test_database(verbosity=0):
+  # DEBUG would record every query in memory and slow every request down
+  setup_test_environment(debug=False)
+  old_config = setup_databases(verbosity, interactive=False)
+  try:
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+      yield
+  finally:
+    teardown_databases(old_config, verbosity)
+    teardown_test_environment()
+
+def seed(processes, operations_per_process):
+  '''Creates processes with operations and a user; returns that user's API token key.'''
+  from app.models import ManufacturingProcess
+  from app.models import Operation
+
+  created = ManufacturingProcess.objects.bulk_create(
+    ManufacturingProcess(name=f'Process {i}', description='Benchmark') for i in range(processes)
+  )
+  Operation.objects.bulk_create(
+    (
+      Operation(
+        process=process, op_number=p * operations_per_process + i + 1, name=f'Operation {i}',
+        description='Benchmark', cycle_time=timedelta(seconds=30 + i % 60),
+      )
+      for p, process in enumerate(created) for i in range(operations_per_process)
+    ),
+    batch_size=1000,
+  )
+  ManufacturingProcess.refresh_rollups([process.pk for process in created])
+  user = User.objects.create_superuser(username='benchmark', password='benchmark')
+  return Token.objects.create(user=user).key
+
+def summarize(latencies, elapsed):
+  '''Throughput and latency percentiles (milliseconds) of a batch of requests.'''
+  latencies = sorted(latencies)
+  cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+  return {
+    'requests': len(latencies),
+    'req/s': len(latencies) / elapsed,
+    'p50 ms': cuts[49] * 1000,
+    'p95 ms': cuts[94] * 1000,
+    'p99 ms': cuts[98] * 1000,
+  }
+
+class ThreadSampler:
+  '''Records the peak number of live threads while the block runs.'''
+  def __init__(self, interval=0.005):
+    self.interval = interval
+    self.peak = threading.active_count()
+
+  def __enter__(self):
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._sample, daemon=True)
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self._stop.set()
+    self._thread.join()
+
+  def _sample(self):
+    while not self._stop.is_set():
+      # Minus the sampler itself
+      self.peak = max(self.peak, threading.active_count() - 1)
+      time.sleep(self.interval)
+
+def print_table(stdout, rows):
+  columns = list(rows[0])
+  widths = [max(len(column), *(len(format_value(row[column])) for row in rows)) for column in columns]
+  stdout.write('  '.join(column.rjust(width) for column, width in zip(columns, widths)))
+  for row in rows:
+    stdout.write('  '.join(format_value(row[column]).rjust(width) for column, width in zip(columns, widths)))
+
+def format_value(value):
+  return f'{value:.1f}' if isinstance(value, float) else str(value)
@@ -0,0 +1,165 @@
+'''
+Async read endpoints under ASGI vs the synchronous views under WSGI.
+
+Both deployments are driven in-process, through the real entry points (project/wsgi.py's
+WSGIHandler and project/asgi.py's ASGIHandler), without sockets. Each round fires `concurrency`
+simultaneous GETs at the read endpoints and waits for all of them; latency is measured from the
+start of the round, so it includes time spent queued behind busy worker threads. WSGI requests run
+on a fixed pool of `--threads` threads, like a threaded WSGI server; ASGI requests share
+ASGI_THREADS threads for their sync work (see app/asgi.py).
+
+`--client-delay` models clients on slow links: sending each response takes that long. A WSGI
+server thread is blocked while it writes; an ASGI server awaits the write on the event loop.
+
+`--hot` models a shift change: every request reads one of that many processes, with the response
+cache disabled as after a burst of writes, so concurrent misses coalesce (see app/cache.py). The
+`coalesced` column counts the requests that were served another request's response.
+'''
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from django.urls import reverse
+from app.asgi import get_asgi_application
+from app.benchmarks import ThreadSampler
+from app.benchmarks import print_table
+from app.benchmarks import seed
+from app.benchmarks import summarize
+from app.benchmarks import test_database
+from app.cache import response_cache_stats
+from app.models import ManufacturingProcess
+
+def add_arguments(parser):
+  parser.add_argument('--processes', type=int, default=200)
+  parser.add_argument('--operations', type=int, default=20, help='Operations per process')
+  parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000])
+  parser.add_argument('--rounds', type=int, default=5)
+  parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+  parser.add_argument('--client-delay', type=float, default=50, help='Milliseconds to send a response')
+  parser.add_argument(
+    '--cold', action='store_true',
+    help='Disable the response cache, so every request reaches the database'
+  )
+  parser.add_argument('--hot', type=int, help='Read only this many processes, with the response cache disabled')
+
+def run(options, stdout):
+  with test_database():
+    token = seed(options['processes'], options['operations'])
+    paths = request_paths(options['hot'])
+    headers = {'authorization': f'Token {token}', 'accept': 'application/json'}
+    client_delay = options['client_delay'] / 1000
+    cache_settings = {}
+    if options['cold'] or options['hot']:
+      cache_settings['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+    rows = []
+    with override_settings(**cache_settings):
+      for concurrency in options['concurrency']:
+        with override_settings(ROOT_URLCONF='project.urls'):
+          response_cache_stats.reset()
+          rows.append(dict(
+            mode=f"wsgi ({options['threads']} threads)", concurrency=concurrency,
+            **measure_wsgi(paths, headers, client_delay, concurrency, options['rounds'], options['threads']),
+            coalesced=response_cache_stats.as_dict()['coalesced'],
+          ))
+        with override_settings(ROOT_URLCONF='project.async_urls'):
+          response_cache_stats.reset()
+          rows.append(dict(
+            mode='asgi (async views)', concurrency=concurrency,
+            **measure_asgi(paths, headers, client_delay, concurrency, options['rounds']),
+            coalesced=response_cache_stats.as_dict()['coalesced'],
+          ))
+    print_table(stdout, rows)
+
+def request_paths(hot=None):
+  # A dashboard's reads: process pages, process details and operation pages; only the details and
+  # operation pages of the first `hot` processes if given
+  pks = list(ManufacturingProcess.objects.order_by('pk').values_list('pk', flat=True))
+  if hot:
+    pks = pks[:hot]
+  paths = [] if hot else [reverse('app:manufacturingprocess-list')]
+  for pk in pks:
+    paths.append(reverse('app:manufacturingprocess-detail', args=[pk]))
+    paths.append(reverse('app:operation-list', args=[pk]))
+  return paths
+
+def measure_wsgi(paths, headers, client_delay, concurrency, rounds, threads):
+  application = get_wsgi_application()
+  environ_headers = {f"HTTP_{name.upper().replace('-', '_')}": value for name, value in headers.items()}
+
+  def get(path, started):
+    environ = {
+      'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+      'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+      'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': io.StringIO(),
+      **environ_headers,
+    }
+    statuses = []
+    response = application(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+    try:
+      b''.join(response)
+      time.sleep(client_delay)
+    finally:
+      response.close()  # sends request_finished, like a WSGI server would
+    assert statuses[0].startswith('200'), statuses[0]
+    return time.perf_counter() - started
+
+  latencies = []
+  with ThreadSampler() as threads_used, ThreadPoolExecutor(threads) as executor:
+    started = time.perf_counter()
+    for round_number in range(rounds):
+      round_started = time.perf_counter()
+      batch = [paths[(round_number * concurrency + i) % len(paths)] for i in range(concurrency)]
+      latencies += executor.map(get, batch, [round_started] * concurrency)
+    elapsed = time.perf_counter() - started
+  return dict(summarize(latencies, elapsed), **{'peak threads': threads_used.peak})
+
+def measure_asgi(paths, headers, client_delay, concurrency, rounds):
+  application = get_asgi_application()
+  raw_headers = [(b'host', b'testserver')] + [(name.encode(), value.encode()) for name, value in headers.items()]
+
+  async def get(path, started):
+    scope = {
+      'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+      'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+      'headers': raw_headers, 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    statuses = []
+
+    async def receive():
+      return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+      if message['type'] == 'http.response.start':
+        statuses.append(message['status'])
+      elif not message.get('more_body'):
+        await asyncio.sleep(client_delay)
+
+    await application(scope, receive, send)
+    assert statuses[0] == 200, statuses[0]
+    return time.perf_counter() - started
+
+  async def main():
+    latencies = []
+    for round_number in range(rounds):
+      round_started = time.perf_counter()
+      batch = [paths[(round_number * concurrency + i) % len(paths)] for i in range(concurrency)]
+      latencies += await asyncio.gather(*(get(path, round_started) for path in batch))
+    return latencies
+
+  with ThreadSampler() as threads_used:
+    started = time.perf_counter()
+    latencies = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+  # Stop the lane threads, so they don't count towards the next measurement
+  for lane in application.lanes:
+    executor = SyncToAsync.context_to_thread_executor.pop(lane, None)
+    if executor:
+      executor.shutdown()
+  return dict(summarize(latencies, elapsed), **{'peak threads': threads_used.peak})
@@ -0,0 +1,96 @@
+'''
+Pooled connections vs a new database connection per request.
+
+Each simulated request, on one of `--threads` threads, gets a connection, runs one short query and
+gives the connection back, as a request served by Django with CONN_MAX_AGE=0 would. Without the
+pool that means connecting and disconnecting every time.
+
+By default connections go to a local stand-in that sleeps for `--connect-ms` per handshake and
+`--query-ms` per query, roughly a PostgreSQL server on the same network. With `--postgres`, real
+connections are opened with the parameters of DATABASES['default'].
+'''
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from app.benchmarks import print_table
+from app.benchmarks import summarize
+from app.db.pool import ConnectionPool
+
+def add_arguments(parser):
+  parser.add_argument('--requests', type=int, default=2000)
+  parser.add_argument('--threads', type=int, default=16)
+  parser.add_argument('--pool-size', type=int, default=8)
+  parser.add_argument('--connect-ms', type=float, default=5.0, help='Stand-in handshake time')
+  parser.add_argument('--query-ms', type=float, default=0.5, help='Stand-in query time')
+  parser.add_argument('--postgres', action='store_true', help='Use DATABASES["default"] instead of the stand-in')
+
+class StandInConnection:
+  def __init__(self, connect_time, query_time):
+    self.query_time = query_time
+    time.sleep(connect_time)
+
+  def query(self):
+    time.sleep(self.query_time)
+
+  def close(self):
+    pass
+
+class PostgresConnection:
+  def __init__(self, conn_params):
+    from app.db.backends.postgresql_pool.base import connect
+    self.connection = connect(conn_params)
+    self.connection.autocommit = True
+
+  def query(self):
+    with self.connection.cursor() as cursor:
+      cursor.execute('SELECT 1')
+      cursor.fetchone()
+
+  def close(self):
+    self.connection.close()
+
+def run(options, stdout):
+  if options['postgres']:
+    conn_params = connections['default'].get_connection_params()
+    connect = lambda: PostgresConnection(conn_params)
+  else:
+    connect = lambda: StandInConnection(options['connect_ms'] / 1000, options['query_ms'] / 1000)
+
+  def per_request(_):
+    started = time.perf_counter()
+    connection = connect()
+    try:
+      connection.query()
+    finally:
+      connection.close()
+    return time.perf_counter() - started
+
+  pool = ConnectionPool(
+    connect=connect, close=lambda connection: connection.close(), max_size=options['pool_size'], max_age=1800,
+  )
+
+  def pooled(_):
+    started = time.perf_counter()
+    connection = pool.acquire()
+    try:
+      connection.query()
+    finally:
+      pool.release(connection)
+    return time.perf_counter() - started
+
+  rows = []
+  for mode, request in (('connect per request', per_request), (f"pool of {options['pool_size']}", pooled)):
+    with ThreadPoolExecutor(options['threads']) as executor:
+      started = time.perf_counter()
+      latencies = list(executor.map(request, range(options['requests'])))
+      rows.append(dict(mode=mode, **summarize(latencies, time.perf_counter() - started)))
+  pool.close()
+  print_table(stdout, rows)
+
+  stats = pool.stats()
+  stdout.write(
+    f"\npool: {stats['created']} connections opened for {stats['acquired']} checkouts, "
+    f"{stats['waits']} waits ({stats['wait_time_total'] * 1000:.1f} ms total, "
+    f"{stats['wait_time_max'] * 1000:.1f} ms max)"
+  )
@@ -0,0 +1,367 @@
+'''
+Latency, throughput and queries per request of every route in app/urls.py, against budgets.
+The admin site, included from Django, is left out.
+
+Seeds `--processes` processes with `--operations` operations each and sends `--requests` requests
+to each endpoint, one after another, through the test client: the whole middleware and view stack,
+without sockets. Requests to routes that take a process or operation are spread across the table,
+so the response cache only answers as often as it would for many clients. Writes act on rows
+created for them before the clock starts. Each endpoint gets one untimed warm-up request.
+
+Every endpoint has two budgets (see ENDPOINTS): the most queries one request may make, and its
+p95 latency at the default volumes. Query budgets hold at any volume; a route over its budget is
+running queries per row. With --check the command fails when an endpoint is over budget or a
+route has no budget, for CI; --latency-scale stretches the latency budgets for slower machines.
+'''
+import gc
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+from typing import Optional
+
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import override_settings
+from django.urls import URLPattern
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.duration import duration_string
+from rest_framework.test import APIClient
+from app import urls as app_urls
+from app.benchmarks import print_table
+from app.benchmarks import seed
+from app.benchmarks import summarize
+from app.benchmarks import test_database
+from app.models import Change
+from app.models import ManufacturingProcess
+from app.models import Operation
+
+def add_arguments(parser):
+  parser.add_argument('--processes', type=int, default=10000)
+  parser.add_argument('--operations', type=int, default=50, help='Operations per process')
+  parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint')
+  parser.add_argument('--check', action='store_true', help='Fail when an endpoint is over budget')
+  parser.add_argument('--latency-scale', type=float, default=1.0, help='Multiplies the latency budgets')
+  parser.add_argument(
+    '--cold', action='store_true',
+    help='Disable the response cache, so every request reaches the database'
+  )
+
+def spread(items, count):
+  # `count` items evenly spaced across `items`, repeating when there are fewer
+  return [items[i * len(items) // count] for i in range(count)]
+
+OPERATION_CYCLE_TIME = timedelta(minutes=1)
+
+class Targets:
+  '''The seeded rows requests act on, and rows created for the writes.'''
+  def __init__(self, username, password):
+    self.username = username
+    self.password = password
+    self.processes = list(ManufacturingProcess.objects.order_by('pk').values_list('pk', flat=True))
+    self.reserved = 0
+
+  def process_pks(self, count):
+    return spread(self.processes, count)
+
+  def operation_keys(self, count):
+    # (process pk, op_number): the first operation of `count` processes spread across the table;
+    # dict() keeps the last pair per process, so they come in descending order
+    pks = self.process_pks(count)
+    first = dict(
+      Operation.objects.filter(process_id__in=pks).order_by('-op_number').values_list('process_id', 'op_number')
+    )
+    return [(pk, first[pk]) for pk in pks if pk in first]
+
+  def op_numbers(self, count):
+    # Unused op_numbers, above those handed out before and those in use: the clone endpoint also
+    # takes its numbers from above the highest in use
+    in_use = Operation.objects.aggregate(Max('op_number'))['op_number__max'] or 0
+    start = max(in_use, self.reserved) + 1
+    self.reserved = start + count - 1
+    return range(start, start + count)
+
+  def create_processes(self, count, operations):
+    processes = ManufacturingProcess.objects.bulk_create(
+      ManufacturingProcess(name=f'Disposable {i}', description='Benchmark') for i in range(count)
+    )
+    self.create_operations([process.pk for process in processes for _ in range(operations)])
+    return [process.pk for process in processes]
+
+  def create_operations(self, pks):
+    # One operation per pk; returns their (process pk, op_number)
+    keys = list(zip(pks, self.op_numbers(len(pks))))
+    Operation.objects.bulk_create(
+      Operation(
+        process_id=pk, op_number=op_number, name='Disposable', description='Benchmark',
+        cycle_time=OPERATION_CYCLE_TIME,
+      )
+      for pk, op_number in keys
+    )
+    return keys
+
+def operation_body(op_number, name='Benchmark'):
+  return {'name': name, 'op_number': op_number, 'description': 'Benchmark', 'cycle_time': duration_string(OPERATION_CYCLE_TIME)}
+
+def process_url(pk):
+  return 'http://testserver' + reverse('app:manufacturingprocess-detail', args=[pk])
+
+@dataclass
+class Endpoint:
+  name: str  # URL name in app/urls.py
+  method: str
+  # (targets, count) -> [(path, body)]; called before timing, so it may create the rows it needs
+  requests: Callable
+  queries: int  # most queries one request may make
+  p95_ms: float  # p95 latency at the default volumes
+  status: int = 200
+  label: str = ''
+  # Fewer requests for endpoints that read the whole table
+  max_requests: Optional[int] = None
+
+  def __str__(self):
+    return f"{self.method} {self.name}{f' {self.label}' if self.label else ''}"
+
+def fixed(name, query='', body=None, kwargs=None):
+  return lambda targets, count: [(reverse(name, kwargs=kwargs) + query, body)] * count
+
+def per_process(name, query='', body=None):
+  return lambda targets, count: [
+    (reverse(name, args=[pk]) + query, body(pk) if body else None) for pk in targets.process_pks(count)
+  ]
+
+def per_operation(name, body=None):
+  return lambda targets, count: [
+    (reverse(name, args=key), body(*key) if body else None) for key in targets.operation_keys(count)
+  ]
+
+def batches(name, parameter, size, keys):
+  def requests(targets, count):
+    everything = keys(targets, count * size)
+    return [
+      (f"{reverse(name)}?{parameter}={','.join(everything[i * size:(i + 1) * size])}", None)
+      for i in range(count)
+    ]
+  return requests
+
+def created_processes(targets, count):
+  return [
+    (reverse('app:manufacturingprocess-detail', args=[pk]), None)
+    for pk in targets.create_processes(count, operations=50)
+  ]
+
+def created_operations(targets, count):
+  return [
+    (reverse('app:operation-detail', args=key), None)
+    for key in targets.create_operations(targets.process_pks(count))
+  ]
+
+def clones(targets, count):
+  return [(reverse('app:manufacturingprocess-clone'), [{'source': pk}]) for pk in targets.process_pks(count)]
+
+def bulk_import(targets, count):
+  return [
+    (reverse('app:operation-list', args=[pk]), [operation_body(op_number) for op_number in targets.op_numbers(100)])
+    for pk in targets.process_pks(count)
+  ]
+
+def reversed_routings(targets, count):
+  # Each request turns a process's routing around, onto op_numbers nothing else uses
+  pks = targets.process_pks(count)
+  routings = {}
+  operations = Operation.objects.filter(process_id__in=pks).order_by('op_number')
+  for pk, op_number in operations.values_list('process_id', 'op_number'):
+    routings.setdefault(pk, []).append(op_number)
+  return [
+    (reverse('app:operation-resequence', args=[pk]), {
+      'order': routings[pk][::-1], 'start': targets.op_numbers(len(routings[pk]))[0], 'step': 1,
+    })
+    for pk in pks
+  ]
+
+def throughput_analysis(targets, count):
+  return [
+    (reverse('app:throughput-analysis'), {
+      'processes': targets.process_pks(50),
+      'scenarios': [{'name': 'Double the first station', 'stations': {}}],
+    })
+  ] * count
+
+def change_pages(targets, count):
+  # A page of 100 changes per request, logged an hour ago so the feed serves them: 10 processes
+  # and 80 operations updated, and 10 operations deleted
+  pks = targets.process_pks(count * 10)
+  operations = defaultdict(list)
+  for process_id, pk in Operation.objects.filter(process_id__in=pks).order_by('op_number').values_list('process_id', 'pk'):
+    operations[process_id].append(pk)
+  logged = timezone.now() - timedelta(hours=1)
+  changes = []
+  for i in range(count):
+    page = pks[i * 10:(i + 1) * 10]
+    changes += [(Change.PROCESS, pk, Change.UPDATED) for pk in page]
+    page_operations = spread([operation for pk in page for operation in operations[pk]], 90)
+    changes += [(Change.OPERATION, operation, Change.UPDATED) for operation in page_operations[:80]]
+    changes += [(Change.OPERATION, operation, Change.DELETED) for operation in page_operations[80:]]
+  changes = Change.objects.bulk_create(
+    Change(object_type=object_type, object_pk=pk, action=action, created_at=logged) for object_type, pk, action in changes
+  )
+  return [(f"{reverse('app:change-feed')}?since={changes[i * 100].pk - 1}&page_size=100", None) for i in range(count)]
+
+def credentials(targets, count):
+  return [(reverse('app:auth-token'), {'username': targets.username, 'password': targets.password})] * count
+
+# Budgets: auth takes one query on a token cache miss; cached GETs add up to two for their
+# conditional-response state (see conditional_response() in app/cache.py), except the lists, whose
+# state is the list version in the response cache.
+ENDPOINTS = [
+  Endpoint('app:root-view', 'GET', fixed('app:root-view'), queries=1, p95_ms=10),
+  Endpoint('app:auth-token', 'POST', credentials, queries=3, p95_ms=1000),
+  Endpoint('app:manufacturingprocess-list', 'GET', fixed('app:manufacturingprocess-list'), queries=2, p95_ms=25),
+  Endpoint(
+    'app:manufacturingprocess-list', 'GET', fixed('app:manufacturingprocess-list', '?expand=operations&page_size=100'),
+    queries=2, p95_ms=150, label='?expand=operations&page_size=100',
+  ),
+  Endpoint(
+    'app:manufacturingprocess-list', 'POST', fixed('app:manufacturingprocess-list', body={'name': 'Benchmark', 'description': 'Created'}),
+    queries=4, p95_ms=25, status=201,
+  ),
+  Endpoint(
+    'app:manufacturingprocess-clone', 'POST', clones,
+    queries=10, p95_ms=50, status=201,
+  ),
+  Endpoint(
+    'app:manufacturingprocess-batch', 'GET',
+    batches('app:manufacturingprocess-batch', 'ids', 100, lambda targets, count: [
+      str(pk) for pk in targets.process_pks(count)
+    ]),
+    queries=3, p95_ms=400, label='100 ids',
+  ),
+  Endpoint('app:manufacturingprocess-summary-list', 'GET', fixed('app:manufacturingprocess-summary-list'), queries=2, p95_ms=25),
+  Endpoint('app:manufacturingprocess-detail', 'GET', per_process('app:manufacturingprocess-detail'), queries=4, p95_ms=25),
+  Endpoint(
+    'app:manufacturingprocess-detail', 'PUT',
+    per_process('app:manufacturingprocess-detail', body=lambda pk: {'name': f'Renamed {pk}', 'description': 'Updated'}),
+    queries=5, p95_ms=25,
+  ),
+  Endpoint('app:manufacturingprocess-detail', 'DELETE', created_processes, queries=8, p95_ms=50, status=204),
+  Endpoint('app:manufacturingprocess-summary', 'GET', per_process('app:manufacturingprocess-summary'), queries=4, p95_ms=25),
+  Endpoint('app:operation-list', 'GET', per_process('app:operation-list'), queries=5, p95_ms=25),
+  Endpoint('app:operation-list', 'POST', bulk_import, queries=7, p95_ms=150, status=201, label='100 operations'),
+  Endpoint('app:operation-resequence', 'POST', reversed_routings, queries=10, p95_ms=150, label='reverse a routing'),
+  Endpoint('app:operation-detail', 'GET', per_operation('app:operation-detail'), queries=4, p95_ms=25),
+  Endpoint(
+    'app:operation-detail', 'PUT',
+    per_operation('app:operation-detail', body=lambda pk, op_number: dict(
+      operation_body(op_number, name=f'Renamed {op_number}'), process=process_url(pk)
+    )),
+    queries=7, p95_ms=25,
+  ),
+  Endpoint('app:operation-detail', 'DELETE', created_operations, queries=5, p95_ms=25, status=204),
+  Endpoint(
+    'app:operation-batch', 'GET',
+    batches('app:operation-batch', 'keys', 100, lambda targets, count: [
+      f'{pk}:{op_number}' for pk, op_number in targets.operation_keys(count)
+    ]),
+    queries=3, p95_ms=100, label='100 keys',
+  ),
+  Endpoint('app:search', 'GET', fixed('app:search', '?q=operation 4'), queries=3, p95_ms=100),
+  Endpoint('app:change-feed', 'GET', change_pages, queries=6, p95_ms=50, label='100 changes'),
+  Endpoint('app:export', 'GET', fixed('app:export'), queries=2, p95_ms=20000, max_requests=3),
+  Endpoint('app:throughput-analysis', 'POST', throughput_analysis, queries=3, p95_ms=250, label='50 processes'),
+  Endpoint('app:metrics', 'GET', fixed('app:metrics'), queries=0, p95_ms=25),
+  Endpoint('app:schema-json', 'GET', fixed('app:schema-json', kwargs={'format': '.json'}), queries=0, p95_ms=25),
+  Endpoint('app:schema-swagger-ui', 'GET', fixed('app:schema-swagger-ui'), queries=0, p95_ms=25),
+  Endpoint('app:schema-redoc', 'GET', fixed('app:schema-redoc'), queries=0, p95_ms=25),
+]
+
+def uncovered_routes(endpoints=ENDPOINTS):
+  '''Names of the routes in app/urls.py without an endpoint, and so without budgets.'''
+  covered = {endpoint.name for endpoint in endpoints}
+  return sorted(
+    f'app:{pattern.name}' for pattern in app_urls.urlpatterns
+    if isinstance(pattern, URLPattern) and f'app:{pattern.name}' not in covered
+  )
+
+class QueryCounter:
+  # A database execute wrapper
+  def __init__(self):
+    self.count = 0
+
+  def __call__(self, execute, sql, params, many, context):
+    self.count += 1
+    return execute(sql, params, many, context)
+
+def token_client(token):
+  client = APIClient()
+  client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+  return client
+
+def measure(client, endpoint, requests):
+  '''Sends `requests` (the first one untimed); returns latencies and the most queries one made.'''
+  send = getattr(client, endpoint.method.lower())
+  latencies = []
+  most_queries = 0
+  started = None
+  for path, body in requests:
+    counter = QueryCounter()
+    request_started = time.perf_counter()
+    with connection.execute_wrapper(counter):
+      response = send(path, body, format='json') if body is not None else send(path)
+      if response.streaming:
+        b''.join(response.streaming_content)
+    elapsed = time.perf_counter() - request_started
+    if response.status_code != endpoint.status:
+      raise CommandError(f'{endpoint}: {path} returned {response.status_code}, not {endpoint.status}')
+    most_queries = max(most_queries, counter.count)
+    if started is None:
+      started = time.perf_counter()  # after the warm-up
+    else:
+      latencies.append(elapsed)
+  return latencies, most_queries, time.perf_counter() - started
+
+def over_budget(endpoint, row, latency_scale=1.0):
+  failures = []
+  if row['queries'] > endpoint.queries:
+    failures.append(f"{row['queries']} queries > {endpoint.queries}")
+  if row['p95 ms'] > endpoint.p95_ms * latency_scale:
+    failures.append(f"p95 {row['p95 ms']:.1f} ms > {endpoint.p95_ms * latency_scale:g} ms")
+  return failures
+
+def measure_endpoints(client, targets, count, latency_scale=1.0, endpoints=ENDPOINTS):
+  '''One row per endpoint; `failures` lists what is over budget.'''
+  rows = []
+  for endpoint in endpoints:
+    # Every endpoint starts from a collected heap, rather than paying for the garbage of the last
+    gc.collect()
+    requests = min(count, endpoint.max_requests or count)
+    latencies, queries, elapsed = measure(client, endpoint, endpoint.requests(targets, requests + 1))
+    row = dict(endpoint=str(endpoint), **summarize(latencies, elapsed), queries=queries)
+    row['budget'] = f'{endpoint.queries} q, {endpoint.p95_ms * latency_scale:g} ms'
+    row['failures'] = over_budget(endpoint, row, latency_scale)
+    rows.append(row)
+  return rows
+
+def run(options, stdout):
+  cache_settings = {}
+  if options['cold']:
+    cache_settings['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+  with test_database():
+    token = seed(options['processes'], options['operations'])
+    targets = Targets('benchmark', 'benchmark')
+    client = token_client(token)
+    # /metrics is measured without its bearer token, from an internal IP (the test client's)
+    with override_settings(METRICS_TOKEN=None, INTERNAL_IPS=['127.0.0.1'], **cache_settings):
+      rows = measure_endpoints(client, targets, options['requests'], options['latency_scale'])
+
+  failures = [f"{row['endpoint']}: {', '.join(row['failures'])}" for row in rows if row['failures']]
+  failures += [f'{name}: no budget' for name in uncovered_routes()]
+  for row in rows:
+    row['result'] = 'over' if row.pop('failures') else 'ok'
+  print_table(stdout, rows)
+  for failure in failures:
+    stdout.write(failure)
+  if options['check'] and failures:
+    raise CommandError(f'{len(failures)} endpoint(s) over budget')
@@ -0,0 +1,127 @@
+'''
+Connection scaling of the Server-Sent Events streams (app/events.py).
+
+Opens `--connections` streams through project/asgi.py's handler, in-process and without sockets,
+each following one of `--processes` processes, then publishes `--changes` changes at `--rate` per
+second from another thread, as committed writes do. Reports the memory each open stream takes,
+how long events take from publication to each stream's send (fan-out latency), and deliveries
+per second. The `--slow` fraction of clients takes `--client-delay` milliseconds to read each
+chunk; their changes merge while they lag instead of queueing, which the `merged` column counts.
+'''
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from django.test.utils import override_settings
+from app.asgi import get_asgi_application
+from app.benchmarks import print_table
+from app.benchmarks import seed
+from app.benchmarks import summarize
+from app.benchmarks import test_database
+from app.events import broadcaster
+from app.models import ManufacturingProcess
+
+def add_arguments(parser):
+  parser.add_argument('--connections', type=int, nargs='+', default=[100, 1000, 10000])
+  parser.add_argument('--processes', type=int, default=100, help='Processes followed, one per stream')
+  parser.add_argument('--changes', type=int, default=500)
+  parser.add_argument('--rate', type=float, default=1000, help='Changes per second')
+  parser.add_argument('--slow', type=float, default=0.1, help='Fraction of slow clients')
+  parser.add_argument('--client-delay', type=float, default=250, help='Milliseconds a slow client takes per chunk')
+
+def run(options, stdout):
+  with test_database():
+    token = seed(options['processes'], 1)
+    pks = list(ManufacturingProcess.objects.order_by('pk').values_list('pk', flat=True))
+    application = get_asgi_application()
+    rows = []
+    with override_settings(EVENTS_MAX_STREAMS=max(options['connections']), EVENTS_HEARTBEAT=60):
+      for connections in options['connections']:
+        rows.append(dict(connections=connections, **asyncio.run(measure(application, token, pks, connections, options))))
+  print_table(stdout, rows)
+
+async def measure(application, token, pks, connections, options):
+  headers = [(b'host', b'testserver'), (b'authorization', f'Token {token}'.encode())]
+  slow = int(connections * options['slow'])
+  client_delay = options['client_delay'] / 1000
+  published = {}
+  latencies = []
+  opened = asyncio.Event()
+  closing = asyncio.Event()
+  streams_open = 0
+
+  async def stream(i):
+    nonlocal streams_open
+    pk = pks[i % len(pks)]
+    scope = {
+      'type': 'http', 'method': 'GET', 'path': '/events/', 'root_path': '',
+      'query_string': f'processes={pk}'.encode(), 'headers': headers,
+    }
+    requested = False
+
+    async def receive():
+      nonlocal requested
+      if not requested:
+        requested = True
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+      await closing.wait()
+      return {'type': 'http.disconnect'}
+
+    async def send(message):
+      nonlocal streams_open
+      if message['type'] == 'http.response.start':
+        streams_open += 1
+        if streams_open == connections:
+          opened.set()
+        return
+      now = time.perf_counter()
+      for line in message['body'].split(b'\n'):
+        if line.startswith(b'id: '):
+          latencies.append(now - published[int(line[4:])])
+      if i < slow:
+        await asyncio.sleep(client_delay)
+
+    await application(scope, receive, send)
+
+  tracemalloc.start()
+  started = time.perf_counter()
+  tasks = [asyncio.ensure_future(stream(i)) for i in range(connections)]
+  await opened.wait()
+  open_seconds = time.perf_counter() - started
+  memory = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  def publish():
+    # Each change is delivered on its own, as separate transactions commit
+    interval = 1 / options['rate']
+    for cursor in range(options['changes']):
+      published[cursor] = time.perf_counter()
+      broadcaster.deliver([{'process': pks[cursor % len(pks)], 'action': 'updated', 'cursor': cursor}])
+      time.sleep(interval)
+
+  started = time.perf_counter()
+  publisher = threading.Thread(target=publish)
+  publisher.start()
+  while publisher.is_alive() or any(subscriber.pending for subscriber in broadcaster.subscribers):
+    await asyncio.sleep(0.01)
+  # Let the slow clients finish their last chunk
+  await asyncio.sleep(client_delay)
+  elapsed = time.perf_counter() - started
+  closing.set()
+  await asyncio.gather(*tasks)
+
+  # Every change goes to the streams following its process
+  followers = [len(range(i, connections, len(pks))) for i in range(len(pks))]
+  expected = sum(followers[cursor % len(pks)] for cursor in range(options['changes']))
+  row = summarize(latencies, elapsed)
+  return {
+    'open s': open_seconds,
+    'KiB/stream': memory / connections / 1024,
+    'deliveries': row['requests'],
+    'deliveries/s': row['req/s'],
+    'p50 ms': row['p50 ms'],
+    'p95 ms': row['p95 ms'],
+    'p99 ms': row['p99 ms'],
+    'merged': expected - len(latencies),
+  }
@@ -0,0 +1,76 @@
+'''
+Response size and render time of the list formats: JSON, MessagePack and columnar JSON.
+
+Each format renders a page of `--rows` operations (the operation list) and of `--rows` processes
+with their operations expanded, built the way the views build them (app/fast_serializers.py).
+Render time includes building the page from fetched rows in the layout the format uses. Sizes
+are given as sent and gzipped, since most deployments compress JSON responses.
+'''
+import gzip
+import time
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from app.benchmarks import print_table
+from app.benchmarks import seed
+from app.benchmarks import test_database
+from app.fast_serializers import FastManufacturingProcessSerializer
+from app.fast_serializers import FastOperationSerializer
+from app.models import ManufacturingProcess
+from app.models import Operation
+from app.renderers import ColumnarJSONRenderer
+from app.renderers import MessagePackRenderer
+
+def add_arguments(parser):
+  parser.add_argument('--rows', type=int, default=100, help='Rows per page, like ?page_size=')
+  parser.add_argument('--operations', type=int, default=100, help='Operations per process')
+  parser.add_argument('--repeat', type=int, default=50)
+
+def run(options, stdout):
+  with test_database():
+    seed(options['rows'], options['operations'])
+    request = Request(APIRequestFactory().get('/'))
+
+    operations = FastOperationSerializer(request)
+    operation_rows = list(operations.rows(Operation.objects.order_by('op_number')[:options['rows']]))
+    process_pk = operation_rows[0].process_id
+    # The operation list is per process; its page holds up to `--rows` of that process's operations
+    operation_rows = [row for row in operation_rows if row.process_id == process_pk]
+    processes = FastManufacturingProcessSerializer(request, expand={'operations': None})
+    process_rows = list(processes.rows(ManufacturingProcess.objects.order_by('pk')[:options['rows']]))
+    process_operation_rows = list(processes.operations(process_rows))
+
+    pages = {
+      f'{len(operation_rows)} operations': (
+        lambda: operations.data(operation_rows),
+        lambda: operations.columns(operation_rows, process_pk),
+      ),
+      f"{len(process_rows)} processes ?expand=operations": (
+        lambda: processes.data(process_rows, process_operation_rows),
+        lambda: processes.columns(process_rows, process_operation_rows),
+      ),
+    }
+    formats = [
+      ('json', JSONRenderer(), False),
+      ('msgpack', MessagePackRenderer(), False),
+      ('columnar', ColumnarJSONRenderer(), True),
+    ]
+
+    table = []
+    for page, (data, columns) in pages.items():
+      baseline = None
+      for label, renderer, columnar in formats:
+        build = columns if columnar else data
+        content = renderer.render({'results': build()})
+        started = time.perf_counter()
+        for _ in range(options['repeat']):
+          renderer.render({'results': build()})
+        render_us = (time.perf_counter() - started) / options['repeat'] * 1e6
+        baseline = baseline or (len(content), render_us)
+        table.append({
+          'page': page, 'format': label, 'bytes': len(content), 'gzip bytes': len(gzip.compress(content)),
+          'size': f'{len(content) / baseline[0]:.2f}x', 'render us': render_us,
+          'speed': f'{baseline[1] / render_us:.1f}x',
+        })
+  print_table(stdout, table)
@@ -0,0 +1,81 @@
+'''
+DRF serializers vs the read-only fast serializers of the list endpoints (app/fast_serializers.py).
+
+Reports rows serialized per second for a page of `--rows` operations and of `--rows` processes
+(with `--operations` hyperlinks each, or embedded with ?expand=operations). "serialize" times only
+turning already-fetched rows into data; "fetch + serialize" includes the queries, each side
+reading what it needs (model instances, or values_list() rows).
+'''
+import time
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from app.benchmarks import print_table
+from app.benchmarks import seed
+from app.benchmarks import test_database
+from app.fast_serializers import FastManufacturingProcessSerializer
+from app.fast_serializers import FastOperationSerializer
+from app.models import ManufacturingProcess
+from app.models import Operation
+from app.serializers import ManufacturingProcessSerializer
+from app.serializers import OperationSerializer
+from app.views import process_queryset
+
+def add_arguments(parser):
+  parser.add_argument('--rows', type=int, default=100, help='Rows per page, like ?page_size=')
+  parser.add_argument('--operations', type=int, default=20, help='Operations per process')
+  parser.add_argument('--repeat', type=int, default=50)
+
+def rows_per_second(function, rows, repeat):
+  function()  # warm up
+  started = time.perf_counter()
+  for _ in range(repeat):
+    function()
+  return rows * repeat / (time.perf_counter() - started)
+
+def fetch_process_rows(request, processes, expand):
+  serializer = FastManufacturingProcessSerializer(request, expand=expand)
+  rows = list(serializer.rows(processes))
+  return rows, list(serializer.operations(rows))
+
+def run(options, stdout):
+  with test_database():
+    seed(options['rows'], options['operations'])
+    request = Request(APIRequestFactory().get('/'))
+    context = {'request': request}
+    operations = Operation.objects.order_by('op_number')[:options['rows']]
+    processes = ManufacturingProcess.objects.order_by('pk')[:options['rows']]
+
+    # (label, fetch instances, DRF serializer, fetch rows, fast serializer)
+    cases = [(
+      'operations',
+      lambda: list(operations),
+      lambda instances: OperationSerializer(instances, many=True, context=context).data,
+      lambda: list(FastOperationSerializer(request).rows(operations)),
+      lambda rows: FastOperationSerializer(request).data(rows),
+    )]
+    for label, expand in (('processes', None), ('processes ?expand=operations', {'operations': None})):
+      cases.append((
+        label,
+        lambda expand=expand: list(process_queryset(processes, expand=expand)),
+        lambda instances, expand=expand: (
+          ManufacturingProcessSerializer(instances, many=True, context=context, expand=expand).data
+        ),
+        lambda expand=expand: fetch_process_rows(request, processes, expand),
+        lambda rows, expand=expand: FastManufacturingProcessSerializer(request, expand=expand).data(*rows),
+      ))
+
+    table = []
+    for label, drf_fetch, drf_serialize, fast_fetch, fast_serialize in cases:
+      instances, rows = drf_fetch(), fast_fetch()
+      for mode, drf, fast in (
+        ('serialize', lambda: drf_serialize(instances), lambda: fast_serialize(rows)),
+        ('fetch + serialize', lambda: drf_serialize(drf_fetch()), lambda: fast_serialize(fast_fetch())),
+      ):
+        drf_rate = rows_per_second(drf, options['rows'], options['repeat'])
+        fast_rate = rows_per_second(fast, options['rows'], options['repeat'])
+        table.append({
+          'rows': label, 'mode': mode, 'drf rows/s': drf_rate, 'fast rows/s': fast_rate,
+          'speedup': f'{fast_rate / drf_rate:.1f}x',
+        })
+  print_table(stdout, table)
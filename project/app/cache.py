@@ -0,0 +1,366 @@
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+class TTLCache:
+  '''
+  Small thread-safe in-process cache, bounded in size (least recently used entries are evicted)
+  and in age (entries expire `ttl` seconds after they were stored).
+  Being in-process, it is only invalidated by signals fired in the same worker;
+  `ttl` bounds how long other workers can serve a stale entry.
+  '''
+  def __init__(self, max_size=1024, ttl=300, timer=time.monotonic):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.timer = timer
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, default=None):
+    with self._lock:
+      try:
+        expires, value = self._data[key]
+      except KeyError:
+        return default
+      if expires <= self.timer():
+        del self._data[key]
+        return default
+      self._data.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    with self._lock:
+      self._data[key] = (self.timer() + self.ttl, value)
+      self._data.move_to_end(key)
+      while len(self._data) > self.max_size:
+        self._data.popitem(last=False)
+
+  def delete(self, key):
+    with self._lock:
+      self._data.pop(key, None)
+
+  def delete_where(self, predicate):
+    # Drops every entry whose value matches; O(max_size), meant for rare invalidation events
+    with self._lock:
+      for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+        del self._data[key]
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+
+  def __len__(self):
+    return len(self._data)
+
+
+# Read-through cache of rendered responses
+
+# Entries are keyed by a per-process version token. Any change to a process or its operations
+# replaces the token (see app/signals.py), which orphans every cached response for that process;
+# orphans simply age out. Versions are random rather than counters so that a version key evicted
+# from the cache can never be recreated with an old value and resurrect stale entries.
+# With several workers the cache backend must be shared (e.g. Redis), or bumps stay local.
+
+def get_response_cache():
+  # Cache connections are per thread, so look the backend up on each use
+  return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+class CacheStats:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    # Misses served with the response another request was computing (see coalesce())
+    self.coalesced = 0
+
+  def record(self, hit):
+    with self._lock:
+      if hit:
+        self.hits += 1
+      else:
+        self.misses += 1
+
+  def record_coalesced(self):
+    with self._lock:
+      self.coalesced += 1
+
+  def as_dict(self):
+    with self._lock:
+      return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
+
+  def reset(self):
+    with self._lock:
+      self.hits = self.misses = self.coalesced = 0
+
+# Per worker process
+response_cache_stats = CacheStats()
+
+def process_version_key(pk):
+  return f'process-version:{pk}'
+
+def get_version(key):
+  cache = get_response_cache()
+  version = cache.get(key)
+  if version is None:
+    # add() so that concurrent first readers agree on one version
+    cache.add(key, uuid.uuid4().hex, None)
+    version = cache.get(key)
+  return version
+
+def get_process_version(pk):
+  return get_version(process_version_key(pk))
+
+def bump_process_version(pk):
+  # The list of processes changes with any of them
+  get_response_cache().set_many({process_version_key(pk): uuid.uuid4().hex, LIST_VERSION_KEY: uuid.uuid4().hex}, None)
+
+def invalidate_process(pk):
+  bump_process_version(pk)
+  # A reader running between this bump and the commit could cache pre-commit data under the new
+  # version, so we bump once more after the transaction commits
+  if not transaction.get_autocommit():
+    transaction.on_commit(lambda: bump_process_version(pk))
+
+# The version of the process list as a whole, replaced with every process version: the validator
+# of the list endpoints, which then costs no query
+LIST_VERSION_KEY = 'process-list-version'
+
+def get_list_version():
+  return get_version(LIST_VERSION_KEY)
+
+def response_cache_key(view_name, request, pk, validator=None):
+  # The absolute URI covers scheme, host (hyperlinks are absolute), path and query string.
+  # `validator` is the conditional GET validator read from the database for this request (see
+  # conditional_response()): an entry stored before a change a version bump didn't reach, such as
+  # one made by another worker with a per-process cache, can't be served under the new ETag
+  variant = f'{request.build_absolute_uri()}|{request.accepted_media_type}|{validator}'
+  digest = hashlib.md5(variant.encode('utf-8')).hexdigest()
+  return f'response:{view_name}:{pk}:{get_process_version(pk)}:{digest}'
+
+def get_cached_response(key):
+  cached = get_response_cache().get(key)
+  response_cache_stats.record(hit=cached is not None)
+  if cached is None:
+    return None
+  return entry_response(cached, 'HIT')
+
+def entry_response(entry, x_cache):
+  content, content_type = entry
+  response = HttpResponse(content, content_type=content_type)
+  response['X-Cache'] = x_cache
+  return response
+
+def store_response(key, response):
+  # `response` must already be rendered; returns the entry stored
+  entry = (response.content, response['Content-Type'])
+  get_response_cache().set(key, entry, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 3600))
+  response['X-Cache'] = 'MISS'
+  return entry
+
+def cache_response(view_method):
+  '''
+  Caches the rendered bytes of successful GET responses for views keyed by a process `pk`.
+  Hits skip the database and serialization entirely. Authentication, permissions and content
+  negotiation still run first, since DRF performs them before calling the handler.
+  '''
+  @functools.wraps(view_method)
+  def wrapper(self, request, *args, **kwargs):
+    # The browsable API page embeds the current user and a CSRF token, so it can't be shared
+    if request.accepted_renderer.format == 'api':
+      return view_method(self, request, *args, **kwargs)
+
+    key = response_cache_key(type(self).__name__, request, kwargs['pk'], getattr(request, 'validator', None))
+    response = get_cached_response(key)
+    if response is not None:
+      return response
+
+    def compute():
+      response = view_method(self, request, *args, **kwargs)
+      if not (isinstance(response, Response) and response.status_code == status.HTTP_200_OK):
+        return response, None
+      # Render now, the same way APIView.finalize_response() would, so we can store the bytes
+      response.accepted_renderer = request.accepted_renderer
+      response.accepted_media_type = request.accepted_media_type
+      response.renderer_context = self.get_renderer_context()
+      response.render()
+      return response, store_response(key, response)
+    return coalesce(key, compute)
+  return wrapper
+
+
+# Coalescing of concurrent misses
+
+# When many clients read a process at once (a shift change, a dashboard refresh), its entry is
+# typically missing or just invalidated, and every request would run the same queries and
+# serialization. Instead the first request for a key computes the response, and the requests for
+# that key arriving meanwhile wait for it and send its bytes (X-Cache: COALESCED). Flights are per
+# worker process: its threads (WSGI) and its coroutines (ASGI) share them, other workers don't.
+# Only successful responses are shared: when the first request fails, or takes longer than
+# RESPONSE_COALESCE_TIMEOUT seconds, those waiting on it compute their own.
+
+class Flight:
+  '''A response being computed, and the requests waiting for it.'''
+  def __init__(self):
+    self.landed = threading.Event()
+    # The (content, content_type) entry to share, once landed; None if there is none
+    self.entry = None
+    # (loop, future) per waiting coroutine; None once landed
+    self.waiters = []
+
+class SingleFlight:
+  '''The flights of a worker process, by key; safe to use from any thread and event loop.'''
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._flights = {}
+
+  def join(self, key):
+    # Returns the flight for `key`, and whether the caller started it and must land() it
+    with self._lock:
+      flight = self._flights.get(key)
+      if flight is not None:
+        return flight, False
+      flight = self._flights[key] = Flight()
+      return flight, True
+
+  def land(self, key, flight, entry):
+    with self._lock:
+      del self._flights[key]
+      flight.entry = entry
+      waiters, flight.waiters = flight.waiters, None
+    flight.landed.set()
+    for loop, future in waiters:
+      try:
+        loop.call_soon_threadsafe(resolve, future, entry)
+      except RuntimeError:
+        # The loop has closed
+        pass
+
+  def wait(self, flight, timeout):
+    flight.landed.wait(timeout)
+    return flight.entry
+
+  async def wait_async(self, flight, timeout):
+    loop = asyncio.get_running_loop()
+    with self._lock:
+      if flight.waiters is None:
+        return flight.entry
+      future = loop.create_future()
+      flight.waiters.append((loop, future))
+    try:
+      return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+      return None
+
+  def __len__(self):
+    return len(self._flights)
+
+def resolve(future, entry):
+  # A waiter that timed out or was cancelled is done already
+  if not future.done():
+    future.set_result(entry)
+
+# Per worker process
+response_flights = SingleFlight()
+
+def coalesce_timeout():
+  return getattr(settings, 'RESPONSE_COALESCE_TIMEOUT', 10)
+
+def coalesced_response(entry):
+  response_cache_stats.record_coalesced()
+  return entry_response(entry, 'COALESCED')
+
+def coalesce(key, compute):
+  '''
+  Returns the response of compute(), which returns a (response, entry to share or None) pair, to
+  the first caller for `key`, and a copy of it to the callers arriving while it runs.
+  '''
+  timeout = coalesce_timeout()
+  if not timeout:
+    return compute()[0]
+  flight, leader = response_flights.join(key)
+  if not leader:
+    entry = response_flights.wait(flight, timeout)
+    return coalesced_response(entry) if entry is not None else compute()[0]
+  entry = None
+  try:
+    response, entry = compute()
+    return response
+  finally:
+    response_flights.land(key, flight, entry)
+
+async def coalesce_async(key, compute):
+  '''coalesce() for a coroutine function `compute`; waiting callers don't hold a thread.'''
+  timeout = coalesce_timeout()
+  if not timeout:
+    return (await compute())[0]
+  flight, leader = response_flights.join(key)
+  if not leader:
+    entry = await response_flights.wait_async(flight, timeout)
+    return coalesced_response(entry) if entry is not None else (await compute())[0]
+  entry = None
+  try:
+    response, entry = await compute()
+    return response
+  finally:
+    response_flights.land(key, flight, entry)
+
+
+# Conditional GET
+
+def conditional_response(lookup):
+  '''
+  Answers If-None-Match / If-Modified-Since with 304 Not Modified before the view runs.
+
+  `lookup(**view_kwargs)` runs one cheap query and returns `(last_modified, validator)`, or None
+  when the object doesn't exist (the view then produces its usual 404). `last_modified` may be None
+  for resources where a timestamp alone can't detect every change; only an ETag is sent then.
+  The ETag is derived from the validator, the view and the negotiated media type. The validator is
+  left on the request for @cache_response, which keys its entries by it.
+  '''
+  def decorator(view_method):
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+      state = lookup(**kwargs)
+      request.validator = state[1] if state is not None else None
+      validators = get_validators(type(self).__name__, request, state)
+      if validators is None:
+        return view_method(self, request, *args, **kwargs)
+
+      response = get_conditional_response(request, **validators)
+      if response is None:
+        response = view_method(self, request, *args, **kwargs)
+      set_validators(response, **validators)
+      return response
+    return wrapper
+  return decorator
+
+def get_validators(view_name, request, state):
+  # Turns a lookup result into the `etag` / `last_modified` arguments of get_conditional_response()
+  if state is None:
+    return None
+  last_modified, validator = state
+  variant = f'{view_name}|{validator}|{request.accepted_media_type}'
+  return {
+    'etag': quote_etag(hashlib.md5(variant.encode('utf-8')).hexdigest()),
+    'last_modified': int(last_modified.timestamp()) if last_modified is not None else None,
+  }
+
+def set_validators(response, etag, last_modified):
+  if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+    response['ETag'] = etag
+    if last_modified is not None:
+      response['Last-Modified'] = http_date(last_modified)
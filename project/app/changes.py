@@ -0,0 +1,76 @@
+'''
+Delta sync for clients that mirror processes and operations (GET /changes/?since=<cursor>).
+
+Every save and delete of a process or operation adds a row to the change log (the Change model,
+written by app/signals.py in the same transaction). A client reads the current cursor once, loads
+the full state, then polls with ?since=<cursor>: each response holds the objects changed after the
+cursor, with their current data, or a tombstone if they were deleted, and the cursor to poll with
+next. A poll costs one range scan of the log's primary key plus one query per object type for the
+objects' data, however large the tables are.
+
+Log ids are handed out when rows are inserted, but become visible when their transaction commits,
+which can be out of order: a poll could see change 11, move its cursor past it, and never see
+change 10 committed a moment later. So the feed only serves changes older than CHANGE_FEED_DELAY
+seconds, by when their transactions have long committed, and stops at the first younger one.
+
+The prune_changes command deletes old changes. A cursor from before the oldest change kept can
+have missed some; the feed answers it with 410 Gone, and the client starts over.
+'''
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from app.models import Change
+
+def settled_before():
+  # Changes logged before this have committed, or rolled back
+  return timezone.now() - timedelta(seconds=getattr(settings, 'CHANGE_FEED_DELAY', 2))
+
+def head():
+  '''The cursor of the latest settled change: where a client that just loaded the full state starts.'''
+  return (
+    Change.objects.filter(created_at__lte=settled_before()).order_by('-pk')
+    .values_list('pk', flat=True).first()
+  ) or 0
+
+def expired(since):
+  '''Whether changes after `since` may have been pruned.'''
+  oldest = Change.objects.order_by('pk').values_list('pk', flat=True).first()
+  return oldest is not None and since < oldest - 1
+
+def prune(before):
+  '''
+  Deletes the changes logged before `before`, in one DELETE, except the newest, which expired()
+  needs. Returns how many were deleted.
+  '''
+  newest = Change.objects.order_by('-pk').values_list('pk', flat=True).first()
+  return Change.objects.filter(created_at__lt=before).exclude(pk=newest).delete()[0]
+
+def merge_actions(previous, action):
+  # The one action that sums up two changes to an object: created and then updated is still new
+  # to the reader; a delete overrides anything
+  return Change.CREATED if previous == Change.CREATED and action == Change.UPDATED else action
+
+def changes_since(since, limit):
+  '''
+  Reads up to `limit` settled changes after the cursor `since`. Returns the latest change to each
+  object among them, as (cursor, object_type, pk, action) in cursor order, the cursor to read from
+  next, and whether more changes may be waiting.
+  '''
+  settled = settled_before()
+  rows = list(
+    Change.objects.filter(pk__gt=since).order_by('pk')
+    .values_list('pk', 'object_type', 'object_pk', 'action', 'created_at')[:limit]
+  )
+  latest = {}
+  cursor = since
+  for pk, object_type, object_pk, action, created_at in rows:
+    if created_at > settled:
+      return list(latest.values()), cursor, False
+    # Popped and put back, so each object is ordered by its latest change
+    previous = latest.pop((object_type, object_pk), None)
+    if previous is not None:
+      action = merge_actions(previous[3], action)
+    latest[object_type, object_pk] = (pk, object_type, object_pk, action)
+    cursor = pk
+  return list(latest.values()), cursor, len(rows) == limit
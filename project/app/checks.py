@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Error
+from django.core.checks import Tags
+from django.core.checks import register
+
+# Backends whose entries live in one worker process only
+PER_PROCESS_CACHE_BACKENDS = ['django.core.cache.backends.locmem.LocMemCache']
+
+@register(Tags.caches)
+def check_response_cache_shared(app_configs, **kwargs):
+  # The response cache's version bumps (app/cache.py) only reach the other workers through a shared
+  # backend; with a per-process one, they keep serving what they cached before a write
+  alias = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+  backend = settings.CACHES[alias]['BACKEND']
+  if settings.WORKERS > 1 and backend in PER_PROCESS_CACHE_BACKENDS:
+    return [Error(
+      f'The response cache ({alias!r}) uses {backend}, which is per process, with {settings.WORKERS} workers.',
+      hint='Set CACHE_BACKEND to a shared backend such as django.core.cache.backends.redis.RedisCache.',
+      id='app.E001',
+    )]
+  return []
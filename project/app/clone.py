@@ -0,0 +1,118 @@
+'''
+Copies of processes with all of their operations, for new product variants and template rollouts.
+
+However many processes and operations are copied, clone_processes() reads the sources with two
+queries, checks the new op_numbers with at most one more, and writes everything with batched
+INSERTs (one per `batch_size` operations), one rollup UPDATE and two change log INSERTs, all in one
+transaction.
+
+op_number is unique across processes, so every copied operation needs a new one. A clone can add
+an offset to the source's numbers, renumber them from a start in fixed steps, or by default be
+placed after the highest op_number in use, keeping the source's spacing. Two clones running at the
+same time can pick the same default numbers; the second then fails with an IntegrityError and
+changes nothing.
+'''
+from collections import Counter
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Max
+from app.models import Change
+from app.models import ManufacturingProcess
+from app.models import Operation
+from app.signals import operations_bulk_changed
+from app.signals import record_changes
+
+@dataclass
+class Clone:
+  source: int
+  # Default to the source's
+  name: Optional[str] = None
+  description: Optional[str] = None
+  # new op_number = old + op_number_offset, or op_number_start + i * op_number_step in op_number order
+  op_number_offset: Optional[int] = None
+  op_number_start: Optional[int] = None
+  op_number_step: int = 10
+
+  def op_numbers(self, old, next_free):
+    # {old: new} for the source's op_numbers `old` (ascending)
+    if self.op_number_offset is not None:
+      return {number: number + self.op_number_offset for number in old}
+    if self.op_number_start is not None:
+      return {number: self.op_number_start + i * self.op_number_step for i, number in enumerate(old)}
+    return {number: next_free + number - old[0] for number in old}
+
+def clone_processes(clones, batch_size=500):
+  '''
+  Creates the processes described by `clones` (Clone instances; a source may appear many times).
+  Returns a (new process, {old op_number: new op_number}) pair per clone, in order. Raises
+  ValueError, before writing anything, for missing sources and for op_numbers that are out of
+  range, repeated or in use.
+  '''
+  source_pks = {clone.source for clone in clones}
+  sources = ManufacturingProcess.objects.only('name', 'description').in_bulk(source_pks)
+  missing = source_pks.difference(sources)
+  if missing:
+    raise ValueError(f'No such processes: {sorted(missing)}.')
+  operations = defaultdict(list)
+  for row in (
+    Operation.objects.filter(process_id__in=source_pks).order_by('op_number')
+    .values_list('process_id', 'op_number', 'name', 'description', 'cycle_time')
+  ):
+    operations[row[0]].append(row[1:])
+
+  next_free = None
+  mappings = []
+  for clone in clones:
+    old = [operation[0] for operation in operations[clone.source]]
+    if clone.op_number_offset is None and clone.op_number_start is None and next_free is None:
+      next_free = (Operation.objects.aggregate(Max('op_number'))['op_number__max'] or 0) + 1
+    mapping = clone.op_numbers(old, next_free) if old else {}
+    if mapping and clone.op_number_offset is None and clone.op_number_start is None:
+      next_free = max(mapping.values()) + 1
+    mappings.append(mapping)
+  check_op_numbers(clones, mappings)
+
+  with transaction.atomic():
+    processes = ManufacturingProcess.objects.bulk_create(
+      ManufacturingProcess(
+        name=sources[clone.source].name if clone.name is None else clone.name,
+        description=sources[clone.source].description if clone.description is None else clone.description,
+      )
+      for clone in clones
+    )
+    created = Operation.objects.bulk_create(
+      (
+        Operation(process=process, op_number=mapping[op_number], name=name, description=description, cycle_time=cycle_time)
+        for clone, process, mapping in zip(clones, processes, mappings)
+        for op_number, name, description, cycle_time in operations[clone.source]
+      ),
+      batch_size=batch_size,
+    )
+    record_changes((Change.PROCESS, Change.CREATED, [process.pk for process in processes]))
+    operations_bulk_changed.send(
+      sender=Operation,
+      process_ids=[process.pk for process in processes],
+      created=[operation.pk for operation in created],
+    )
+  return list(zip(processes, mappings))
+
+def check_op_numbers(clones, mappings):
+  numbers = Counter(number for mapping in mappings for number in mapping.values())
+  out_of_range = sorted(number for number in numbers if not 0 <= number <= Operation.MAX_OP_NUMBER)
+  if out_of_range:
+    raise ValueError(f'op numbers must be between 0 and {Operation.MAX_OP_NUMBER}: {out_of_range}.')
+  repeated = sorted(number for number, count in numbers.items() if count > 1)
+  if repeated:
+    raise ValueError(f'op numbers are repeated across clones: {repeated}.')
+  # Numbers placed after the highest one in use are free; the others are checked with one query
+  chosen = [
+    number
+    for clone, mapping in zip(clones, mappings) if clone.op_number_offset is not None or clone.op_number_start is not None
+    for number in mapping.values()
+  ]
+  taken = sorted(Operation.objects.filter(op_number__in=chosen).values_list('op_number', flat=True)) if chosen else []
+  if taken:
+    raise ValueError(f'op numbers already in use: {taken}.')
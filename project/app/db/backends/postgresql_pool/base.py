@@ -0,0 +1,92 @@
+'''
+PostgreSQL backend that keeps connections open in a per-process pool (see app/db/pool.py)
+instead of opening a new one, with its TCP and authentication handshakes, for every request.
+
+    DATABASES = {
+      'default': {
+        'ENGINE': 'app.db.backends.postgresql_pool',
+        ...
+        'POOL': {'MAX_SIZE': 20, 'MAX_AGE': 1800, 'TIMEOUT': 10, 'CHECK_ON_CHECKOUT': True},
+      }
+    }
+
+Keep CONN_MAX_AGE at 0: Django then closes the connection at the end of every request, and
+closing hands it back to the pool. Every thread checks out its own connection (WSGI worker threads,
+and the ASGI_THREADS lanes of app/asgi.py), so MAX_SIZE should be at least the number of threads
+in a process; beyond that, requests wait up to TIMEOUT seconds for a connection to be released.
+'''
+import os
+import threading
+
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+from psycopg2 import extensions
+from psycopg2 import extras
+from app.db.pool import ConnectionPool
+from app.db.pool import PoolTimeout
+from app.db.pool import pools
+
+Database = base.Database
+
+_pools_lock = threading.Lock()
+
+def connect(conn_params, isolation_level=None):
+  # The per-connection part of postgresql.DatabaseWrapper.get_new_connection()
+  connection = Database.connect(**conn_params)
+  if isolation_level is not None and isolation_level != connection.isolation_level:
+    connection.set_session(isolation_level=isolation_level)
+  extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+  return connection
+
+def is_usable(connection):
+  try:
+    with connection.cursor() as cursor:
+      cursor.execute('SELECT 1')
+  except Database.Error:
+    return False
+  return True
+
+class DatabaseWrapper(base.DatabaseWrapper):
+  def get_pool(self):
+    # One pool per alias in each process, shared by the per-thread wrappers. A pool inherited
+    # through fork() holds the parent's sockets, so a child process starts its own.
+    with _pools_lock:
+      pool = pools.get(self.alias)
+      if pool is None or pool.pid != os.getpid():
+        options = self.settings_dict.get('POOL', {})
+        conn_params = self.get_connection_params()
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        pool = ConnectionPool(
+          connect=lambda: connect(conn_params, isolation_level),
+          close=lambda connection: connection.close(),
+          max_size=options.get('MAX_SIZE', 10),
+          max_age=options.get('MAX_AGE'),
+          timeout=options.get('TIMEOUT', 30),
+          check=is_usable if options.get('CHECK_ON_CHECKOUT', True) else None,
+        )
+        pools[self.alias] = pool
+      return pool
+
+  @async_unsafe
+  def get_new_connection(self, conn_params):
+    try:
+      connection = self.get_pool().acquire()
+    except PoolTimeout as exc:
+      raise Database.OperationalError(str(exc)) from exc
+    self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+    return connection
+
+  def _close(self):
+    if self.connection is None:
+      return
+    connection, reusable = self.connection, not connection_broken(self.connection)
+    if reusable and connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+      # Closed mid-transaction (e.g. an exception inside atomic()); don't leak it to the next user
+      try:
+        connection.rollback()
+      except Database.Error:
+        reusable = False
+    self.get_pool().release(connection, discard=not reusable)
+
+def connection_broken(connection):
+  return connection.closed or connection.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
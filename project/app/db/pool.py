@@ -0,0 +1,195 @@
+'''
+A thread-safe pool of open database connections, independent of the database driver.
+
+Connections are handed out most-recently-used first, so a quiet process keeps using a few warm
+connections while the rest sit idle until they reach `max_age` and are closed. When every
+connection is in use, `acquire()` waits up to `timeout` seconds; released connections (and slots
+freed by discarded ones) go to waiting threads first-come first-served, so a thread that releases
+and immediately re-acquires can't starve the others.
+'''
+import os
+import threading
+import time
+from collections import deque
+
+class PoolTimeout(Exception):
+  pass
+
+class PooledConnection:
+  __slots__ = ('connection', 'created_at')
+
+  def __init__(self, connection, created_at):
+    self.connection = connection
+    self.created_at = created_at
+
+class Waiter:
+  __slots__ = ('event', 'entry', 'slot')
+
+  def __init__(self):
+    self.event = threading.Event()
+    # Set by the thread that wakes us: either a connection, or a free slot to open one in
+    self.entry = None
+    self.slot = False
+
+class ConnectionPool:
+  '''
+  `connect()` opens a new connection, `close(connection)` closes one, and `check(connection)`,
+  when given, runs on every checkout and returns False for connections that must be replaced.
+  '''
+  def __init__(self, connect, close, max_size=10, max_age=None, timeout=30, check=None, timer=time.monotonic):
+    self.connect = connect
+    self.close_connection = close
+    self.check = check
+    self.max_size = max_size
+    self.max_age = max_age
+    self.timeout = timeout
+    self.timer = timer
+    self.closed = False
+    # Pools don't survive fork(); see app/db/backends/postgresql_pool
+    self.pid = os.getpid()
+    self._lock = threading.Lock()
+    self._idle = deque()
+    self._in_use = {}
+    self._waiters = deque()
+    # Open connections, including ones being opened
+    self._size = 0
+    self._counters = dict.fromkeys(
+      ('acquired', 'created', 'expired', 'unhealthy', 'discarded', 'timeouts', 'waits'), 0
+    )
+    self._wait_time_total = 0.0
+    self._wait_time_max = 0.0
+
+  def acquire(self):
+    while True:
+      entry = self._checkout()
+      if entry is None:
+        # We hold a reserved slot; open the connection outside the lock
+        try:
+          entry = PooledConnection(self.connect(), self.timer())
+        except BaseException:
+          self._free_slot()
+          raise
+        with self._lock:
+          self._counters['created'] += 1
+        break
+      if self.check is None or self.check(entry.connection):
+        break
+      self._discard(entry, 'unhealthy')
+
+    with self._lock:
+      self._in_use[id(entry.connection)] = entry
+      self._counters['acquired'] += 1
+    return entry.connection
+
+  def release(self, connection, discard=False):
+    with self._lock:
+      entry = self._in_use.pop(id(connection), None)
+    if entry is None:
+      # Not ours, e.g. checked out from the parent process's pool before a fork
+      self._close(PooledConnection(connection, None))
+    elif discard or self.closed:
+      self._discard(entry, 'discarded')
+    elif self._expired(entry):
+      self._discard(entry, 'expired')
+    else:
+      with self._lock:
+        if self._waiters:
+          waiter = self._waiters.popleft()
+          waiter.entry = entry
+          waiter.event.set()
+        else:
+          self._idle.append(entry)
+
+  def close(self):
+    # Closes the idle connections; ones in use are closed when they are released
+    with self._lock:
+      self.closed = True
+      idle, self._idle = list(self._idle), deque()
+      self._size -= len(idle)
+      waiters, self._waiters = list(self._waiters), deque()
+    for waiter in waiters:
+      waiter.event.set()
+    for entry in idle:
+      self._close(entry)
+
+  def stats(self):
+    with self._lock:
+      return {
+        'size': self._size,
+        'max_size': self.max_size,
+        'in_use': len(self._in_use),
+        'idle': len(self._idle),
+        'waiting': len(self._waiters),
+        **self._counters,
+        'wait_time_total': self._wait_time_total,
+        'wait_time_max': self._wait_time_max,
+      }
+
+  def _checkout(self):
+    # Returns an idle connection, or None after reserving a slot for a new one
+    expired = []
+    try:
+      with self._lock:
+        if self.closed:
+          raise PoolTimeout('The connection pool is closed')
+        while self._idle:
+          entry = self._idle.pop()
+          if not self._expired(entry):
+            return entry
+          self._size -= 1
+          self._counters['expired'] += 1
+          expired.append(entry)
+        if self._size < self.max_size:
+          self._size += 1
+          return None
+        waiter = Waiter()
+        self._waiters.append(waiter)
+        self._counters['waits'] += 1
+    finally:
+      for entry in expired:
+        self._close(entry)
+
+    started = self.timer()
+    waiter.event.wait(self.timeout)
+    with self._lock:
+      wait_time = self.timer() - started
+      self._wait_time_total += wait_time
+      self._wait_time_max = max(self._wait_time_max, wait_time)
+      if waiter.entry is not None:
+        return waiter.entry
+      if waiter.slot:
+        return None
+      if self.closed:
+        raise PoolTimeout('The connection pool is closed')
+      self._waiters.remove(waiter)
+      self._counters['timeouts'] += 1
+    raise PoolTimeout(f'No connection became available within {self.timeout} seconds')
+
+  def _expired(self, entry):
+    return self.max_age is not None and self.timer() - entry.created_at >= self.max_age
+
+  def _discard(self, entry, reason):
+    self._close(entry)
+    with self._lock:
+      self._counters[reason] += 1
+    self._free_slot()
+
+  def _free_slot(self):
+    with self._lock:
+      if self._waiters and not self.closed:
+        # The slot goes straight to the next waiter, which opens a new connection in it
+        waiter = self._waiters.popleft()
+        waiter.slot = True
+        waiter.event.set()
+      else:
+        self._size -= 1
+
+  def _close(self, entry):
+    try:
+      self.close_connection(entry.connection)
+    except Exception:
+      # The connection is being thrown away; a failure to close it cleanly changes nothing
+      pass
+
+# Pools by database alias, for the current process (see app/db/backends/postgresql_pool)
+pools = {}
@@ -0,0 +1,110 @@
+'''
+Lazy access to the API documentation stack (drf-yasg, and through it ruamel.yaml and the
+renderers), so that importing the views and URLs doesn't load it. Docs are rarely requested, and
+every worker would otherwise pay for the imports before serving its first request.
+
+- `openapi` stands in for `drf_yasg.openapi`: attribute lookups and calls on it are recorded and
+  only replayed against the real module when a schema is generated.
+- `swagger_auto_schema` takes the same arguments as drf-yasg's decorator and applies it to the
+  view method at the same point (see `apply_deferred_schemas()`).
+- `LazySchemaView` has the `with_ui()` / `without_ui()` of a drf-yasg schema view and builds the
+  real view (app/schema.py) on its first request.
+'''
+import threading
+from importlib import import_module
+
+from django.urls import get_resolver
+
+class Deferred:
+  '''An attribute path in a module that isn't imported yet, e.g. drf_yasg.openapi.TYPE_OBJECT.'''
+  def __init__(self, module, path=()):
+    self._module = module
+    self._path = path
+
+  def __getattr__(self, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    return Deferred(self._module, self._path + (name,))
+
+  def __call__(self, *args, **kwargs):
+    return DeferredCall(self, args, kwargs)
+
+  def resolve(self):
+    value = import_module(self._module)
+    for name in self._path:
+      value = getattr(value, name)
+    return value
+
+class DeferredCall:
+  def __init__(self, function, args, kwargs):
+    self.function = function
+    self.args = args
+    self.kwargs = kwargs
+
+  def resolve(self):
+    return self.function.resolve()(*resolve(self.args), **resolve(self.kwargs))
+
+def resolve(value):
+  if isinstance(value, (Deferred, DeferredCall)):
+    return value.resolve()
+  if isinstance(value, dict):
+    return {key: resolve(item) for key, item in value.items()}
+  if isinstance(value, (list, tuple)):
+    return type(value)(resolve(item) for item in value)
+  return value
+
+openapi = Deferred('drf_yasg.openapi')
+
+_pending = []
+_pending_lock = threading.Lock()
+
+def swagger_auto_schema(**kwargs):
+  def decorator(view_method):
+    with _pending_lock:
+      _pending.append((view_method, kwargs))
+    return view_method
+  return decorator
+
+def apply_deferred_schemas():
+  # drf-yasg's decorator only sets `_swagger_auto_schema` on the method, so applying it late is
+  # equivalent, as long as it happens before the views are introspected. The views register their
+  # schemas when they are imported, so the URLconf must be loaded first.
+  get_resolver().url_patterns
+  with _pending_lock:
+    if not _pending:
+      return
+    from drf_yasg.utils import swagger_auto_schema as apply
+    for view_method, kwargs in _pending:
+      apply(**resolve(kwargs))(view_method)
+    _pending.clear()
+
+class LazySchemaView:
+  def __init__(self, **kwargs):
+    self.kwargs = kwargs
+    self._view_class = None
+    self._lock = threading.Lock()
+
+  def get_view_class(self):
+    with self._lock:
+      if self._view_class is None:
+        from app.schema import get_cached_schema_view
+        self._view_class = get_cached_schema_view(**self.kwargs)
+      return self._view_class
+
+  def with_ui(self, *args, **kwargs):
+    return self.lazy_view('with_ui', args, kwargs)
+
+  def without_ui(self, *args, **kwargs):
+    return self.lazy_view('without_ui', args, kwargs)
+
+  def lazy_view(self, method, args, kwargs):
+    views = []
+
+    def view(request, *view_args, **view_kwargs):
+      if not views:
+        views.append(getattr(self.get_view_class(), method)(*args, **kwargs))
+      return views[0](request, *view_args, **view_kwargs)
+
+    # Like APIView.as_view()
+    view.csrf_exempt = True
+    return view
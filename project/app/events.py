@@ -0,0 +1,363 @@
+'''
+Change notifications pushed to clients as Server-Sent Events (GET /events/?processes=1,2,3).
+
+Shop-floor screens keep one stream open instead of polling. The stream carries an event whenever
+one of the listed processes (every process, without ?processes=) or one of its operations is
+created, updated or deleted:
+
+    id: 1207
+    event: change
+    data: {"process": 3, "action": "updated", "cursor": 1207}
+
+`cursor` is the change's position in the change log, so a client can fetch what changed with
+GET /changes/?since=<cursor of the last change it read> (see app/changes.py), including after a
+reconnect (EventSource sends the last id back as Last-Event-ID). A `resync` event means changes
+were dropped (see below), and the client should read the change feed or the full state again.
+A comment line goes out every EVENTS_HEARTBEAT seconds of quiet, so proxies keep idle streams
+open and dead connections are noticed.
+
+The stream is a raw ASGI app, served by app/asgi.py's handler ahead of Django: an open stream is a
+coroutine waiting on the event loop, not a thread, so a worker holds thousands of them. Clients
+authenticate with `Authorization: Token <key>` or, since browsers' EventSource cannot send
+headers, ?token=<key>.
+
+Writes publish their changes to a broker once they commit (app/signals.py). The broker hands them
+to this process's Broadcaster, which fans each one out to the streams subscribed to its process.
+EVENTS_BROKER picks the broker: 'memory' only sees the writes of its own process, which suits
+tests and single-process servers; 'postgresql' sends them through LISTEN/NOTIFY, so every worker
+hears the writes of all of them.
+
+Backpressure: each stream holds at most one pending event per process, the latest, so a client
+that reads slower than changes arrive gets them merged rather than queued without bound. Past
+EVENTS_MAX_PENDING processes waiting, its pending events are dropped for a single `resync`.
+'''
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db import connection
+from django.db import connections
+from django.db import transaction
+from rest_framework.exceptions import AuthenticationFailed
+from app.authentication import CachedTokenAuthentication
+from app.authentication import token_cache
+from app.changes import merge_actions
+from app.models import Change
+
+logger = logging.getLogger(__name__)
+
+# Relative to the ASGI root path
+PATH = '/events/'
+
+class Subscriber:
+  '''An open stream: the processes it follows and the events waiting to be sent to it.'''
+  def __init__(self, processes, max_pending):
+    # A set of pks, or None for every process
+    self.processes = processes
+    self.max_pending = max_pending
+    # process pk -> its latest event, in the order of their latest changes
+    self.pending = {}
+    self.overflowed = False
+    self.closed = False
+    # A bare future rather than an asyncio.Event or a task: waiting is the stream's inner loop
+    self.waiter = None
+
+  def put(self, event):
+    previous = self.pending.pop(event['process'], None)
+    if previous is not None:
+      event = dict(event, action=merge_actions(previous['action'], event['action']))
+    self.pending[event['process']] = event
+    if len(self.pending) > self.max_pending:
+      self.overflow()
+    self.wake()
+
+  def overflow(self):
+    self.pending.clear()
+    self.overflowed = True
+    self.wake()
+
+  def close(self):
+    self.closed = True
+    self.wake()
+
+  def wake(self):
+    if self.waiter is not None and not self.waiter.done():
+      self.waiter.set_result(None)
+
+  async def wait(self, timeout):
+    # Until there is something to send, the stream closes, or `timeout` seconds pass
+    if self.pending or self.overflowed or self.closed:
+      return
+    loop = asyncio.get_running_loop()
+    self.waiter = loop.create_future()
+    timer = loop.call_later(timeout, self.wake)
+    try:
+      await self.waiter
+    finally:
+      timer.cancel()
+      self.waiter = None
+
+  def take(self):
+    events, overflowed = list(self.pending.values()), self.overflowed
+    self.pending = {}
+    self.overflowed = False
+    return events, overflowed
+
+class Broadcaster:
+  '''
+  Fans events out to the subscribers of this process. Subscribers live on the event loop, and
+  deliver() may be called from any thread. One event loop per process, as ASGI servers run.
+  '''
+  def __init__(self):
+    self.loop = None
+    self.subscribers = set()
+    # Subscribers to every process, and to given ones
+    self.everything = set()
+    self.by_process = defaultdict(set)
+
+  def subscribe(self, subscriber):
+    self.loop = asyncio.get_running_loop()
+    self.subscribers.add(subscriber)
+    if subscriber.processes is None:
+      self.everything.add(subscriber)
+    for pk in subscriber.processes or ():
+      self.by_process[pk].add(subscriber)
+
+  def unsubscribe(self, subscriber):
+    self.subscribers.discard(subscriber)
+    self.everything.discard(subscriber)
+    for pk in subscriber.processes or ():
+      self.by_process[pk].discard(subscriber)
+      if not self.by_process[pk]:
+        del self.by_process[pk]
+
+  def deliver(self, events):
+    loop = self.loop
+    if loop is None or not self.subscribers:
+      return
+    try:
+      loop.call_soon_threadsafe(self.fan_out, events)
+    except RuntimeError:
+      # The loop has closed
+      pass
+
+  def fan_out(self, events):
+    for event in events:
+      for subscriber in self.everything:
+        subscriber.put(event)
+      for subscriber in self.by_process.get(event['process'], ()):
+        subscriber.put(event)
+
+  def overflow_all(self):
+    # Events may have been lost: every subscriber resyncs
+    def overflow():
+      for subscriber in self.subscribers:
+        subscriber.overflow()
+    if self.loop is not None and self.subscribers:
+      self.loop.call_soon_threadsafe(overflow)
+
+broadcaster = Broadcaster()
+
+def change_events(changes):
+  # Changes to operations are logged as updates of their processes too, so process rows say it all
+  return [
+    {'process': change.object_pk, 'action': change.action, 'cursor': change.pk}
+    for change in changes if change.object_type == Change.PROCESS
+  ]
+
+class InMemoryBroker:
+  '''Delivers the changes committed by this process to its own streams.'''
+  def publish(self, changes):
+    # Nobody to tell; streams opened meanwhile read what they missed from the change feed
+    if not broadcaster.subscribers:
+      return
+    events = change_events(changes)
+    if events:
+      transaction.on_commit(lambda: broadcaster.deliver(events))
+
+  def start(self):
+    pass
+
+class PostgresBroker:
+  '''
+  Delivers changes through PostgreSQL's LISTEN/NOTIFY, to the streams of every process. NOTIFY is
+  transactional: it is sent on commit and dropped on rollback, at the cost of one more query per
+  write. A daemon thread per process listens on its own connection; if that connection breaks, it
+  reconnects, and every stream resyncs.
+  '''
+  channel = 'app_events'
+  # NOTIFY payloads must stay under 8000 bytes; an event takes about 60
+  batch_size = 100
+
+  def __init__(self):
+    self.thread = None
+    self.lock = threading.Lock()
+
+  def publish(self, changes):
+    events = change_events(changes)
+    with connection.cursor() as cursor:
+      for i in range(0, len(events), self.batch_size):
+        cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, json.dumps(events[i:i + self.batch_size])])
+
+  def start(self):
+    with self.lock:
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.listen, name='events-listener', daemon=True)
+        self.thread.start()
+
+  def listen(self):
+    import psycopg2
+
+    params = connections['default'].get_connection_params()
+    reconnecting = False
+    while True:
+      listener = None
+      try:
+        listener = psycopg2.connect(**params)
+        listener.autocommit = True
+        listener.cursor().execute(f'LISTEN {self.channel}')
+        if reconnecting:
+          broadcaster.overflow_all()
+        while True:
+          if select.select([listener], [], [], 5) != ([], [], []):
+            listener.poll()
+            while listener.notifies:
+              self.receive(listener.notifies.pop(0).payload)
+      except psycopg2.Error:
+        logger.exception('Event listener lost its database connection')
+      except Exception:
+        # Anything else would end the thread, and with it this process's streams
+        logger.exception('Event listener failed')
+      if listener is not None:
+        listener.close()
+      reconnecting = True
+      time.sleep(1)
+
+  def receive(self, payload):
+    # A bad notification is dropped, rather than taking the listener down with it
+    try:
+      events = json.loads(payload)
+      if not isinstance(events, list):
+        raise ValueError('not a list of events')
+      broadcaster.deliver(events)
+    except Exception:
+      logger.exception('Event listener dropped a notification: %.200s', payload)
+
+BROKERS = {'memory': InMemoryBroker, 'postgresql': PostgresBroker}
+broker = None
+
+def get_broker():
+  global broker
+  if broker is None:
+    broker = BROKERS[getattr(settings, 'EVENTS_BROKER', 'memory')]()
+  return broker
+
+def publish(changes):
+  '''Sends the processes' changes among `changes` (Change rows) to the streams once they commit.'''
+  get_broker().publish(changes)
+
+# The stream
+
+def encode(events, overflowed):
+  if overflowed:
+    return b'event: resync\ndata: {}\n\n'
+  return ''.join(
+    f"id: {event['cursor']}\nevent: change\ndata: {json.dumps(event)}\n\n" for event in events
+  ).encode()
+
+async def authenticate(key):
+  # A cached token needs no thread: streams open by the thousand when a shift starts
+  cached = token_cache.get(key)
+  if cached is not None:
+    return cached[0]
+  return await authenticate_credentials(key)
+
+@sync_to_async
+def authenticate_credentials(key):
+  try:
+    user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+    return user
+  except AuthenticationFailed:
+    return None
+  finally:
+    # As at the end of a request, since this one lasts until the client leaves
+    close_old_connections()
+
+def token_key(scope, query):
+  for name, value in scope['headers']:
+    if name == b'authorization':
+      scheme, _, key = value.decode('latin-1').partition(' ')
+      if scheme.lower() == 'token':
+        return key.strip()
+  return query.get('token', [None])[0]
+
+def parse_processes(query):
+  # Raises ValueError for anything but comma-separated integers
+  if 'processes' not in query:
+    return None
+  return {int(pk) for value in query['processes'] for pk in value.split(',') if pk}
+
+async def respond(send, status, detail, headers=()):
+  body = json.dumps({'detail': detail}).encode()
+  await send({
+    'type': 'http.response.start', 'status': status,
+    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers],
+  })
+  await send({'type': 'http.response.body', 'body': body})
+
+async def wait_for_disconnect(receive, subscriber):
+  while (await receive())['type'] != 'http.disconnect':
+    pass
+  subscriber.close()
+
+async def event_stream(scope, receive, send):
+  '''The ASGI app of GET /events/.'''
+  if scope['method'] != 'GET':
+    return await respond(send, 405, f"Method \"{scope['method']}\" not allowed.", [(b'allow', b'GET')])
+  query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+  key = token_key(scope, query)
+  if key is None or await authenticate(key) is None:
+    return await respond(send, 401, 'Invalid or missing token.', [(b'www-authenticate', b'Token')])
+  try:
+    processes = parse_processes(query)
+  except ValueError:
+    return await respond(send, 400, 'processes must be a comma-separated list of process ids.')
+  if len(broadcaster.subscribers) >= settings.EVENTS_MAX_STREAMS:
+    return await respond(send, 503, 'Too many open event streams; retry later.', [(b'retry-after', b'5')])
+
+  get_broker().start()
+  subscriber = Subscriber(processes, settings.EVENTS_MAX_PENDING)
+  broadcaster.subscribe(subscriber)
+  disconnected = asyncio.ensure_future(wait_for_disconnect(receive, subscriber))
+  try:
+    await send({
+      'type': 'http.response.start', 'status': 200,
+      'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        # Tells nginx not to buffer the stream
+        (b'x-accel-buffering', b'no'),
+      ],
+    })
+    # How long EventSource waits before reconnecting, in milliseconds
+    await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+    heartbeat = settings.EVENTS_HEARTBEAT
+    while True:
+      await subscriber.wait(heartbeat)
+      if subscriber.closed:
+        return
+      events, overflowed = subscriber.take()
+      body = encode(events, overflowed) if events or overflowed else b': heartbeat\n\n'
+      # Waits while the client is slow to read; meanwhile its changes merge in `subscriber`
+      await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+  finally:
+    broadcaster.unsubscribe(subscriber)
+    disconnected.cancel()
@@ -0,0 +1,45 @@
+from django.utils.duration import duration_string
+from app.models import ManufacturingProcess
+
+# Columns read for the export; `operations__*` columns are NULL for processes without operations
+EXPORT_COLUMNS = [
+  'pk',
+  'name',
+  'description',
+  'operations__pk',
+  'operations__op_number',
+  'operations__name',
+  'operations__description',
+  'operations__cycle_time',
+]
+
+def iter_processes(chunk_size=2000):
+  '''
+  Yields one dict per process with its operations embedded, in pk / op_number order.
+
+  Processes are LEFT JOINed to their operations and read with .iterator(), which uses a server-side
+  cursor on PostgreSQL and fetches `chunk_size` rows at a time, so memory stays flat no matter how
+  large the table is. Rows arrive grouped by process, so only one process is held at a time.
+  '''
+  rows = (
+    ManufacturingProcess.objects
+    .order_by('pk', 'operations__op_number')
+    .values_list(*EXPORT_COLUMNS)
+    .iterator(chunk_size=chunk_size)
+  )
+  process = None
+  for pk, name, description, op_pk, op_number, op_name, op_description, cycle_time in rows:
+    if process is None or process['pk'] != pk:
+      if process is not None:
+        yield process
+      process = {'pk': pk, 'name': name, 'description': description, 'operations': []}
+    if op_pk is not None:
+      process['operations'].append({
+        'pk': op_pk,
+        'op_number': op_number,
+        'name': op_name,
+        'description': op_description,
+        'cycle_time': duration_string(cycle_time),  # same format as OperationSerializer
+      })
+  if process is not None:
+    yield process
@@ -0,0 +1,165 @@
+'''
+Read-only serializers for the list endpoints that produce exactly the data of
+ManufacturingProcessSerializer and OperationSerializer, at a fraction of the cost.
+
+DRF renders each row by walking its fields: a to_representation() call per field per row, plus a
+reverse() and build_absolute_uri() per hyperlink. Here rows are read with values_list() (named
+tuples that CursorPagination can take its position from), hyperlinks are spliced into URL
+templates reversed once per request (see serializers.url_template()) and durations are formatted
+inline, so a row costs one dict literal.
+
+Usage: paginate `rows(queryset)`, then `data(page)`. Process pages also need their operations;
+pass `operations(page)` (a queryset, evaluated by the caller so it can be awaited) to `data()`.
+`columns()` takes the same arguments and lays the page out by column for ColumnarJSONRenderer:
+one array per field, hyperlinks as a URL template ('{pk}' marks the lookup) and an array of pks,
+and cycle times in seconds.
+'''
+from app.metrics import timed
+from app.models import Operation
+from app.serializers import EmbeddedOperationSerializer
+from app.serializers import ManufacturingProcessSerializer
+from app.serializers import url_template
+
+def encode_duration(value):
+  # django.utils.duration.duration_string(), as used by DRF's DurationField, in one step
+  minutes, seconds = divmod(value.seconds, 60)
+  hours, minutes = divmod(minutes, 60)
+  string = f'{hours:02d}:{minutes:02d}:{seconds:02d}'
+  if value.days:
+    string = f'{value.days} {string}'
+  if value.microseconds:
+    string = f'{string}.{value.microseconds:06d}'
+  return string
+
+def link(template, pk):
+  return template[0] + str(pk) + template[1]
+
+def format_url_template(template):
+  return template[0] + '{pk}' + template[1]
+
+def get_url_template(view_name, request):
+  template = url_template(view_name, 'pk', request)
+  if template is None:
+    raise ValueError(f'{view_name} URLs cannot be templated')
+  return template
+
+class FastOperationSerializer:
+  '''OperationSerializer(many=True) for reads.'''
+  row_fields = ['pk', 'op_number', 'name', 'description', 'cycle_time', 'process_id']
+
+  def __init__(self, request):
+    self.process_url = get_url_template('app:manufacturingprocess-detail', request)
+
+  def rows(self, queryset):
+    return queryset.values_list(*self.row_fields, named=True)
+
+  @timed('serialize')
+  def data(self, rows):
+    process_url = self.process_url
+    return [
+      {
+        'pk': pk,
+        'op_number': op_number,
+        'name': name,
+        'description': description,
+        'cycle_time': encode_duration(cycle_time),
+        'process': link(process_url, process_id),
+      }
+      for pk, op_number, name, description, cycle_time, process_id in rows
+    ]
+
+  @timed('serialize')
+  def columns(self, rows, process_pk):
+    # Every operation of the list belongs to `process_pk`, so its URL is given once
+    pks, op_numbers, names, descriptions, cycle_times, _ = zip(*rows) if rows else ((),) * 6
+    return {
+      'pk': list(pks),
+      'op_number': list(op_numbers),
+      'name': list(names),
+      'description': list(descriptions),
+      'cycle_time': [cycle_time.total_seconds() for cycle_time in cycle_times],
+      'process': link(self.process_url, process_pk),
+    }
+
+class FastManufacturingProcessSerializer:
+  '''ManufacturingProcessSerializer(many=True, fields=..., expand=...) for reads.'''
+  def __init__(self, request, fields=None, expand=None):
+    self.fields = [name for name in ManufacturingProcessSerializer.Meta.fields if fields is None or name in fields]
+    # Operations are rendered as hyperlinks, or embedded with these fields
+    self.operation_fields = None
+    if expand and 'operations' in expand:
+      self.operation_fields = [
+        name for name in EmbeddedOperationSerializer.Meta.fields
+        if expand['operations'] is None or name in expand['operations']
+      ]
+    else:
+      self.operation_url = get_url_template('app:operation-list', request)
+
+  def rows(self, queryset):
+    columns = [name for name in self.fields if name not in ('pk', 'operations')]
+    return queryset.values_list('pk', *columns, named=True)
+
+  def operations(self, rows):
+    if 'operations' not in self.fields:
+      return Operation.objects.none()
+    columns = self.operation_fields if self.operation_fields is not None else ['pk']
+    return (
+      Operation.objects.filter(process_id__in=[row.pk for row in rows])
+      .order_by('op_number')
+      .values_list('process_id', *columns)
+    )
+
+  @timed('serialize')
+  def data(self, rows, operations=()):
+    by_process = {row.pk: [] for row in rows}
+    if self.operation_fields is None:
+      operation_url = self.operation_url
+      for process_id, pk in operations:
+        by_process[process_id].append(link(operation_url, pk))
+    else:
+      fields = self.operation_fields
+      encode = fields.index('cycle_time') if 'cycle_time' in fields else None
+      # Cycle times repeat a lot across operations, so each distinct one is formatted once
+      durations = {}
+      for process_id, *values in operations:
+        if encode is not None:
+          cycle_time = values[encode]
+          if cycle_time not in durations:
+            durations[cycle_time] = encode_duration(cycle_time)
+          values[encode] = durations[cycle_time]
+        by_process[process_id].append(dict(zip(fields, values)))
+
+    fields = self.fields
+    data = []
+    for row in rows:
+      values = row._asdict()
+      values['operations'] = by_process[row.pk]
+      data.append({name: values[name] for name in fields})
+    return data
+
+  @timed('serialize')
+  def columns(self, rows, operations=()):
+    by_process = {row.pk: [] for row in rows}
+    for process_id, *values in operations:
+      by_process[process_id].append(values)
+
+    columns = {}
+    for name in self.fields:
+      if name != 'operations':
+        columns[name] = [getattr(row, name) for row in rows]
+    if 'operations' in self.fields:
+      if self.operation_fields is None:
+        columns['operations'] = [[pk for pk, in by_process[row.pk]] for row in rows]
+        columns['operations_url'] = format_url_template(self.operation_url)
+      else:
+        columns['operations'] = [self.operation_columns(by_process[row.pk]) for row in rows]
+    return columns
+
+  def operation_columns(self, operations):
+    columns = {}
+    values_by_field = zip(*operations) if operations else [()] * len(self.operation_fields)
+    for name, values in zip(self.operation_fields, values_by_field):
+      if name == 'cycle_time':
+        values = [cycle_time.total_seconds() for cycle_time in values]
+      columns[name] = list(values)
+    return columns
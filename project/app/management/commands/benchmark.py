@@ -0,0 +1,19 @@
+import importlib
+
+from django.core.management.base import BaseCommand
+
+# Benchmark modules under app/benchmarks/
+BENCHMARKS = ['async_reads', 'connection_pool', 'endpoints', 'events', 'renderers', 'serializers']
+
+class Command(BaseCommand):
+  help = 'Runs a performance benchmark (see app/benchmarks/)'
+
+  def add_arguments(self, parser):
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    for name in BENCHMARKS:
+      module = importlib.import_module(f'app.benchmarks.{name}')
+      module.add_arguments(subparsers.add_parser(name, help=module.__doc__.strip().splitlines()[0]))
+
+  def handle(self, *args, **options):
+    module = importlib.import_module(f"app.benchmarks.{options['benchmark']}")
+    module.run(options, self.stdout)
@@ -0,0 +1,42 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from app.schema import read_schema_file
+from app.schema import render_schemas
+from app.schema import write_schema_file
+
+class Command(BaseCommand):
+  help = 'Generates the OpenAPI schema once and writes it to SCHEMA_FILE, where the schema views serve it from'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--output', help="Defaults to SCHEMA_FILE, or to stdout ('-') with --format")
+    parser.add_argument(
+      '--check', action='store_true',
+      help='Write nothing; fail if the file is missing or was generated from different code'
+    )
+    # drf-yasg's generate_swagger isn't available since drf_yasg left INSTALLED_APPS; this replaces it
+    parser.add_argument(
+      '--format', choices=['json', 'yaml'],
+      help="Write only the OpenAPI document in this format, as drf-yasg's generate_swagger did"
+    )
+
+  def handle(self, *args, **options):
+    output = options['output'] or ('-' if options['format'] else settings.SCHEMA_FILE)
+    if options['check']:
+      if read_schema_file(output) is None:
+        raise CommandError(f"{output} is missing or out of date; run generate_schema")
+      self.stdout.write(f"{output} is up to date")
+      return
+
+    schemas = render_schemas(url=settings.SCHEMA_URL)
+    if options['format']:
+      content = schemas[f".{options['format']}"].content
+      if output == '-':
+        self.stdout.write(content.decode('utf-8'))
+      else:
+        Path(output).write_bytes(content)
+      return
+    write_schema_file(output, schemas)
+    self.stdout.write(f"Wrote {output}")
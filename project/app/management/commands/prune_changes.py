@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app.changes import prune
+
+class Command(BaseCommand):
+  help = 'Deletes change feed entries older than CHANGE_LOG_RETENTION_DAYS; run it daily'
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+      '--days', type=int, default=settings.CHANGE_LOG_RETENTION_DAYS,
+      help='Defaults to CHANGE_LOG_RETENTION_DAYS'
+    )
+
+  def handle(self, *args, **options):
+    deleted = prune(timezone.now() - timedelta(days=options['days']))
+    self.stdout.write(f'Deleted {deleted} changes older than {options["days"]} days')
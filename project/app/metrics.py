@@ -0,0 +1,282 @@
+'''
+Per-request performance metrics: where each request's time goes, sent back in a Server-Timing
+header and aggregated into Prometheus histograms per URL name (served at /metrics).
+
+RequestMetricsMiddleware records, for every request:
+- db: the number of queries and the time spent in them (every connection is instrumented when it
+  is opened, see app/signals.py)
+- auth: time in the authentication classes (see app/authentication.py)
+- serialize: time building response data in serializers (DRF's `.data` and the fast serializers)
+- render: time turning that data into bytes
+- total, and the size of the response body
+
+Phases can overlap: queries made while authenticating or serializing also count towards `db`.
+Histograms are kept per process; Prometheus scrapes (and sums) each worker separately.
+
+With SLOW_REQUEST_SECONDS set, requests that take longer are logged to the `app.metrics` logger
+together with the SQL (without parameters, which can hold credentials) of their queries.
+'''
+import asyncio
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger('app.metrics')
+
+# Most statements kept for the slow-request log
+SLOW_REQUEST_MAX_QUERIES = 100
+
+# The metrics of the request being served, in this thread or task
+current = ContextVar('request_metrics', default=None)
+
+class RequestMetrics:
+  PHASES = ('auth', 'serialize', 'render')
+
+  def __init__(self, record_sql=False):
+    self.started = time.perf_counter()
+    self.queries = 0
+    self.db_time = 0.0
+    self.times = dict.fromkeys(self.PHASES, 0.0)
+    self._depth = dict.fromkeys(self.PHASES, 0)
+    # (seconds, sql) of each query, for the slow-request log
+    self.sql = [] if record_sql else None
+
+  def record_query(self, sql, elapsed):
+    self.queries += 1
+    self.db_time += elapsed
+    if self.sql is not None and len(self.sql) < SLOW_REQUEST_MAX_QUERIES:
+      self.sql.append((elapsed, sql))
+
+@contextmanager
+def timing(phase):
+  '''Adds the time spent in the block to `phase` of the current request; nested blocks count once.'''
+  metrics = current.get()
+  if metrics is None or metrics._depth[phase]:
+    yield
+    return
+  metrics._depth[phase] += 1
+  started = time.perf_counter()
+  try:
+    yield
+  finally:
+    metrics.times[phase] += time.perf_counter() - started
+    metrics._depth[phase] -= 1
+
+def timed(phase):
+  def decorator(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      with timing(phase):
+        return function(*args, **kwargs)
+    return wrapper
+  return decorator
+
+def time_query(execute, sql, params, many, context):
+  # A database execute wrapper (see instrument())
+  metrics = current.get()
+  if metrics is None:
+    return execute(sql, params, many, context)
+  started = time.perf_counter()
+  try:
+    return execute(sql, params, many, context)
+  finally:
+    metrics.record_query(sql, time.perf_counter() - started)
+
+def instrument(connection):
+  # Connection objects are per thread and reconnect in place, so this runs on every connect
+  if time_query not in connection.execute_wrappers:
+    connection.execute_wrappers.append(time_query)
+
+
+# Prometheus histograms
+
+class Histogram:
+  def __init__(self, name, documentation, buckets):
+    self.name = name
+    self.documentation = documentation
+    self.buckets = buckets
+    self._lock = threading.Lock()
+    # labels -> [count per bucket..., sum, count]
+    self._series = {}
+
+  def observe(self, labels, value):
+    with self._lock:
+      series = self._series.get(labels)
+      if series is None:
+        series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+      for index, bound in enumerate(self.buckets):
+        if value <= bound:
+          series[index] += 1
+      series[-2] += value
+      series[-1] += 1
+
+  def expose(self):
+    lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+    with self._lock:
+      series = sorted(self._series.items())
+    for labels, values in series:
+      label_text = ','.join(f'{key}="{escape_label(value)}"' for key, value in labels)
+      for bound, count in zip(self.buckets, values):
+        lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+      lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {values[-1]}')
+      lines.append(f'{self.name}_sum{{{label_text}}} {values[-2]}')
+      lines.append(f'{self.name}_count{{{label_text}}} {values[-1]}')
+    return lines
+
+  def clear(self):
+    with self._lock:
+      self._series.clear()
+
+def escape_label(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+histograms = {
+  'total': Histogram('http_request_duration_seconds', 'Time to serve the request.', SECONDS),
+  'db': Histogram('http_request_db_duration_seconds', 'Time spent in database queries.', SECONDS),
+  'queries': Histogram('http_request_db_queries', 'Database queries per request.', (0, 1, 2, 3, 5, 10, 20, 50, 100)),
+  'auth': Histogram('http_request_auth_duration_seconds', 'Time spent authenticating.', SECONDS),
+  'serialize': Histogram('http_request_serialize_duration_seconds', 'Time spent serializing.', SECONDS),
+  'render': Histogram('http_request_render_duration_seconds', 'Time spent rendering.', SECONDS),
+  'size': Histogram(
+    'http_response_size_bytes', 'Size of the response body.', (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+  ),
+}
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+  '''Put first in MIDDLEWARE, so the total covers the other middleware too.'''
+  def __call__(self, request):
+    if asyncio.iscoroutinefunction(self.get_response):
+      return self.__acall__(request)
+    metrics = RequestMetrics(record_sql=bool(getattr(settings, 'SLOW_REQUEST_SECONDS', 0)))
+    token = current.set(metrics)
+    try:
+      response = self.get_response(request)
+    finally:
+      current.reset(token)
+    return self.finish(request, response, metrics)
+
+  async def __acall__(self, request):
+    metrics = RequestMetrics(record_sql=bool(getattr(settings, 'SLOW_REQUEST_SECONDS', 0)))
+    token = current.set(metrics)
+    try:
+      response = await self.get_response(request)
+    finally:
+      current.reset(token)
+    return self.finish(request, response, metrics)
+
+  def process_template_response(self, request, response):
+    # DRF responses are rendered by the handler right after this; time it until the callback
+    metrics = current.get()
+    if metrics is not None:
+      started = time.perf_counter()
+
+      def rendered(response):
+        metrics.times['render'] += time.perf_counter() - started
+
+      response.add_post_render_callback(rendered)
+    return response
+
+  def finish(self, request, response, metrics):
+    total = time.perf_counter() - metrics.started
+    size = None if response.streaming else len(response.content)
+    entries = [
+      f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+      *(f'{phase};dur={metrics.times[phase] * 1000:.1f}' for phase in RequestMetrics.PHASES),
+      f'total;dur={total * 1000:.1f}',
+    ]
+    if size is not None:
+      entries.append(f'size;desc="{size} bytes"')
+    response['Server-Timing'] = ', '.join(entries)
+
+    match = request.resolver_match
+    labels = (('method', request.method), ('view', match.view_name if match else 'unmatched'))
+    histograms['total'].observe(labels, total)
+    histograms['db'].observe(labels, metrics.db_time)
+    histograms['queries'].observe(labels, metrics.queries)
+    for phase in RequestMetrics.PHASES:
+      histograms[phase].observe(labels, metrics.times[phase])
+    if size is not None:
+      histograms['size'].observe(labels, size)
+
+    threshold = getattr(settings, 'SLOW_REQUEST_SECONDS', 0)
+    if threshold and total >= threshold:
+      log_slow_request(request, response, metrics, total)
+    return response
+
+def log_slow_request(request, response, metrics, total):
+  statements = ''.join(f'\n  {elapsed * 1000:8.1f} ms  {sql}' for elapsed, sql in metrics.sql)
+  if metrics.queries > len(metrics.sql):
+    statements += f'\n  ... {metrics.queries - len(metrics.sql)} more'
+  logger.warning(
+    'Slow request: %s %s -> %s in %.1f ms (%d queries, %.1f ms in the database)%s',
+    request.method, request.get_full_path(), response.status_code, total * 1000,
+    metrics.queries, metrics.db_time * 1000, statements,
+  )
+
+
+# /metrics
+
+def gauge(name, documentation, samples):
+  # samples: [(labels, value)]
+  lines = [f'# HELP {name} {documentation}', f'# TYPE {name} gauge']
+  for labels, value in samples:
+    label_text = ','.join(f'{key}="{escape_label(value)}"' for key, value in labels)
+    lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+  return lines
+
+def process_metrics():
+  # Connection pools (app/db/pool.py) and the response cache (app/cache.py) of this process
+  from app.cache import response_cache_stats
+  from app.db.pool import pools
+
+  lines = []
+  stats = {alias: pool.stats() for alias, pool in sorted(pools.items())}
+  for key, documentation in (
+    ('size', 'Open connections.'), ('in_use', 'Connections checked out.'), ('idle', 'Idle connections.'),
+    ('waiting', 'Threads waiting for a connection.'), ('max_size', 'Largest number of connections.'),
+  ):
+    lines += gauge(f'db_pool_{key}', documentation, [((('alias', alias),), values[key]) for alias, values in stats.items()])
+  for key in ('acquired', 'created', 'expired', 'unhealthy', 'discarded', 'timeouts', 'waits', 'wait_time_total'):
+    name = 'db_pool_wait_seconds_total' if key == 'wait_time_total' else f'db_pool_{key}_total'
+    lines += [f'# TYPE {name} counter'] + [
+      f'{name}{{alias="{escape_label(alias)}"}} {values[key]}' for alias, values in stats.items()
+    ]
+  cache = response_cache_stats.as_dict()
+  lines += ['# TYPE response_cache_requests_total counter'] + [
+    f'response_cache_requests_total{{result="{result}"}} {cache[key]}' for result, key in (('hit', 'hits'), ('miss', 'misses'))
+  ]
+  # Of the misses, those served with a response another request was computing
+  lines += ['# TYPE response_coalesced_requests_total counter', f"response_coalesced_requests_total {cache['coalesced']}"]
+  return lines
+
+def metrics_view(request):
+  '''
+  The histograms and process metrics in the Prometheus text format. With METRICS_TOKEN set,
+  scrapers must send it as `Authorization: Bearer <token>`; without it, only INTERNAL_IPS may read
+  them, and the endpoint doesn't exist for anyone else.
+  '''
+  token = getattr(settings, 'METRICS_TOKEN', None)
+  if token:
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+      return HttpResponse(status=401)
+  elif request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+    return HttpResponse(status=404)
+  lines = []
+  for histogram in histograms.values():
+    lines += histogram.expose()
+  lines += process_metrics()
+  response = HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+  patch_cache_control(response, no_store=True)
+  return response
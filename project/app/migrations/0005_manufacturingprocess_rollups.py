@@ -0,0 +1,66 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:20
+
+import datetime
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+# Same UPDATE as ManufacturingProcess.refresh_rollups(), against the historical models
+def backfill_rollups(apps, schema_editor):
+    ManufacturingProcess = apps.get_model('app', 'ManufacturingProcess')
+    Operation = apps.get_model('app', 'Operation')
+    operations = Operation.objects.filter(process=models.OuterRef('pk')).order_by().values('process')
+
+    def aggregate(expression):
+        return models.Subquery(operations.annotate(value=expression).values('value'))
+
+    ManufacturingProcess.objects.update(
+        operation_count=Coalesce(aggregate(models.Count('pk')), 0),
+        total_cycle_time=Coalesce(
+            aggregate(models.Sum('cycle_time')),
+            models.Value(datetime.timedelta(0), output_field=models.DurationField())
+        ),
+        min_cycle_time=aggregate(models.Min('cycle_time')),
+        max_cycle_time=aggregate(models.Max('cycle_time')),
+        bottleneck_op_number=models.Subquery(
+            Operation.objects.filter(process=models.OuterRef('pk'))
+            .order_by('-cycle_time', 'op_number')
+            .values('op_number')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_manufacturingprocess_updated_at_operation_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manufacturingprocess',
+            name='bottleneck_op_number',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='manufacturingprocess',
+            name='max_cycle_time',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='manufacturingprocess',
+            name='min_cycle_time',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='manufacturingprocess',
+            name='operation_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='manufacturingprocess',
+            name='total_cycle_time',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Full-text search indexes for app/search.py. PostgreSQL only: other databases fall back to
+# substring matching and get nothing here.
+
+from django.db import migrations
+
+# Must stay identical to app.search.Document, or queries won't use the indexes
+DOCUMENT = (
+    "(setweight(to_tsvector('english'::regconfig, COALESCE(name, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, COALESCE(description, '')), 'B'))"
+)
+
+INDEXES = {
+    'app_process_search_idx': 'app_manufacturingprocess',
+    'app_operation_search_idx': 'app_operation',
+}
+
+
+# CONCURRENTLY builds the indexes without locking the tables against writes, which is why this
+# migration is not atomic
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index, table in INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} USING gin ({DOCUMENT})')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index in INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('app', '0005_manufacturingprocess_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -1,10 +1,70 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 # Note: Django automatically creates auto-incrementing primary key field 'pk', but this can be overriden
 # The 'blank' argument is validation-related.  If a field has blank=False, the field will be required.
 class ManufacturingProcess(models.Model):
   name = models.CharField(blank=True, max_length=255)
   description = models.TextField(blank=True)
+  # Also bumped whenever one of the process's operations changes (see app/signals.py)
+  updated_at = models.DateTimeField(auto_now=True)
+
+  # Cycle-time rollups over the process's operations, kept up to date by app/signals.py
+  # so summaries can be read from this table alone (see refresh_rollups())
+  operation_count = models.PositiveIntegerField(default=0)
+  total_cycle_time = models.DurationField(default=timedelta(0))
+  min_cycle_time = models.DurationField(null=True, blank=True)
+  max_cycle_time = models.DurationField(null=True, blank=True)
+  # op_number of the slowest operation; ties go to the lowest op_number
+  bottleneck_op_number = models.PositiveIntegerField(null=True, blank=True)
+
+  ROLLUP_FIELDS = {
+    'operation_count', 'total_cycle_time', 'min_cycle_time', 'max_cycle_time', 'bottleneck_op_number',
+  }
+
+  def save(self, *args, **kwargs):
+    # Rollups are written only by refresh_rollups(); saving an instance loaded earlier must not
+    # overwrite them with values that operation changes have since made stale
+    if not self._state.adding and kwargs.get('update_fields') is None:
+      kwargs['update_fields'] = [
+        field.name for field in self._meta.concrete_fields
+        if not field.primary_key and field.name not in self.ROLLUP_FIELDS
+      ]
+    super().save(*args, **kwargs)
+
+  @property
+  def mean_cycle_time(self):
+    if not self.operation_count:
+      return None
+    return self.total_cycle_time / self.operation_count
+
+  @classmethod
+  def refresh_rollups(cls, process_ids, **extra):
+    '''
+    Recomputes the rollup columns of the given processes with a single UPDATE built from correlated
+    subqueries, so only those processes' operations are read. `extra` is applied in the same UPDATE.
+    '''
+    operations = Operation.objects.filter(process=models.OuterRef('pk')).order_by().values('process')
+    def aggregate(expression):
+      return models.Subquery(operations.annotate(value=expression).values('value'))
+    return cls.objects.filter(pk__in=process_ids).update(
+      operation_count=Coalesce(aggregate(models.Count('pk')), 0),
+      total_cycle_time=Coalesce(
+        aggregate(models.Sum('cycle_time')),
+        models.Value(timedelta(0), output_field=models.DurationField())
+      ),
+      min_cycle_time=aggregate(models.Min('cycle_time')),
+      max_cycle_time=aggregate(models.Max('cycle_time')),
+      bottleneck_op_number=models.Subquery(
+        Operation.objects.filter(process=models.OuterRef('pk'))
+        .order_by('-cycle_time', 'op_number')
+        .values('op_number')[:1]
+      ),
+      **extra
+    )
 
 # In a one-to-many relationship, a parent entity has multiple child entities.
 # Define a ForeignKey field in the child model that references the parent model.
@@ -14,8 +74,83 @@ class Operation(models.Model):
   description = models.TextField()
   op_number = models.PositiveIntegerField(unique=True)
   cycle_time = models.DurationField() 
+  updated_at = models.DateTimeField(auto_now=True)
   process = models.ForeignKey(
     ManufacturingProcess,
     on_delete=models.CASCADE,
     related_name='operations'
-  )
\ No newline at end of file
+  )
+
+  # Largest op_number the column holds on PostgreSQL (integer)
+  MAX_OP_NUMBER = 2147483647
+
+  @classmethod
+  def from_db(cls, db, field_names, values):
+    instance = super().from_db(db, field_names, values)
+    # Remember the parent this row was loaded with, so moving it to another process can notify both
+    instance._loaded_process_id = instance.__dict__.get('process_id')
+    return instance
+
+  @classmethod
+  def renumber(cls, process_id, mapping):
+    '''
+    Gives operations of a process new op_numbers ({old: new}) with two UPDATEs. op_number is unique
+    and checked row by row, so renumbering in place could collide halfway through (10 -> 20 while
+    20 still exists): the rows first move above every number in use or requested, then to their new
+    numbers. Run it in a transaction, once no operation outside `mapping` holds one of the new numbers.
+    Like bulk_create(), it sends no post_save; callers send operations_bulk_changed.
+    '''
+    if not mapping:
+      return
+    in_use = cls.objects.aggregate(models.Max('op_number'))['op_number__max'] or 0
+    offset = max(in_use, *mapping.values()) + 1
+    if offset + max(mapping) > cls.MAX_OP_NUMBER:
+      raise ValueError('op_numbers are too large to renumber in place')
+    shifts = {new - old for old, new in mapping.items()}
+    if len(shifts) == 1:
+      # Every row moves by the same amount: one expression instead of a CASE with a branch per row
+      new_number = models.F('op_number') - offset + shifts.pop()
+    else:
+      new_number = models.Case(*(models.When(op_number=old + offset, then=new) for old, new in mapping.items()))
+    operations = cls.objects.filter(process_id=process_id)
+    operations.filter(op_number__in=list(mapping)).update(op_number=models.F('op_number') + offset)
+    operations.filter(op_number__in=[old + offset for old in mapping]).update(
+      op_number=new_number, updated_at=timezone.now(),
+    )
+
+# The change log behind the change feed (see app/changes.py): one row per save or delete of a
+# process or operation, written by app/signals.py in the same transaction as the change.
+# `id` grows with every row, so it doubles as the feed's cursor.
+class Change(models.Model):
+  PROCESS = 'process'
+  OPERATION = 'operation'
+  TYPES = [(PROCESS, 'Process'), (OPERATION, 'Operation')]
+
+  CREATED = 'created'
+  UPDATED = 'updated'
+  DELETED = 'deleted'
+  ACTIONS = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+  object_type = models.CharField(max_length=16, choices=TYPES)
+  # Not a foreign key: deleted objects keep their rows, as tombstones
+  object_pk = models.BigIntegerField()
+  action = models.CharField(max_length=16, choices=ACTIONS)
+  # Indexed for pruning (see the prune_changes command)
+  created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+  @classmethod
+  def record(cls, *changes):
+    '''
+    Logs (object_type, action, pks) triples with one INSERT and returns the new rows. Bulk writers
+    that bypass the model signals log their rows through operations_bulk_changed, or with
+    app.signals.record_changes().
+    '''
+    now = timezone.now()
+    rows = [
+      cls(object_type=object_type, object_pk=pk, action=action, created_at=now)
+      for object_type, action, pks in changes
+      for pk in pks
+    ]
+    if rows:
+      cls.objects.bulk_create(rows)
+    return rows
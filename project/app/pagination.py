@@ -0,0 +1,40 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.pagination import PageNumberPagination
+
+# Cursor (keyset) pagination filters on the ordering column (`WHERE pk > <position>`) instead of
+# using OFFSET, so every page costs the same index range scan no matter how deep the client goes.
+# The cursor returned in the `next` and `previous` links is an opaque base64 token.
+# Ordering must be on an unchanging, unique field, otherwise rows can be skipped or repeated.
+class KeysetPagination(CursorPagination):
+  ordering = 'pk'
+  # Clients may ask for a different page size with ?page_size=, capped at MAX_PAGE_SIZE
+  page_size_query_param = 'page_size'
+  max_page_size = getattr(settings, 'MAX_PAGE_SIZE', 100)
+
+  # Our keyset columns are all integers; reject tampered positions before they reach the query
+  def decode_cursor(self, request):
+    cursor = super().decode_cursor(request)
+    if cursor is not None and cursor.position is not None and not cursor.position.isdigit():
+      raise NotFound(self.invalid_cursor_message)
+    return cursor
+
+  # For the async views. Django's async ORM runs each query through sync_to_async as well, so
+  # running DRF's own paginate_queryset() there costs the same single hop to a thread.
+  async def apaginate_queryset(self, queryset, request, view=None):
+    return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+
+class ManufacturingProcessPagination(KeysetPagination):
+  ordering = 'pk'
+
+# `op_number` is unique (see migration 0003), so it is a valid keyset column
+class OperationPagination(KeysetPagination):
+  ordering = 'op_number'
+
+# Search results are ordered by rank, which is computed per query, so there is no column to keep a
+# position on. SEARCH_MAX_RESULTS bounds the rows behind the count and the OFFSET instead.
+class SearchPagination(PageNumberPagination):
+  page_size_query_param = 'page_size'
+  max_page_size = getattr(settings, 'MAX_PAGE_SIZE', 100)
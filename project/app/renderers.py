@@ -0,0 +1,92 @@
+import csv
+import json
+
+import msgpack
+from rest_framework.renderers import BaseRenderer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+class Echo:
+  # Minimal file-like object; csv.writer writes a line and we hand it straight back
+  def write(self, value):
+    return value
+
+class NDJSONRenderer(BaseRenderer):
+  '''
+  Newline-delimited JSON: one process (with its operations) per line.
+  `stream()` encodes records one at a time for StreamingHttpResponse; `render()` is only used for
+  regular responses such as errors.
+  '''
+  media_type = 'application/x-ndjson'
+  format = 'ndjson'
+  charset = 'utf-8'
+
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    if data is None:
+      return b''
+    return b''.join(self.stream(data if isinstance(data, list) else [data]))
+
+  def stream(self, records):
+    for record in records:
+      yield (json.dumps(record, cls=encoders.JSONEncoder, ensure_ascii=False) + '\n').encode('utf-8')
+
+class CSVRenderer(BaseRenderer):
+  '''
+  Flat CSV with one row per operation; process columns are repeated on each row.
+  A process without operations is written as one row with empty operation columns.
+  '''
+  media_type = 'text/csv'
+  format = 'csv'
+  charset = 'utf-8'
+  header = [
+    'process_pk', 'process_name', 'process_description',
+    'operation_pk', 'op_number', 'operation_name', 'operation_description', 'cycle_time',
+  ]
+
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    if data is None:
+      return b''
+    # Error responses are a flat dict, e.g. {'detail': ...}
+    if isinstance(data, dict) and 'operations' not in data:
+      writer = csv.writer(Echo())
+      return (writer.writerow(data.keys()) + writer.writerow(data.values())).encode('utf-8')
+    return b''.join(self.stream(data if isinstance(data, list) else [data]))
+
+  def stream(self, records):
+    writer = csv.writer(Echo())
+    # The header goes out before the first row is read from the database
+    yield writer.writerow(self.header).encode('utf-8')
+    for record in records:
+      process = [record['pk'], record['name'], record['description']]
+      operations = record['operations'] or [None]
+      yield ''.join(
+        writer.writerow(process + (
+          [op['pk'], op['op_number'], op['name'], op['description'], op['cycle_time']]
+          if op else [''] * 5
+        ))
+        for op in operations
+      ).encode('utf-8')
+
+class MessagePackRenderer(BaseRenderer):
+  '''
+  The same data as JSON, encoded with MessagePack: smaller, and faster to encode and parse.
+  Values MessagePack has no type for (dates, durations, ...) are encoded as in JSON.
+  '''
+  media_type = 'application/msgpack'
+  format = 'msgpack'
+  charset = None
+  render_style = 'binary'
+
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    if data is None:
+      return b''
+    return msgpack.packb(data, default=encoders.JSONEncoder().default)
+
+class ColumnarJSONRenderer(JSONRenderer):
+  '''
+  JSON for views that lay their results out by column: one array per field, with values that
+  repeat in every row (such as the parent process's URL) given once. The views build the layout
+  (see `columns()` in app/fast_serializers.py); other responses, e.g. errors, render as plain JSON.
+  '''
+  media_type = 'application/vnd.ozymandias.columnar+json'
+  format = 'columnar'
@@ -0,0 +1,170 @@
+'''
+OpenAPI schema views that generate the schema once instead of on every request.
+
+drf-yasg introspects every view and serializer to build the schema. Here each rendered document
+(JSON, YAML or `?format=openapi`) is built once per process, host and API version. It is kept in
+memory and served with an ETag that is a hash of its content, so pollers get a 304.
+
+`./manage.py generate_schema` goes further and writes the documents to SCHEMA_FILE together with a
+fingerprint of the code and library versions they were built from. While the fingerprint still
+matches, processes serve the file and never introspect at all; after a code change or upgrade the
+file is ignored (and `generate_schema --check` fails) until it is regenerated. The file is built
+without a request, so it has no `host` unless SCHEMA_URL is set.
+'''
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from importlib.metadata import version as package_version
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from drf_yasg import openapi
+from drf_yasg.app_settings import swagger_settings
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import SPEC_RENDERERS
+from drf_yasg.views import get_schema_view
+from app.docs import apply_deferred_schemas
+
+API_INFO = openapi.Info(
+  title="ozymandias.API",
+  default_version="v1",
+  description="RESTful API for CRUD of manufacturing processes and related entities",
+  # terms_of_service="",
+  # contact=openapi.Contact(email=""),
+  # license=openapi.License(name=""),
+)
+
+# Everything the schema is generated from: our code, the libraries that introspect it, and settings
+FINGERPRINT_PACKAGES = ['Django', 'djangorestframework', 'drf-yasg']
+
+@lru_cache(maxsize=None)
+def schema_fingerprint():
+  digest = hashlib.sha256()
+  for package in FINGERPRINT_PACKAGES:
+    digest.update(f'{package}=={package_version(package)}\n'.encode())
+  digest.update(f"{API_INFO._default_version}|{getattr(settings, 'SCHEMA_URL', None)}\n".encode())
+  for setting in ('REST_FRAMEWORK', 'SWAGGER_SETTINGS'):
+    digest.update(json.dumps(getattr(settings, setting, {}), sort_keys=True, default=str).encode())
+  app_dir = Path(__file__).resolve().parent
+  for path in sorted(app_dir.rglob('*.py')):
+    if 'migrations' not in path.parts:
+      digest.update(str(path.relative_to(app_dir)).encode())
+      digest.update(path.read_bytes())
+  return digest.hexdigest()
+
+class RenderedSchema:
+  def __init__(self, content, content_type):
+    self.content = content
+    self.content_type = content_type
+    self.etag = quote_etag(hashlib.sha256(content).hexdigest()[:32])
+
+def content_type(renderer, media_type=None):
+  # As DRF's Response would set it
+  media_type = media_type or renderer.media_type
+  return f'{media_type}; charset={renderer.charset}' if renderer.charset else media_type
+
+def render_schemas(url=None):
+  '''Generates the schema without a request and renders it in every spec format, by format.'''
+  apply_deferred_schemas()
+  generator = swagger_settings.DEFAULT_GENERATOR_CLASS(API_INFO, url=url)
+  schema = generator.get_schema(request=None, public=True)
+  return {
+    renderer.format: RenderedSchema(renderer().render(schema), content_type(renderer()))
+    for renderer in SPEC_RENDERERS
+  }
+
+def write_schema_file(path, schemas):
+  document = {
+    'fingerprint': schema_fingerprint(),
+    'formats': {
+      format: {'content': schema.content.decode('utf-8'), 'content_type': schema.content_type}
+      for format, schema in schemas.items()
+    },
+  }
+  Path(path).write_text(json.dumps(document), encoding='utf-8')
+
+def read_schema_file(path):
+  '''Returns the rendered schemas by format, or None when the file is missing or out of date.'''
+  try:
+    document = json.loads(Path(path).read_text(encoding='utf-8'))
+  except (OSError, ValueError):
+    return None
+  if document.get('fingerprint') != schema_fingerprint():
+    return None
+  return {
+    format: RenderedSchema(schema['content'].encode('utf-8'), schema['content_type'])
+    for format, schema in document['formats'].items()
+  }
+
+class SchemaCache:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._schemas = {}
+    self._file_schemas = None
+    self._file_loaded = False
+
+  def get(self, version, host, format, generate):
+    with self._lock:
+      if not self._file_loaded:
+        path = getattr(settings, 'SCHEMA_FILE', None)
+        self._file_schemas = read_schema_file(path) if path else None
+        self._file_loaded = True
+      # The file holds the default version, for every host
+      if self._file_schemas is not None and not version and format in self._file_schemas:
+        return self._file_schemas[format]
+      key = (version, host, format)
+      schema = self._schemas.get(key)
+    if schema is None:
+      # Generated outside the lock; concurrent first requests may both generate, and agree
+      schema = generate()
+      with self._lock:
+        schema = self._schemas.setdefault(key, schema)
+    return schema
+
+  def clear(self):
+    with self._lock:
+      self._schemas.clear()
+      self._file_schemas = None
+      self._file_loaded = False
+
+# Per process
+schema_cache = SchemaCache()
+
+def get_cached_schema_view(**kwargs):
+  '''
+  drf-yasg's get_schema_view(), with the spec formats served from `schema_cache`. Only for public
+  schema views, since the cached documents are shared by every user.
+  '''
+  assert kwargs.get('public'), 'Only a public schema is the same for every user'
+  url = getattr(settings, 'SCHEMA_URL', None)
+  base_view = get_schema_view(API_INFO, url=url, **kwargs)
+
+  class CachedSchemaView(base_view):
+    def get(self, request, version='', format=None):
+      renderer = request.accepted_renderer
+      # The UI pages render without introspecting anything; they fetch the spec separately
+      if not isinstance(renderer, _SpecRenderer):
+        return super().get(request, version, format)
+
+      version = request.version or version or ''
+      # Without SCHEMA_URL, the document names the host it was requested from
+      host = '' if url else f'{request.scheme}://{request.get_host()}'
+
+      def generate():
+        apply_deferred_schemas()
+        response = super(CachedSchemaView, self).get(request, version, format)
+        content = renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+        return RenderedSchema(content, content_type(renderer, request.accepted_media_type))
+
+      schema = schema_cache.get(version, host, renderer.format, generate)
+      response = get_conditional_response(request, etag=schema.etag)
+      if response is None:
+        response = HttpResponse(schema.content, content_type=schema.content_type)
+      response['ETag'] = schema.etag
+      return response
+
+  return CachedSchemaView
@@ -0,0 +1,121 @@
+'''
+Keyword search over the names and descriptions of processes and operations (GET /search/?q=).
+
+Every word of the query must match, as a prefix ("dril" finds "drilling"), so the endpoint can
+back a search-as-you-type box. Processes and operations come back in one list, best match first.
+
+On PostgreSQL words are matched with full-text search. A row's document is the english tsvector of
+its name (weight A) and description (weight B); migration 0006 indexes that expression with GIN, so
+a match is an index lookup however large the tables are, and ts_rank() orders the results. Other
+databases (SQLite in tests) fall back to case-insensitive substring matches, ranked by whether the
+words are in the name or only in the description.
+
+At most SEARCH_MAX_RESULTS matches per table are ranked. A selective query ranks all of its
+matches; one that matches a large part of a table costs the same as a selective one, but ranks an
+arbitrary subset of its matches, and should be narrowed with more words.
+'''
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import Func
+from django.db.models import IntegerField
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models import When
+from app.models import ManufacturingProcess
+from app.models import Operation
+
+# Object types, as given in ?type= and in the results
+TYPES = {'process': ManufacturingProcess, 'operation': Operation}
+
+def query_words(query):
+  # Letters and digits only: anything else would be tsquery syntax
+  return re.findall(r'\w+', query.lower())
+
+class Document(Func):
+  '''
+  The weighted tsvector of a row's name and description. The same expression as the GIN indexes
+  of migration 0006, which PostgreSQL only uses for queries that repeat it exactly.
+  '''
+  template = (
+    "(setweight(to_tsvector('english'::regconfig, COALESCE(%(name)s, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, COALESCE(%(description)s, '')), 'B'))"
+  )
+
+  def __init__(self):
+    from django.contrib.postgres.search import SearchVectorField
+
+    super().__init__(F('name'), F('description'), output_field=SearchVectorField())
+
+  def as_sql(self, compiler, connection, **extra_context):
+    (name, name_params), (description, description_params) = (
+      compiler.compile(expression) for expression in self.source_expressions
+    )
+    return self.template % {'name': name, 'description': description}, [*name_params, *description_params]
+
+class PostgresSearch:
+  def __init__(self, words):
+    from django.contrib.postgres.search import SearchQuery
+
+    self.query = SearchQuery(' & '.join(f'{word}:*' for word in words), config='english', search_type='raw')
+
+  def matches(self, model):
+    return model.objects.annotate(document=Document()).filter(document=self.query)
+
+  def rank(self):
+    from django.contrib.postgres.search import SearchRank
+
+    return SearchRank(Document(), self.query)
+
+class SubstringSearch:
+  def __init__(self, words):
+    self.words = words
+
+  def matches(self, model):
+    queryset = model.objects.all()
+    for word in self.words:
+      queryset = queryset.filter(Q(name__icontains=word) | Q(description__icontains=word))
+    return queryset
+
+  def rank(self):
+    # Like the A and B weights: a word in the name counts twice as much as one in the description
+    return sum(
+      (
+        Case(When(name__icontains=word, then=Value(1.0)), default=Value(0.5), output_field=FloatField())
+        for word in self.words
+      ),
+      Value(0.0, output_field=FloatField()),
+    ) / len(self.words)
+
+def search(query, types=tuple(TYPES)):
+  '''
+  A queryset of dicts (type, pk, process_pk, number, name, description, rank) of the rows of
+  `types` matching `query`, best first. `number` is an operation's op_number; processes have none,
+  and their own pk as process_pk. Empty when the query has no words.
+  '''
+  words = query_words(query)
+  if not words:
+    return ManufacturingProcess.objects.none().values('pk')
+  backend = PostgresSearch(words) if connection.vendor == 'postgresql' else SubstringSearch(words)
+  limit = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+
+  querysets = []
+  for name in types:
+    model = TYPES[name]
+    candidates = backend.matches(model).order_by().values('pk')[:limit]
+    columns = {
+      'type': Value(name),
+      'process_pk': F('pk') if model is ManufacturingProcess else F('process_id'),
+      'number': Value(None, output_field=IntegerField()) if model is ManufacturingProcess else F('op_number'),
+      'rank': backend.rank(),
+    }
+    querysets.append(
+      model.objects.filter(pk__in=candidates).order_by()
+      .annotate(**columns).values('type', 'pk', 'process_pk', 'number', 'name', 'description', 'rank')
+    )
+  results = querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]
+  return results.order_by('-rank', 'type', 'pk')
@@ -1,24 +1,304 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from app.metrics import timing
 from app.models import ManufacturingProcess, Operation
+from app.signals import operations_bulk_changed
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+
+# Lookup value used to reverse a URL once; it is then split out of the result to leave a template
+URL_TEMPLATE_SENTINEL = 8675309024681357
+
+def url_template(view_name, lookup_url_kwarg, request, format=None, reverse=reverse):
+  '''
+  The (prefix, suffix) around an integer lookup value in URLs of `view_name`, found by reversing
+  one URL with a sentinel value; None when the sentinel doesn't appear exactly once.
+  '''
+  url = reverse(view_name, kwargs={lookup_url_kwarg: URL_TEMPLATE_SENTINEL}, request=request, format=format)
+  template = tuple(url.split(str(URL_TEMPLATE_SENTINEL)))
+  return template if len(template) == 2 else None
+
+class TemplatedHyperlinkedRelatedField(serializers.HyperlinkedRelatedField):
+  '''
+  HyperlinkedRelatedField calls reverse() and build_absolute_uri() for every row it renders.
+  For integer lookups we reverse a single URL with a sentinel value per view name and format,
+  then splice each row's lookup value into the resulting prefix and suffix.
+  With many=True the same field instance renders every row, so the template is reused across rows.
+  '''
+  def __init__(self, *args, **kwargs):
+    self._url_templates = {}
+    super().__init__(*args, **kwargs)
+
+  def get_url(self, obj, view_name, request, format):
+    lookup_value = getattr(obj, self.lookup_field)
+    if not isinstance(lookup_value, int):
+      return super().get_url(obj, view_name, request, format)
+
+    key = (view_name, format)
+    if key not in self._url_templates:
+      self._url_templates[key] = url_template(view_name, self.lookup_url_kwarg, request, format, self.reverse)
+    template = self._url_templates[key]
+
+    if template is None:  # sentinel missing or repeated; don't guess
+      return super().get_url(obj, view_name, request, format)
+    return template[0] + str(lookup_value) + template[1]
+
+class TimedDataMixin:
+  # Building `.data` counts towards the `serialize` time of the request metrics (see app/metrics.py)
+  @property
+  def data(self):
+    with timing('serialize'):
+      return super().data
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+  # For many=True; set as Meta.list_serializer_class
+  pass
+
+class SparseFieldsMixin:
+  '''Takes `fields`, the names of the fields to render; the others are dropped. None keeps them all.'''
+  def __init__(self, *args, fields=None, **kwargs):
+    super().__init__(*args, **kwargs)
+    if fields is not None:
+      for name in set(self.fields) - set(fields):
+        self.fields.pop(name)
+
+def model_columns(serializer_class, fields):
+  # The model columns behind the given fields, for QuerySet.only()
+  columns = {field.name for field in serializer_class.Meta.model._meta.concrete_fields}
+  return ['pk'] + [name for name in fields if name in columns]
 
-class ManufacturingProcessSerializer(serializers.HyperlinkedModelSerializer):
-  operations = serializers.HyperlinkedRelatedField(
+class EmbeddedOperationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+  # An operation rendered inside its process (?expand=operations), so the parent is left out
+  class Meta:
+    model = Operation
+    fields = ['pk', 'op_number', 'name', 'description', 'cycle_time']
+
+class ManufacturingProcessSerializer(TimedDataMixin, SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+  '''
+  `expand` maps related fields to embed, instead of linking to, to the fields to render of each
+  embedded object (None for all of them); see `expandable_fields`.
+  '''
+  operations = TemplatedHyperlinkedRelatedField(
     many=True,
     read_only=True,
     view_name='app:operation-list'
   )
+  expandable_fields = {'operations': EmbeddedOperationSerializer}
+
   class Meta:
     model = ManufacturingProcess
     fields = ['pk', 'name', 'description', 'operations']
+    list_serializer_class = TimedListSerializer
+
+  def __init__(self, *args, expand=None, **kwargs):
+    super().__init__(*args, **kwargs)
+    for name, fields in (expand or {}).items():
+      if name in self.fields:
+        self.fields[name] = self.expandable_fields[name](many=True, read_only=True, fields=fields)
+
+class ManufacturingProcessSummarySerializer(TimedDataMixin, serializers.ModelSerializer):
+  # Read straight from the rollup columns on ManufacturingProcess; no operations are read
+  mean_cycle_time = serializers.DurationField(read_only=True)
 
-class OperationSerializer(serializers.HyperlinkedModelSerializer):
+  class Meta:
+    model = ManufacturingProcess
+    fields = [
+      'pk', 'name', 'operation_count', 'total_cycle_time', 'min_cycle_time', 'max_cycle_time',
+      'mean_cycle_time', 'bottleneck_op_number',
+    ]
+    read_only_fields = fields
+    list_serializer_class = TimedListSerializer
+
+class OperationSerializer(TimedDataMixin, serializers.HyperlinkedModelSerializer):
   # We must include a HyperlinkedRelatedField since we are using hyperlinked relations with a namespace
   # Must also include a queryset or set read_only=`True`
-  process = serializers.HyperlinkedRelatedField(
+  process = TemplatedHyperlinkedRelatedField(
     many=False, 
     queryset=ManufacturingProcess.objects.all(),
     view_name='app:manufacturingprocess-detail',
   )
   class Meta:
     model = Operation 
-    fields = ['pk', 'op_number', 'name', 'description', 'cycle_time', 'process']
\ No newline at end of file
+    fields = ['pk', 'op_number', 'name', 'description', 'cycle_time', 'process']
+    list_serializer_class = TimedListSerializer
+
+class OperationBulkListSerializer(TimedListSerializer):
+  '''
+  Validates and creates a batch of operations for a single process in a fixed number of queries.
+  Items are validated field by field without touching the database, then every `op_number`
+  is checked for uniqueness with one query, and all rows go in with bulk_create().
+  Errors are reported per item, in request order, with `{}` for items that are valid.
+  '''
+  # bulk_create() splits very large batches into several INSERT statements of this size
+  batch_size = 500
+
+  def to_internal_value(self, data):
+    if not isinstance(data, list):
+      message = self.error_messages['not_a_list'].format(input_type=type(data).__name__)
+      raise serializers.ValidationError({
+        api_settings.NON_FIELD_ERRORS_KEY: [message]
+      }, code='not_a_list')
+
+    if not self.allow_empty and len(data) == 0:
+      message = self.error_messages['empty']
+      raise serializers.ValidationError({
+        api_settings.NON_FIELD_ERRORS_KEY: [message]
+      }, code='empty')
+
+    if self.max_length is not None and len(data) > self.max_length:
+      message = self.error_messages['max_length'].format(max_length=self.max_length)
+      raise serializers.ValidationError({
+        api_settings.NON_FIELD_ERRORS_KEY: [message]
+      }, code='max_length')
+
+    # Unlike ListSerializer we keep going after a bad item, so set-based checks can run on the rest
+    ret = []
+    errors = []
+    for item in data:
+      try:
+        ret.append(self.child.run_validation(item))
+        errors.append({})
+      except serializers.ValidationError as exc:
+        ret.append(None)
+        errors.append(exc.detail)
+
+    self.validate_unique_op_numbers(ret, errors)
+
+    if any(errors):
+      raise serializers.ValidationError(errors)
+    return ret
+
+  def validate_unique_op_numbers(self, items, errors):
+    # One query covers the whole batch instead of a UniqueValidator query per item
+    op_numbers = [item['op_number'] for item in items if item is not None]
+    taken = set(
+      Operation.objects.filter(op_number__in=op_numbers).values_list('op_number', flat=True)
+    )
+    counts = Counter(op_numbers)
+    for item, error in zip(items, errors):
+      if item is None:
+        continue
+      if item['op_number'] in taken:
+        error['op_number'] = ['operation with this op number already exists.']
+      elif counts[item['op_number']] > 1:
+        error['op_number'] = ['op number is repeated in this batch.']
+
+  def create(self, validated_data):
+    operations = [Operation(**attrs) for attrs in validated_data]
+    with transaction.atomic():
+      operations = Operation.objects.bulk_create(operations, batch_size=self.batch_size)
+      operations_bulk_changed.send(
+        sender=Operation,
+        process_ids={operation.process_id for operation in operations},
+        created=[operation.pk for operation in operations],
+      )
+    return operations
+
+class OperationBulkSerializer(serializers.ModelSerializer):
+  '''
+  Item serializer for OperationBulkListSerializer.
+  The parent process comes from the URL, so it is not part of the payload.
+  '''
+  class Meta:
+    model = Operation
+    fields = ['pk', 'op_number', 'name', 'description', 'cycle_time']
+    list_serializer_class = OperationBulkListSerializer
+    # Uniqueness is checked once for the whole batch by the list serializer
+    extra_kwargs = {'op_number': {'validators': []}}
+
+class ResequenceSerializer(serializers.Serializer):
+  '''
+  New op_numbers for operations of one process, given either as
+  - `order`: op_numbers in their new order, renumbered from `start` in steps of `step`, or
+  - `shift_from` and `by`: every op_number from `shift_from` up moves by `by`, e.g. to open a gap
+  '''
+  order = serializers.ListField(child=serializers.IntegerField(min_value=0), required=False, allow_empty=False)
+  start = serializers.IntegerField(min_value=0, default=10)
+  step = serializers.IntegerField(min_value=1, default=10)
+  shift_from = serializers.IntegerField(min_value=0, required=False)
+  by = serializers.IntegerField(required=False)
+
+  def validate(self, attrs):
+    if ('order' in attrs) == ('shift_from' in attrs):
+      raise serializers.ValidationError('Give either order, or shift_from and by.')
+    if 'order' in attrs and len(set(attrs['order'])) != len(attrs['order']):
+      raise serializers.ValidationError({'order': ['op number is repeated.']})
+    if 'shift_from' in attrs and not attrs.get('by'):
+      raise serializers.ValidationError({'by': ['A non-zero shift is required with shift_from.']})
+    return attrs
+
+  def mapping(self, current):
+    '''
+    {old: new} for the operations that move, given the op_numbers the process has now. Checks the
+    new numbers with one query, so call it with the process's operations locked.
+    '''
+    options = self.validated_data
+    if 'order' in options:
+      unknown = set(options['order']).difference(current)
+      if unknown:
+        raise serializers.ValidationError({'order': [f'Not operations of this process: {sorted(unknown)}.']})
+      mapping = {old: options['start'] + i * options['step'] for i, old in enumerate(options['order'])}
+    else:
+      mapping = {old: old + options['by'] for old in current if old >= options['shift_from']}
+    mapping = {old: new for old, new in mapping.items() if old != new}
+
+    if any(new < 0 or new > Operation.MAX_OP_NUMBER for new in mapping.values()):
+      raise serializers.ValidationError(f'op numbers must be between 0 and {Operation.MAX_OP_NUMBER}.')
+    # Numbers held by operations that don't move: in this process, or (op_number being unique) any other
+    taken = set(mapping.values()).intersection(current).difference(mapping)
+    if mapping:
+      taken.update(
+        Operation.objects.filter(op_number__in=list(mapping.values())).exclude(op_number__in=current)
+        .values_list('op_number', flat=True)
+      )
+    if taken:
+      raise serializers.ValidationError(f'op numbers already in use: {sorted(taken)}.')
+    return mapping
+
+class CloneSerializer(serializers.Serializer):
+  # One copy of a process and its operations (see app/clone.py)
+  source = serializers.IntegerField()
+  name = serializers.CharField(max_length=255, required=False, allow_blank=True)
+  description = serializers.CharField(required=False, allow_blank=True)
+  op_number_offset = serializers.IntegerField(required=False)
+  op_number_start = serializers.IntegerField(min_value=0, required=False)
+  op_number_step = serializers.IntegerField(min_value=1, required=False)
+
+  def validate(self, attrs):
+    if 'op_number_offset' in attrs and ('op_number_start' in attrs or 'op_number_step' in attrs):
+      raise serializers.ValidationError('Give op_number_offset, or op_number_start and op_number_step, not both.')
+    if 'op_number_step' in attrs and 'op_number_start' not in attrs:
+      raise serializers.ValidationError('op_number_step needs op_number_start.')
+    return attrs
+
+class OpNumberKeyedField(serializers.DictField):
+  # JSON object keys are strings; converts them to op_numbers
+  def to_internal_value(self, data):
+    data = super().to_internal_value(data)
+    try:
+      return {int(key): value for key, value in data.items()}
+    except ValueError:
+      raise serializers.ValidationError('Keys must be op_numbers.')
+
+class ScenarioSerializer(serializers.Serializer):
+  name = serializers.CharField(max_length=255)
+  stations = OpNumberKeyedField(child=serializers.IntegerField(min_value=1), required=False, default=dict)
+  cycle_time_deltas = OpNumberKeyedField(child=serializers.FloatField(), required=False, default=dict)
+
+class ThroughputAnalysisSerializer(serializers.Serializer):
+  # Defaults to every process
+  processes = serializers.ListField(
+    child=serializers.IntegerField(), required=False, allow_null=True, max_length=settings.BATCH_MAX_SIZE
+  )
+  takt_time = serializers.FloatField(min_value=0, required=False, allow_null=True)  # seconds
+  scenarios = ScenarioSerializer(many=True, required=False, default=list, max_length=settings.ANALYSIS_MAX_SCENARIOS)
+
+  def validate_scenarios(self, scenarios):
+    # Each changed op_number costs a row of the analysis (see evaluate() in app/analysis.py)
+    changes = sum(len(set(scenario['stations']) | set(scenario['cycle_time_deltas'])) for scenario in scenarios)
+    if changes > settings.BATCH_MAX_SIZE:
+      raise serializers.ValidationError(f'At most {settings.BATCH_MAX_SIZE} op_numbers may be changed across scenarios.')
+    return scenarios
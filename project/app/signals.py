@@ -0,0 +1,147 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import Permission
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import Signal
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from app import authentication
+from app import events
+from app import metrics
+from app.cache import invalidate_process
+from app.models import Change
+from app.models import ManufacturingProcess
+from app.models import Operation
+
+# Receivers are connected by AppConfig.ready() when this module is imported
+User = get_user_model()
+
+# bulk_create() and QuerySet.update() bypass post_save/post_delete, so code that writes operations
+# that way must send this instead, with the pks of the operations it created and updated:
+# operations_bulk_changed.send(sender=Operation, process_ids=[...], created=[...], updated=[...])
+operations_bulk_changed = Signal()
+
+# Modification tracking, the change log (see app/changes.py), change events and response cache
+# invalidation
+
+def operations_changed(process_ids):
+  # A change to an operation is a change to its process: recompute the parents' cycle-time rollups
+  # and bump their `updated_at` (used for ETag / Last-Modified) in one UPDATE,
+  # then drop their cached responses
+  process_ids = {pk for pk in process_ids if pk is not None}
+  ManufacturingProcess.refresh_rollups(process_ids, updated_at=timezone.now())
+  for pk in process_ids:
+    invalidate_process(pk)
+
+def record_changes(*changes):
+  # Logs (object_type, action, pks) triples in the change log (see Change.record()), and pushes
+  # them to the event streams once they commit (see app/events.py)
+  events.publish(Change.record(*changes))
+
+def cascaded(origin):
+  # Whether a delete is part of deleting a process (a process instance, or a queryset of them)
+  return isinstance(origin, ManufacturingProcess) or getattr(origin, 'model', None) is ManufacturingProcess
+
+@receiver(post_save, sender=ManufacturingProcess)
+def process_saved(sender, instance, created, **kwargs):
+  record_changes((Change.PROCESS, Change.CREATED if created else Change.UPDATED, [instance.pk]))
+  invalidate_process(instance.pk)
+
+@receiver(post_delete, sender=ManufacturingProcess)
+def process_deleted(sender, instance, origin=None, **kwargs):
+  # The process's operations were deleted first and left their pks on `origin` (operation_deleted())
+  operations = getattr(origin, '_deleted_operations', {}).pop(instance.pk, [])
+  record_changes((Change.PROCESS, Change.DELETED, [instance.pk]), (Change.OPERATION, Change.DELETED, operations))
+  invalidate_process(instance.pk)
+
+@receiver(post_save, sender=Operation)
+def operation_saved(sender, instance, created, **kwargs):
+  # If the operation moved to another process, the old parent changed too
+  process_ids = {instance.process_id, getattr(instance, '_loaded_process_id', None)} - {None}
+  record_changes(
+    (Change.OPERATION, Change.CREATED if created else Change.UPDATED, [instance.pk]),
+    (Change.PROCESS, Change.UPDATED, process_ids),
+  )
+  operations_changed(process_ids)
+
+@receiver(post_delete, sender=Operation)
+def operation_deleted(sender, instance, origin=None, **kwargs):
+  # Deleting a process cascades to its operations, one signal each; the parent is going away, so
+  # there are no rollups to refresh (process_deleted() drops its cached responses). Their
+  # tombstones are kept on the origin and logged with the process's, in one INSERT.
+  if cascaded(origin):
+    if not hasattr(origin, '_deleted_operations'):
+      origin._deleted_operations = defaultdict(list)
+    origin._deleted_operations[instance.process_id].append(instance.pk)
+    return
+  record_changes(
+    (Change.OPERATION, Change.DELETED, [instance.pk]),
+    (Change.PROCESS, Change.UPDATED, [instance.process_id]),
+  )
+  operations_changed({instance.process_id})
+
+@receiver(operations_bulk_changed, sender=Operation)
+def operations_bulk_changed_handler(sender, process_ids, created=(), updated=(), **kwargs):
+  record_changes(
+    (Change.OPERATION, Change.CREATED, created),
+    (Change.OPERATION, Change.UPDATED, updated),
+    (Change.PROCESS, Change.UPDATED, set(process_ids)),
+  )
+  operations_changed(process_ids)
+
+# Authentication cache invalidation
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+  if created:
+    return
+  # AbstractBaseUser keeps the raw password in `_password` until save() has finished,
+  # so it is only set here when set_password() was called. A new password revokes old tokens.
+  if instance._password is not None:
+    Token.objects.filter(user=instance).delete()
+  authentication.invalidate_user(instance.pk)
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+  authentication.invalidate_user(instance.pk)
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+  authentication.invalidate_token(instance.key)
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+  if action not in ('post_add', 'post_remove', 'post_clear'):
+    return
+  if not reverse:
+    authentication.invalidate_user(instance.pk)
+  elif pk_set:
+    # e.g. group.user_set.add(...): `pk_set` holds the affected users
+    for user_pk in pk_set:
+      authentication.invalidate_user(user_pk)
+  else:
+    authentication.invalidate_all()
+
+# Group permission changes can affect any member, so we drop the whole cache
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+  if action in ('post_add', 'post_remove', 'post_clear'):
+    authentication.invalidate_all()
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def permission_deleted(sender, **kwargs):
+  authentication.invalidate_all()
+
+# Request metrics: time the queries of every connection (see app/metrics.py)
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+  metrics.instrument(connection)
@@ -3,22 +3,17 @@ from django.conf.urls import include
 from django.contrib import admin
 from django.urls import path
 from django.urls import re_path
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from rest_framework.authtoken.views import obtain_auth_token
 from . import views
+from .metrics import metrics_view
+from .docs import LazySchemaView
 
 # Set our namespace
 app_name = 'app'
 
-schema_view = get_schema_view(
-  openapi.Info(
-    title="ozymandias.API",
-    default_version="v1",
-    description="RESTful API for CRUD of manufacturing processes and related entities",
-    # terms_of_service="",
-    # contact=openapi.Contact(email=""),
-    # license=openapi.License(name=""),
-  ),
+# Spec documents are generated once and cached (see app/schema.py). drf-yasg is only imported on
+# the first docs request (see app/docs.py).
+schema_view = LazySchemaView(
   public=True,
   permission_classes=[permissions.AllowAny],
 )
@@ -26,11 +21,25 @@ schema_view = get_schema_view(
 # When using class-based views, as_view() attribute generates callable view function
 urlpatterns = [
   path('', views.RootView.as_view(), name='root-view'),
+  # POST username and password once to receive a token; send it as `Authorization: Token <key>`
+  path('auth/token/', obtain_auth_token, name='auth-token'),
   path('processes/', views.ManufacturingProcessList.as_view(), name='manufacturingprocess-list'),
+  path('processes/clone/', views.ManufacturingProcessClone.as_view(), name='manufacturingprocess-clone'),
+  path('processes/batch/', views.ManufacturingProcessBatch.as_view(), name='manufacturingprocess-batch'),
+  path('processes/summary/', views.ManufacturingProcessSummaryList.as_view(), name='manufacturingprocess-summary-list'),
   path('processes/<int:pk>/', views.ManufacturingProcessDetail.as_view(), name='manufacturingprocess-detail'),
+  path('processes/<int:pk>/summary/', views.ManufacturingProcessSummary.as_view(), name='manufacturingprocess-summary'),
   path('processes/<int:pk>/operations/', views.OperationList.as_view(), name='operation-list'),
+  path('processes/<int:pk>/operations/resequence/', views.OperationResequence.as_view(), name='operation-resequence'),
   path('processes/<int:pk>/operations/<int:op_number>/', views.OperationDetail.as_view(), name='operation-detail'),
+  path('operations/batch/', views.OperationBatch.as_view(), name='operation-batch'),
+  path('search/', views.SearchView.as_view(), name='search'),
+  path('changes/', views.ChangeFeed.as_view(), name='change-feed'),
+  path('export/', views.ExportView.as_view(), name='export'),
+  path('analysis/throughput/', views.ThroughputAnalysisView.as_view(), name='throughput-analysis'),
   path('admin/', admin.site.urls),
+  # Prometheus scrape endpoint (see app/metrics.py)
+  path('metrics', metrics_view, name='metrics'),
 
   # re_path allows us to use regex in our path
   re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -1,16 +1,142 @@
+from django.conf import settings
+from django.db import IntegrityError
+from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import render
 from django.http import Http404
+from django.http import StreamingHttpResponse
 from rest_framework import permissions
 from rest_framework import status
 from rest_framework.authentication import BasicAuthentication
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from app.cache import cache_response
+from app.cache import conditional_response
+from app.cache import get_list_version
+from app import changes
+from app.clone import Clone
+from app.clone import clone_processes
+# Deferred stand-ins for drf-yasg's; the docs stack loads when a schema is first generated
+from app.docs import openapi
+from app.docs import swagger_auto_schema
+from app.export import iter_processes
+from app.fast_serializers import FastManufacturingProcessSerializer
+from app.fast_serializers import FastOperationSerializer
+from app.models import Change
 from app.models import ManufacturingProcess
 from app.models import Operation
+from app.pagination import ManufacturingProcessPagination
+from app.pagination import OperationPagination
+from app.pagination import SearchPagination
+from app.renderers import CSVRenderer
+from app.renderers import ColumnarJSONRenderer
+from app.renderers import MessagePackRenderer
+from app.renderers import NDJSONRenderer
+from app import search
+from app.serializers import CloneSerializer
+from app.serializers import EmbeddedOperationSerializer
 from app.serializers import ManufacturingProcessSerializer
+from app.serializers import ManufacturingProcessSummarySerializer
+from app.serializers import OperationBulkSerializer
 from app.serializers import OperationSerializer
+from app.serializers import ResequenceSerializer
+from app.serializers import ThroughputAnalysisSerializer
+from app.serializers import model_columns
+from app.signals import operations_bulk_changed
+
+# ManufacturingProcessSerializer only renders a hyperlink per operation, which needs nothing but the pk.
+# Prefetching the page's operations in one query avoids a query per process (N+1).
+def operations_prefetch():
+  return Prefetch(
+    'operations',
+    queryset=Operation.objects.only('pk', 'process_id').order_by('op_number')
+  )
+
+def process_fieldset(request):
+  '''
+  ManufacturingProcessSerializer arguments for the ?fields= and ?expand= query parameters.
+  ?expand=operations embeds each process's operations instead of linking to them, and
+  ?fields=pk,name renders only the fields listed; fields of embedded objects are named after
+  their parent, as in ?expand=operations&fields=pk,operations.op_number,operations.cycle_time
+  '''
+  params = request.query_params
+  expand = {}
+  for name in filter(None, params.get('expand', '').split(',')):
+    if name not in ManufacturingProcessSerializer.expandable_fields:
+      raise ValidationError({'expand': [f'"{name}" cannot be expanded.']})
+    expand[name] = None
+  if 'fields' not in params:
+    return {'fields': None, 'expand': expand}
+
+  fields = set()
+  for name in filter(None, params['fields'].split(',')):
+    parent, _, nested = name.partition('.')
+    if nested:
+      if parent not in expand:
+        raise ValidationError({'fields': [f'"{name}" requires ?expand={parent}.']})
+      if nested not in ManufacturingProcessSerializer.expandable_fields[parent].Meta.fields:
+        raise ValidationError({'fields': [f'"{name}" is not a field.']})
+      expand[parent] = (expand[parent] or set()) | {nested}
+    elif parent not in ManufacturingProcessSerializer.Meta.fields:
+      raise ValidationError({'fields': [f'"{name}" is not a field.']})
+    fields.add(parent)
+  return {'fields': fields, 'expand': expand}
+
+def process_queryset(queryset, fields=None, expand=None):
+  # Loads only the columns the serializer renders, and prefetches operations only when they are
+  # rendered: their pks for the hyperlinks, or the embedded columns when expanded
+  if fields is not None:
+    queryset = queryset.only(*model_columns(ManufacturingProcessSerializer, fields))
+  if fields is None or 'operations' in fields:
+    if expand and 'operations' in expand:
+      operation_fields = expand['operations'] or EmbeddedOperationSerializer.Meta.fields
+      queryset = queryset.prefetch_related(Prefetch(
+        'operations',
+        queryset=Operation.objects.only(
+          'process_id', *model_columns(EmbeddedOperationSerializer, operation_fields)
+        ).order_by('op_number')
+      ))
+    else:
+      queryset = queryset.prefetch_related(operations_prefetch())
+  return queryset
+
+# Documents process_fieldset() on the process endpoints
+fieldset_parameters = [
+  openapi.Parameter(
+    'fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+    description='Comma-separated fields to render, e.g. pk,name or pk,operations.cycle_time'
+  ),
+  openapi.Parameter(
+    'expand', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['operations'],
+    description='Embed the operations instead of linking to them'
+  ),
+]
+
+# Validators for conditional GET; each runs before any serializer, with at most one query
+
+def process_list_state(**kwargs):
+  # The list's version in the response cache, replaced by every write to a process or its operations
+  # (see app/cache.py): no query, however deep the page. No Last-Modified is sent.
+  return None, get_list_version()
+
+def process_state(pk, **kwargs):
+  # Operation changes also bump their process's `updated_at`
+  last_modified = ManufacturingProcess.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+  return (last_modified, last_modified.isoformat()) if last_modified else None
+
+def operation_state(pk, op_number, **kwargs):
+  last_modified = (
+    Operation.objects.filter(process_id=pk, op_number=op_number)
+    .values_list('updated_at', flat=True).first()
+  )
+  return (last_modified, last_modified.isoformat()) if last_modified else None
+
+# List endpoints also answer in MessagePack (?format=msgpack) and, for dashboards, laid out by
+# column (?format=columnar; see ColumnarJSONRenderer)
+list_renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [MessagePackRenderer, ColumnarJSONRenderer]
 
 class RootView(APIView):
   permission_classes = [permissions.IsAuthenticated]
@@ -21,15 +147,20 @@ class RootView(APIView):
 # Handles requests that don't specify a specific entity or instance
 class ManufacturingProcessList(APIView):
   permission_classes = [permissions.IsAuthenticated]
+  renderer_classes = list_renderer_classes
+  # Plain APIViews don't paginate on their own, so we drive the paginator ourselves
+  pagination_class = ManufacturingProcessPagination
 
+  @swagger_auto_schema(manual_parameters=fieldset_parameters)
+  @conditional_response(process_list_state)
   def get(self, request, format=None):
-    processes = ManufacturingProcess.objects.all()
-    serializer = ManufacturingProcessSerializer(
-      processes,
-      many=True,
-      context={'request': request}
-    )
-    return Response(serializer.data)
+    # Same data as ManufacturingProcessSerializer, from values_list() rows (see app/fast_serializers.py)
+    serializer = FastManufacturingProcessSerializer(request, **process_fieldset(request))
+    paginator = self.pagination_class()
+    page = paginator.paginate_queryset(serializer.rows(ManufacturingProcess.objects.all()), request, view=self)
+    if isinstance(request.accepted_renderer, ColumnarJSONRenderer):
+      return paginator.get_paginated_response(serializer.columns(page, serializer.operations(page)))
+    return paginator.get_paginated_response(serializer.data(page, serializer.operations(page)))
 
   # @swagger_auto_schema decorator provided by drf-yasg defines additional request body parameters
   @swagger_auto_schema(
@@ -55,6 +186,39 @@ class ManufacturingProcessList(APIView):
       return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# Copies processes with all their operations: [{"source": 12, "name": "Variant B"}, ...]
+# A source can be listed many times, to roll a template out. Copied operations get new op_numbers
+# (op_number_offset, or op_number_start and op_number_step; by default after the highest in use).
+# Responds with each new process and its {old: new} op_numbers, in request order. See app/clone.py.
+class ManufacturingProcessClone(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+
+  @swagger_auto_schema(request_body=CloneSerializer(many=True), responses={201: 'Created', 400: 'Bad Request', 409: 'Conflict'})
+  def post(self, request, format=None):
+    serializer = CloneSerializer(data=request.data, many=True, allow_empty=False, max_length=settings.BATCH_MAX_SIZE)
+    if not serializer.is_valid():
+      return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    clones = [Clone(**clone) for clone in serializer.validated_data]
+    try:
+      cloned = clone_processes(clones)
+    except ValueError as exc:
+      return Response({api_settings.NON_FIELD_ERRORS_KEY: [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+    except IntegrityError:
+      # A concurrent write took one of the new op_numbers; nothing was created
+      return Response(
+        {'detail': 'op_number conflict with a concurrent write; nothing was cloned.'},
+        status=status.HTTP_409_CONFLICT
+      )
+    return Response([
+      {
+        'source': clone.source,
+        'pk': process.pk,
+        'url': reverse('app:manufacturingprocess-detail', args=[process.pk], request=request),
+        'op_numbers': mapping,
+      }
+      for clone, (process, mapping) in zip(clones, cloned)
+    ], status=status.HTTP_201_CREATED)
+
 # Handles requests that specify a specific object or instance
 class ManufacturingProcessDetail(APIView):
   permission_classes = [permissions.IsAuthenticated]
@@ -69,11 +233,19 @@ class ManufacturingProcessDetail(APIView):
       # If not PUT, we raise a 404
       raise Http404
 
+  @swagger_auto_schema(manual_parameters=fieldset_parameters)
+  @conditional_response(process_state)
+  @cache_response
   def get(self, request, pk, format=None):
-    manufacturingprocess = self.get_object(pk)
+    fieldset = process_fieldset(request)
+    try:
+      manufacturingprocess = process_queryset(ManufacturingProcess.objects.all(), **fieldset).get(pk=pk)
+    except ManufacturingProcess.DoesNotExist:
+      raise Http404
     serializer = ManufacturingProcessSerializer(
       manufacturingprocess,
       context={'request': request},  # This is required because we use hyper-linked relations
+      **fieldset
     )
     return Response(serializer.data)
 
@@ -122,11 +294,41 @@ class ManufacturingProcessDetail(APIView):
     manufacturingprocess.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
+# Cycle-time summary of every process: operation count, total/min/max/mean cycle time and bottleneck.
+# Served from the rollup columns on ManufacturingProcess, so a page costs one query on that table.
+class ManufacturingProcessSummaryList(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+  pagination_class = ManufacturingProcessPagination
+
+  @conditional_response(process_list_state)
+  def get(self, request, format=None):
+    processes = ManufacturingProcess.objects.all()
+    paginator = self.pagination_class()
+    page = paginator.paginate_queryset(processes, request, view=self)
+    serializer = ManufacturingProcessSummarySerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+# Cycle-time summary of a single process
+class ManufacturingProcessSummary(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+
+  @conditional_response(process_state)
+  @cache_response
+  def get(self, request, pk, format=None):
+    try:
+      manufacturing_process = ManufacturingProcess.objects.get(pk=pk)
+    except ManufacturingProcess.DoesNotExist:
+      raise Http404
+    serializer = ManufacturingProcessSummarySerializer(manufacturing_process)
+    return Response(serializer.data)
+
 # Handles requests that don't specify a specific object or instance
 class OperationList(APIView):
 
   permission_classes = [permissions.IsAuthenticated]
+  renderer_classes = list_renderer_classes
   # authentication_classes = [BasicAuthentication]
+  pagination_class = OperationPagination
 
   # pk is primary key of parent; operation_pk is primary key of child
   def get_parent_object(self, pk):
@@ -135,17 +337,97 @@ class OperationList(APIView):
     except ManufacturingProcess.DoesNotExist:
       raise Http404
 
+  @conditional_response(process_state)
+  @cache_response
   def get(self, request, pk, format=None):
     manufacturing_process = self.get_parent_object(pk)
-    operations = manufacturing_process.operations.all()
-    serializer = OperationSerializer(
+    # Same data as OperationSerializer, from values_list() rows (see app/fast_serializers.py)
+    serializer = FastOperationSerializer(request)
+    paginator = self.pagination_class()
+    page = paginator.paginate_queryset(serializer.rows(manufacturing_process.operations.all()), request, view=self)
+    if isinstance(request.accepted_renderer, ColumnarJSONRenderer):
+      return paginator.get_paginated_response(serializer.columns(page, manufacturing_process.pk))
+    return paginator.get_paginated_response(serializer.data(page))
+
+  # Bulk import: validates the whole array with set-based queries and inserts it in one transaction.
+  # Nothing is saved unless every item is valid; errors come back as a list aligned with the request.
+  @swagger_auto_schema(
+    request_body=openapi.Schema(
+        type=openapi.TYPE_ARRAY,
+        items=openapi.Schema(
+          type=openapi.TYPE_OBJECT,
+          properties={
+              'name': openapi.Schema(type=openapi.TYPE_STRING, max_length=255),
+              'op_number': openapi.Schema(type=openapi.TYPE_INTEGER, format=openapi.FORMAT_INT32),
+              'description': openapi.Schema(type=openapi.TYPE_STRING),
+              'cycle_time': openapi.Schema(type=openapi.TYPE_STRING),
+          },
+          required=['name', 'op_number', 'description', 'cycle_time']  # Specify required fields
+        ),
+    ),
+    responses={201: 'Created', 400: 'Bad Request', 409: 'Conflict'}
+  )
+  def post(self, request, pk, format=None):
+    manufacturing_process = self.get_parent_object(pk)
+    serializer = OperationBulkSerializer(
+      data=request.data,
+      many=True,
+      max_length=settings.BULK_IMPORT_MAX_SIZE,
+    )
+    if not serializer.is_valid():
+      return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+      operations = serializer.save(process=manufacturing_process)
+    except IntegrityError:
+      # A concurrent writer claimed one of our op_numbers after validation; the batch was rolled back
+      return Response(
+        {'detail': 'op_number conflict with a concurrent write; nothing was imported.'},
+        status=status.HTTP_409_CONFLICT
+      )
+    response_serializer = OperationSerializer(
       operations,
       many=True,
       context={'request': request},
     )
-    return Response(serializer.data)
+    return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
 # Handles requests that specify a specific object or instance
+# Renumbers operations of a process in one transaction, e.g. to open a gap for a new step:
+# {"shift_from": 30, "by": 10}, or to put the routing in a new order: {"order": [30, 10, 20]}.
+# Responds with {"mapping": {old: new}} for the operations that moved.
+class OperationResequence(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+
+  @swagger_auto_schema(request_body=ResequenceSerializer, responses={200: 'OK', 400: 'Bad Request', 409: 'Conflict'})
+  def post(self, request, pk, format=None):
+    serializer = ResequenceSerializer(data=request.data)
+    if not serializer.is_valid():
+      return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if not ManufacturingProcess.objects.filter(pk=pk).exists():
+      raise Http404
+    try:
+      with transaction.atomic():
+        # Locked until the end, so concurrent resequences of this process run one after the other
+        current = dict(
+          Operation.objects.select_for_update().filter(process_id=pk).values_list('op_number', 'pk')
+        )
+        mapping = serializer.mapping(list(current))
+        try:
+          Operation.renumber(pk, mapping)
+        except ValueError as exc:
+          raise ValidationError([str(exc)])
+        operations_bulk_changed.send(
+          sender=Operation, process_ids=[pk], updated=[current[number] for number in mapping],
+        )
+    except IntegrityError:
+      # Another process took one of the new op_numbers after they were checked; nothing was changed
+      return Response(
+        {'detail': 'op_number conflict with a concurrent write; nothing was renumbered.'},
+        status=status.HTTP_409_CONFLICT
+      )
+    return Response({'mapping': dict(sorted(mapping.items()))})
+
 class OperationDetail(APIView):
 
   permission_classes = [permissions.IsAuthenticated]
@@ -163,6 +445,8 @@ class OperationDetail(APIView):
     except Operation.DoesNotExist:
       raise Http404
 
+  @conditional_response(operation_state)
+  @cache_response
   def get(self, request, pk, op_number):
     operation = self.get_object(pk, op_number)
     serializer = OperationSerializer(operation,
@@ -213,4 +497,250 @@ class OperationDetail(APIView):
   def delete(self, request, pk, op_number, format=None):
     operation = self.get_object(pk, op_number)
     operation.delete()
-    return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+def batch_keys(request, parameter, parse):
+  '''
+  The distinct keys in the comma-separated `parameter`, in request order, each converted by
+  `parse` (which raises ValueError for a malformed key). At most BATCH_MAX_SIZE are accepted.
+  '''
+  keys = {}
+  for key in filter(None, request.query_params.get(parameter, '').split(',')):
+    try:
+      keys[key] = parse(key)
+    except ValueError:
+      raise ValidationError({parameter: [f'"{key}" is not a valid key.']})
+  if not keys:
+    raise ValidationError({parameter: ['This query parameter is required.']})
+  if len(keys) > settings.BATCH_MAX_SIZE:
+    raise ValidationError({parameter: [f'At most {settings.BATCH_MAX_SIZE} keys are allowed per request.']})
+  return keys
+
+def parse_operation_key(key):
+  pk, op_number = key.split(':')
+  return int(pk), int(op_number)
+
+# Many processes by pk in one request and one query: ?ids=1,2,3 (and ?fields= / ?expand=).
+# `results` maps each requested pk to its process, or to null when there is no such process.
+class ManufacturingProcessBatch(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+
+  @swagger_auto_schema(manual_parameters=[
+    openapi.Parameter('ids', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+      description='Comma-separated process pks'),
+    *fieldset_parameters,
+  ])
+  def get(self, request, format=None):
+    keys = batch_keys(request, 'ids', int)
+    fieldset = process_fieldset(request)
+    processes = list(process_queryset(ManufacturingProcess.objects.all(), **fieldset).filter(pk__in=keys.values()))
+    serializer = ManufacturingProcessSerializer(
+      processes,
+      many=True,
+      context={'request': request},
+      **fieldset
+    )
+    # Keyed by pk even when ?fields= leaves it out of the rendered data
+    found = dict(zip((process.pk for process in processes), serializer.data))
+    return Response({'results': {key: found.get(pk) for key, pk in keys.items()}})
+
+# Many operations by (process pk, op_number) in one request and one query: ?keys=1:10,1:20,2:10
+# `results` maps each requested key to its operation, or to null when there is no such operation.
+class OperationBatch(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+
+  @swagger_auto_schema(manual_parameters=[
+    openapi.Parameter('keys', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+      description='Comma-separated <process pk>:<op_number> pairs'),
+  ])
+  def get(self, request, format=None):
+    keys = batch_keys(request, 'keys', parse_operation_key)
+    # op_number is unique across processes, so its index finds every pair with one IN query;
+    # rows whose process doesn't match the key are the same as missing
+    operations = list(Operation.objects.filter(op_number__in=[op_number for _, op_number in keys.values()]))
+    serializer = OperationSerializer(operations, many=True, context={'request': request})
+    found = {
+      (operation.process_id, operation.op_number): data
+      for operation, data in zip(operations, serializer.data)
+    }
+    return Response({'results': {key: found.get(pair) for key, pair in keys.items()}})
+
+# Ranked keyword search over process and operation names and descriptions: ?q=drill holes
+# Every word must match as a prefix; ?type=process or ?type=operation searches one table only.
+# See app/search.py.
+class SearchView(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+  pagination_class = SearchPagination
+
+  @swagger_auto_schema(manual_parameters=[
+    openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description='Words to find'),
+    openapi.Parameter('type', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(search.TYPES)),
+  ])
+  def get(self, request, format=None):
+    query = request.query_params.get('q', '')
+    if not search.query_words(query):
+      raise ValidationError({'q': ['This query parameter is required.']})
+    types = tuple(search.TYPES)
+    if 'type' in request.query_params:
+      if request.query_params['type'] not in search.TYPES:
+        raise ValidationError({'type': [f'Must be one of: {", ".join(search.TYPES)}.']})
+      types = (request.query_params['type'],)
+
+    paginator = self.pagination_class()
+    page = paginator.paginate_queryset(search.search(query, types), request, view=self)
+    return paginator.get_paginated_response([search_result(row, request) for row in page])
+
+def search_result(row, request):
+  result = {
+    'type': row['type'],
+    'pk': row['pk'],
+    'name': row['name'],
+    'description': row['description'],
+    'rank': row['rank'],
+  }
+  process_url = reverse('app:manufacturingprocess-detail', args=[row['process_pk']], request=request)
+  if row['type'] == 'process':
+    result['url'] = process_url
+  else:
+    result['op_number'] = row['number']
+    result['process'] = process_url
+    result['url'] = reverse('app:operation-detail', args=[row['process_pk'], row['number']], request=request)
+  return result
+
+# Delta sync: GET without ?since= for the current cursor, load the full state, then poll
+# ?since=<cursor> for what changed since: [{"cursor", "type", "pk", "action", "data"}, ...], with
+# "action" one of created, updated or deleted (tombstones have no data), and the next "cursor".
+# "more" is true while a full page came back and polling again at once would return more.
+# See app/changes.py.
+class ChangeFeed(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+
+  @swagger_auto_schema(
+    manual_parameters=[
+      openapi.Parameter('since', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Cursor of the last response'),
+      openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: 'OK', 400: 'Bad Request', 410: 'Gone'}
+  )
+  def get(self, request, format=None):
+    if 'since' not in request.query_params:
+      return Response({'cursor': changes.head(), 'more': False, 'results': []})
+    since = parse_count(request, 'since')
+    page_size = max(1, min(parse_count(request, 'page_size', settings.CHANGE_FEED_PAGE_SIZE), settings.CHANGE_FEED_PAGE_SIZE))
+    if changes.expired(since):
+      return Response(
+        {'detail': 'Changes since this cursor were pruned; load the full state again.', 'cursor': changes.head()},
+        status=status.HTTP_410_GONE
+      )
+    latest, cursor, more = changes.changes_since(since, page_size)
+    return Response({'cursor': cursor, 'more': more, 'results': change_results(latest, request)})
+
+def parse_count(request, parameter, default=None):
+  value = request.query_params.get(parameter)
+  if value is None:
+    return default
+  try:
+    value = int(value)
+  except ValueError:
+    value = -1
+  if value < 0:
+    raise ValidationError({parameter: ['A non-negative integer is required.']})
+  return value
+
+def change_results(latest, request):
+  # The current data of the changed objects, read with one query per type (two for processes, for
+  # their operations' links). Objects gone by now are reported as deleted.
+  live = {Change.PROCESS: [], Change.OPERATION: []}
+  for _, object_type, pk, action in latest:
+    if action != Change.DELETED:
+      live[object_type].append(pk)
+  data = {}
+  if live[Change.PROCESS]:
+    serializer = FastManufacturingProcessSerializer(request)
+    rows = list(serializer.rows(ManufacturingProcess.objects.filter(pk__in=live[Change.PROCESS])))
+    for row in serializer.data(rows, serializer.operations(rows)):
+      data[Change.PROCESS, row['pk']] = row
+  if live[Change.OPERATION]:
+    serializer = FastOperationSerializer(request)
+    for row in serializer.data(serializer.rows(Operation.objects.filter(pk__in=live[Change.OPERATION]))):
+      data[Change.OPERATION, row['pk']] = row
+
+  results = []
+  for cursor, object_type, pk, action in latest:
+    result = {'cursor': cursor, 'type': object_type, 'pk': pk, 'action': action}
+    if action != Change.DELETED:
+      if (object_type, pk) in data:
+        result['data'] = data[object_type, pk]
+      else:
+        result['action'] = Change.DELETED
+    results.append(result)
+  return results
+
+# Streams every process with its operations, for bulk consumers such as the nightly MES sync
+# Select the format with ?format=ndjson (default) or ?format=csv, or with the Accept header
+class ExportView(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+  renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+  def get(self, request, format=None):
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(
+      renderer.stream(iter_processes()),
+      content_type=f'{renderer.media_type}; charset={renderer.charset}'
+    )
+    response['Content-Disposition'] = f'attachment; filename="processes.{renderer.format}"'
+    return response
+
+# Throughput, bottleneck and takt-time analysis for many processes and what-if scenarios at once.
+# The baseline is always evaluated first; each scenario can add parallel stations or change cycle
+# times at given op_numbers. See app/analysis.py.
+class ThroughputAnalysisView(APIView):
+  permission_classes = [permissions.IsAuthenticated]
+
+  @swagger_auto_schema(
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'processes': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)),
+            'takt_time': openapi.Schema(type=openapi.TYPE_NUMBER, description='seconds'),
+            'scenarios': openapi.Schema(
+              type=openapi.TYPE_ARRAY,
+              items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                  'name': openapi.Schema(type=openapi.TYPE_STRING),
+                  'stations': openapi.Schema(type=openapi.TYPE_OBJECT, description='op_number -> parallel stations'),
+                  'cycle_time_deltas': openapi.Schema(type=openapi.TYPE_OBJECT, description='op_number -> seconds'),
+                },
+                required=['name']
+              )
+            ),
+        },
+    ),
+    responses={200: 'OK', 400: 'Bad Request'}
+  )
+  def post(self, request, format=None):
+    # Imported on first use: NumPy is the slowest import in the app and only this view needs it
+    from app import analysis
+
+    serializer = ThroughputAnalysisSerializer(data=request.data)
+    if not serializer.is_valid():
+      return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    options = serializer.validated_data
+
+    process_ids = options.get('processes')
+    if process_ids is not None:
+      missing = set(process_ids).difference(ManufacturingProcess.objects.filter(pk__in=process_ids).values_list('pk', flat=True))
+      if missing:
+        return Response({'processes': [f'No such processes: {sorted(missing)}.']}, status=status.HTTP_400_BAD_REQUEST)
+    matrix = analysis.CycleTimeMatrix.load(process_ids)
+    scenarios = [analysis.Scenario(**scenario) for scenario in options['scenarios']]
+    try:
+      result = analysis.evaluate(matrix, scenarios, takt_time=options.get('takt_time'))
+    except ValueError as exc:
+      return Response({'scenarios': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+      'takt_time': options.get('takt_time'),
+      'scenarios': [scenario.name for scenario in result.scenarios],
+      'results': result.as_list(),
+    })
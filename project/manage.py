@@ -7,6 +7,10 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    if os.environ.get('STARTUP_PROFILE'):
+        # Reports where startup time goes (see project/startup_profile.py), then runs the command
+        from project.startup_profile import profile_startup
+        profile_startup('django:setup')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
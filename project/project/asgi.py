@@ -5,12 +5,27 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
+
+Under ASGI the read endpoints are served by async views (ASYNC_READS, see app/async_views.py),
+and the sync work of all requests shares ASGI_THREADS threads (see app/asgi.py), so slow
+requests wait on the event loop instead of holding a thread each, e.g.:
+
+    uvicorn project.asgi:application --workers 4
+
+The same handler serves the change notification stream at /events/ (see app/events.py); with
+several workers, set EVENTS_BROKER=postgresql so each hears the others' changes.
+
+With STARTUP_PROFILE set, startup is profiled (see project/startup_profile.py).
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+os.environ.setdefault('ASYNC_READS', 'True')
 
-application = get_asgi_application()
+if os.environ.get('STARTUP_PROFILE'):
+    from project.startup_profile import profile_startup
+    application = profile_startup('app.asgi:get_asgi_application')
+else:
+    from app.asgi import get_asgi_application
+    application = get_asgi_application()
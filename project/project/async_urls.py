@@ -0,0 +1,11 @@
+"""project URL Configuration for the ASGI deployment (ASYNC_READS=True)
+
+Same URLs as project/urls.py, with the read endpoints served by async views.
+"""
+
+from django.conf.urls import include
+from django.urls import path
+
+urlpatterns = [
+    path('', include('app.async_urls')),
+]
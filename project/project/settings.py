@@ -10,12 +10,19 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
+from decouple import Csv
 from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# drf-yasg (the API docs) isn't an installed app: installing it imports it, and pkg_resources with
+# it, in every worker at startup. Its templates and static files are found through these instead,
+# and the package itself is imported on the first docs request (see app/docs.py).
+DRF_YASG_DIR = Path(find_spec('drf_yasg').origin).parent
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
@@ -39,11 +46,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'drf_yasg',
+    'rest_framework.authtoken',
     'app'
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover everything below (see app/metrics.py)
+    'app.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,20 +65,73 @@ MIDDLEWARE = [
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
     # or allow read-only access for unauthenticated users.
+    # Token authentication checks the password once, when the token is issued (see `auth/token/`),
+    # and serves the token's user from an in-process cache afterwards.
+    # Basic authentication still works but runs a full PBKDF2 check on every request.
     'DEFAULT_AUTHENTICATION_CLASSES': [
-      'rest_framework.authentication.BasicAuthentication',
+      'app.authentication.CachedTokenAuthentication',
+      'app.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'app.pagination.KeysetPagination',
     'PAGE_SIZE': 10
 }
 
-ROOT_URLCONF = 'project.urls'
+# Upper bound for the ?page_size= query parameter on paginated list endpoints
+MAX_PAGE_SIZE = config('MAX_PAGE_SIZE', default=100, cast=int)
+
+# Bounds for the in-process token -> user cache used by CachedTokenAuthentication
+AUTH_TOKEN_CACHE_SIZE = config('AUTH_TOKEN_CACHE_SIZE', default=1024, cast=int)
+AUTH_TOKEN_CACHE_TTL = config('AUTH_TOKEN_CACHE_TTL', default=300, cast=int)  # seconds
+
+# Largest array accepted by the bulk operation import endpoint
+BULK_IMPORT_MAX_SIZE = config('BULK_IMPORT_MAX_SIZE', default=5000, cast=int)
+
+# Request metrics (see app/metrics.py). Requests slower than SLOW_REQUEST_SECONDS are logged with
+# their SQL (0 turns the log off). /metrics requires METRICS_TOKEN as a bearer token; without one,
+# it only answers requests from INTERNAL_IPS (comma-separated), and is a 404 for everyone else.
+SLOW_REQUEST_SECONDS = config('SLOW_REQUEST_SECONDS', default=0, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default=None)
+INTERNAL_IPS = config('INTERNAL_IPS', default='', cast=Csv())
+
+# Most keys accepted by one request to the batch read endpoints, and most processes and changed
+# op_numbers per throughput analysis
+BATCH_MAX_SIZE = config('BATCH_MAX_SIZE', default=500, cast=int)
+
+# Most what-if scenarios per throughput analysis request; the results grow with scenarios x processes
+ANALYSIS_MAX_SCENARIOS = config('ANALYSIS_MAX_SCENARIOS', default=20, cast=int)
+
+# Most matches per table ranked by one search (see app/search.py)
+SEARCH_MAX_RESULTS = config('SEARCH_MAX_RESULTS', default=1000, cast=int)
+
+# Change feed (see app/changes.py): the most changes per response, how old a change must be before
+# it is served (seconds; longer than any write transaction), and how long prune_changes keeps them
+CHANGE_FEED_PAGE_SIZE = config('CHANGE_FEED_PAGE_SIZE', default=500, cast=int)
+CHANGE_FEED_DELAY = config('CHANGE_FEED_DELAY', default=2, cast=float)
+CHANGE_LOG_RETENTION_DAYS = config('CHANGE_LOG_RETENTION_DAYS', default=30, cast=int)
+
+# Change events over Server-Sent Events (see app/events.py). EVENTS_BROKER is 'memory' (changes made
+# by the same process only) or 'postgresql' (LISTEN/NOTIFY, across processes). Per worker process:
+# the most open streams, and the most processes with undelivered changes before a stream resyncs.
+EVENTS_BROKER = config('EVENTS_BROKER', default='memory')
+EVENTS_HEARTBEAT = config('EVENTS_HEARTBEAT', default=15, cast=float)  # seconds
+EVENTS_MAX_STREAMS = config('EVENTS_MAX_STREAMS', default=10000, cast=int)
+EVENTS_MAX_PENDING = config('EVENTS_MAX_PENDING', default=1000, cast=int)
+
+# Serve the read endpoints with async views (see app/async_views.py). Only useful under ASGI,
+# where project/asgi.py turns it on; under WSGI each async view would run in its own event loop.
+ASYNC_READS = config('ASYNC_READS', default=False, cast=bool)
+
+ROOT_URLCONF = 'project.async_urls' if ASYNC_READS else 'project.urls'
+
+# Threads per ASGI worker process for sync code and database queries (see app/asgi.py); each holds
+# its own database connection
+ASGI_THREADS = config('ASGI_THREADS', default=8, cast=int)
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [DRF_YASG_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -88,14 +150,54 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# With DATABASE_POOL, connections are kept open and reused across requests instead of being opened
+# per request (see app/db/backends/postgresql_pool). Leave CONN_MAX_AGE at 0 with the pool.
+DATABASE_POOL = config('DATABASE_POOL', default=False, cast=bool)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql', 
+        'ENGINE': 'app.db.backends.postgresql_pool' if DATABASE_POOL else 'django.db.backends.postgresql',
         'NAME': 'postgres',
-        'USER': 'postgres'
+        'USER': 'postgres',
+        'POOL': {
+            # Per process; at least the number of threads serving requests (ASGI_THREADS under ASGI)
+            'MAX_SIZE': config('DATABASE_POOL_SIZE', default=20, cast=int),
+            'MAX_AGE': config('DATABASE_POOL_MAX_AGE', default=1800, cast=int),  # seconds
+            'TIMEOUT': config('DATABASE_POOL_TIMEOUT', default=10, cast=int),  # seconds to wait for a connection
+            'CHECK_ON_CHECKOUT': config('DATABASE_POOL_CHECK', default=True, cast=bool),
+        },
     }
 }
 
+# Worker processes serving the project; uvicorn and gunicorn take their default --workers from
+# the same variable
+WORKERS = config('WEB_CONCURRENCY', default=1, cast=int)
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# The response cache keeps its per-process version tokens here as well. With more than one worker,
+# point this at a shared backend (e.g. django.core.cache.backends.redis.RedisCache) so that
+# invalidations made by one worker are seen by all of them; the system check fails otherwise.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ozymandias'),
+    }
+}
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=3600, cast=int)  # seconds
+# Concurrent misses for the same response wait this long for the first one's (see app/cache.py);
+# 0 turns coalescing off
+RESPONSE_COALESCE_TIMEOUT = config('RESPONSE_COALESCE_TIMEOUT', default=10, cast=float)  # seconds
+
+# OpenAPI schema (see app/schema.py). `./manage.py generate_schema` writes SCHEMA_FILE, which is then
+# served as long as the code it was generated from is unchanged. SCHEMA_URL, when set, is the public
+# base URL named in the schema; otherwise each document names the host it was requested from.
+SCHEMA_FILE = config('SCHEMA_FILE', default=str(BASE_DIR / 'openapi-schema.json'))
+SCHEMA_URL = config('SCHEMA_URL', default=None)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -131,6 +233,7 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATICFILES_DIRS = [DRF_YASG_DIR / 'static']
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -0,0 +1,120 @@
+"""
+Startup profiling: how long a worker takes to become ready to serve its first request, and which
+imports that time goes to.
+
+Set STARTUP_PROFILE=1 when starting a worker or running manage.py (e.g.
+`STARTUP_PROFILE=1 ./manage.py check`). Django is then set up and the URLconf loaded (normally
+deferred to the first request) while every import is timed, and a report is written to stderr:
+the time per top-level package and the slowest modules, with their own (self) time and the time
+including the modules they imported (cumulative). STARTUP_PROFILE_LIMIT sets the number of rows.
+"""
+
+import os
+import sys
+import time
+from importlib import import_module
+from importlib.abc import MetaPathFinder
+
+
+class TimedLoader:
+    """Wraps a module's loader to time its creation and execution; everything else is delegated."""
+
+    def __init__(self, loader, profiler, name):
+        self._loader = loader
+        self._profiler = profiler
+        self._name = name
+
+    def __getattr__(self, attribute):
+        return getattr(self._loader, attribute)
+
+    def create_module(self, spec):
+        with self._profiler.timing(self._name):
+            return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self._profiler.timing(self._name):
+            self._loader.exec_module(module)
+
+
+class ImportProfiler(MetaPathFinder):
+    def __init__(self, timer=time.perf_counter):
+        self.timer = timer
+        # module -> [cumulative, self] seconds
+        self.modules = {}
+        self._stack = []
+
+    def find_spec(self, name, path, target=None):
+        # Let the other finders locate the module, then time its loader
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = TimedLoader(spec.loader, self, name)
+        return spec
+
+    def timing(self, name):
+        return _Timing(self, name)
+
+    def report(self, elapsed, stream, limit=25):
+        total = sum(own for _, own in self.modules.values())
+        stream.write(
+            f'Startup: ready in {elapsed * 1000:.1f} ms; '
+            f'{len(self.modules)} modules imported in {total * 1000:.1f} ms\n'
+        )
+        packages = {}
+        for name, (_, own) in self.modules.items():
+            package = name.partition('.')[0]
+            packages[package] = packages.get(package, 0) + own
+        stream.write('\n    self ms  package\n')
+        for package, own in sorted(packages.items(), key=lambda item: -item[1])[:limit]:
+            stream.write(f'  {own * 1000:9.1f}  {package}\n')
+        stream.write('\n  cumulative ms    self ms  module\n')
+        for name, (cumulative, own) in sorted(self.modules.items(), key=lambda item: -item[1][0])[:limit]:
+            stream.write(f'  {cumulative * 1000:13.1f}  {own * 1000:9.1f}  {name}\n')
+
+
+class _Timing:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        # [name, started, time spent in nested imports]
+        self.profiler._stack.append([self.name, self.profiler.timer(), 0.0])
+
+    def __exit__(self, *exc_info):
+        name, started, nested = self.profiler._stack.pop()
+        elapsed = self.profiler.timer() - started
+        record = self.profiler.modules.setdefault(name, [0.0, 0.0])
+        record[0] += elapsed
+        record[1] += elapsed - nested
+        if self.profiler._stack:
+            self.profiler._stack[-1][2] += elapsed
+
+
+def profile_startup(entry_point, stream=None):
+    """
+    Calls `entry_point` ('module:function', e.g. 'django.core.wsgi:get_wsgi_application'), loads
+    the URLconf, reports the imports and returns what the entry point returned.
+    """
+    profiler = ImportProfiler()
+    sys.meta_path.insert(0, profiler)
+    started = profiler.timer()
+    try:
+        module, _, function = entry_point.partition(':')
+        result = getattr(import_module(module), function)()
+        from django.urls import get_resolver
+        get_resolver().url_patterns
+    finally:
+        sys.meta_path.remove(profiler)
+    profiler.report(
+        profiler.timer() - started,
+        stream or sys.stderr,
+        limit=int(os.environ.get('STARTUP_PROFILE_LIMIT', 25)),
+    )
+    return result
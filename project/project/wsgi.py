@@ -5,12 +5,17 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/wsgi/
+
+With STARTUP_PROFILE set, startup is profiled (see project/startup_profile.py).
 """
 
 import os
 
-from django.core.wsgi import get_wsgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
-application = get_wsgi_application()
+if os.environ.get('STARTUP_PROFILE'):
+    from project.startup_profile import profile_startup
+    application = profile_startup('django.core.wsgi:get_wsgi_application')
+else:
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
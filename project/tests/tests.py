@@ -1,9 +1,43 @@
-# import base64
+import asyncio
+import base64
+import csv
+import importlib
+import io
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from unittest.mock import AsyncMock
 
+import msgpack
+import numpy as np
+
+from asgiref.sync import SyncToAsync
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import resolve
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.signals import request_started
+from django.utils.duration import duration_string
 
 from rest_framework.renderers import JSONRenderer
 from rest_framework.parsers import JSONParser
@@ -11,14 +45,64 @@ from rest_framework.request import Request
 from rest_framework.test import APIRequestFactory
 from rest_framework.test import APIClient
 from rest_framework.reverse import reverse
+from rest_framework import permissions
 from rest_framework import status
+from rest_framework.throttling import BaseThrottle
+from rest_framework.authtoken.models import Token
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.views import get_schema_view
 
+from app import async_views
+from app.analysis import CycleTimeMatrix
+from app.analysis import Scenario
+from app.analysis import evaluate
+from app.asgi import ThreadPoolASGIHandler
+from app.authentication import token_cache
+from app.benchmarks import seed
+from app.benchmarks.endpoints import Targets
+from app.benchmarks.endpoints import measure_endpoints
+from app.benchmarks.endpoints import token_client
+from app.benchmarks.endpoints import uncovered_routes
+from app.cache import LIST_VERSION_KEY
+from app.cache import TTLCache
+from app.cache import coalesce
+from app.cache import response_flights
+from app.checks import check_response_cache_shared
+from app.cache import response_cache_stats
+from app.db.pool import ConnectionPool
+from app.db.pool import PoolTimeout
+from app.events import PostgresBroker
+from app.events import Subscriber
+from app.events import broadcaster
+from app.events import encode
+from app.events import event_stream
+from app.fast_serializers import FastManufacturingProcessSerializer
+from app.fast_serializers import FastOperationSerializer
+from app.fast_serializers import encode_duration
+from app.metrics import histograms
+from app.models import Change
 from app.models import ManufacturingProcess
+from app.schema import API_INFO
+from app.search import Document
+from app.schema import schema_cache
 from app.models import Operation
+from app.pagination import KeysetPagination
+from project.startup_profile import ImportProfiler
 from app.serializers import ManufacturingProcessSerializer
 from app.serializers import OperationSerializer
+from app.views import process_queryset
+
+def clear_responses():
+  # Drops cached responses but keeps the list version, which the list endpoints' ETags come from
+  version = cache.get(LIST_VERSION_KEY)
+  cache.clear()
+  cache.set(LIST_VERSION_KEY, version, None)
 
 def setup_client(instance):
+  # Cached responses are keyed by pk, and pks are reused once the test database is rolled back
+  cache.clear()
+  response_cache_stats.reset()
+
   # Create test client
   instance.client = APIClient()
 
@@ -218,4 +302,1924 @@ class OperationTestCase(TestCase):
 
     # Test detail-view DELETE request
     response = self.client.delete(url)
-    self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class PaginationTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.processes = [
+      ManufacturingProcess.objects.create(name=f"Process {i}", description="Paginated")
+      for i in range(25)
+    ]
+    for i in range(15):
+      Operation.objects.create(
+        name=f"Operation {i}",
+        description="Paginated",
+        op_number=(i + 1) * 10,
+        cycle_time=timedelta(seconds=30),
+        process=self.processes[0],
+      )
+
+  def test_process_list_pages(self):
+    # Follow `next` links until exhausted; each page is at most PAGE_SIZE long
+    url = reverse('app:manufacturingprocess-list')
+    seen = []
+    while url:
+      response = self.client.get(url)
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+      self.assertLessEqual(len(response.data['results']), 10)
+      seen.extend(item['pk'] for item in response.data['results'])
+      url = response.data['next']
+    self.assertEqual(seen, [process.pk for process in self.processes])
+
+  def test_process_list_previous(self):
+    url = reverse('app:manufacturingprocess-list')
+    first = self.client.get(url)
+    second = self.client.get(first.data['next'])
+    self.assertIsNone(first.data['previous'])
+    response = self.client.get(second.data['previous'])
+    self.assertEqual(response.data['results'], first.data['results'])
+
+  # MAX_PAGE_SIZE is read when app/pagination.py is imported, so the cap is patched on the class,
+  # below the 25 processes and 15 operations
+  @mock.patch.object(KeysetPagination, 'max_page_size', 12)
+  def test_page_size_is_capped(self):
+    url = reverse('app:manufacturingprocess-list')
+    response = self.client.get(url, {'page_size': 5})
+    self.assertEqual(len(response.data['results']), 5)
+    response = self.client.get(url, {'page_size': 10000})
+    self.assertEqual([item['pk'] for item in response.data['results']], [process.pk for process in self.processes[:12]])
+    self.assertIsNotNone(response.data['next'])
+    response = self.client.get(reverse('app:operation-list', args=[self.processes[0].pk]), {'page_size': 10000})
+    self.assertEqual(len(response.data['results']), 12)
+
+  def test_operation_list_ordered_by_op_number(self):
+    url = reverse('app:operation-list', args=[self.processes[0].pk])
+    response = self.client.get(url)
+    self.assertEqual(
+      [item['op_number'] for item in response.data['results']],
+      [(i + 1) * 10 for i in range(10)]
+    )
+    response = self.client.get(response.data['next'])
+    self.assertEqual(len(response.data['results']), 5)
+    self.assertIsNone(response.data['next'])
+
+  def test_invalid_cursor(self):
+    url = reverse('app:manufacturingprocess-list')
+    response = self.client.get(url, {'cursor': 'not-a-cursor'})
+    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+  def test_tampered_cursor_position(self):
+    url = reverse('app:manufacturingprocess-list')
+    cursor = base64.b64encode(b'p=abc').decode('ascii')
+    response = self.client.get(url, {'cursor': cursor})
+    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+# Read paths must run a fixed number of queries however many rows they render
+class QueryCountTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+
+  def create_processes(self, count, operations_per_process):
+    start = Operation.objects.count()
+    for i in range(count):
+      process = ManufacturingProcess.objects.create(name=f"Process {i}", description="Counted")
+      Operation.objects.bulk_create([
+        Operation(
+          name=f"Operation {j}",
+          description="Counted",
+          op_number=1000 + start + i * operations_per_process + j,
+          cycle_time=timedelta(seconds=j + 1),
+          process=process,
+        )
+        for j in range(operations_per_process)
+      ])
+    return process
+
+  def test_process_list(self):
+    url = reverse('app:manufacturingprocess-list')
+    self.create_processes(2, 1)
+    # Page of processes + prefetched operations; the ETag validator is the cached list version
+    with self.assertNumQueries(2):
+      self.client.get(url)
+    self.create_processes(8, 5)
+    with self.assertNumQueries(2):
+      response = self.client.get(url)
+    self.assertEqual(len(response.data['results']), 10)
+    self.assertEqual(len(response.data['results'][-1]['operations']), 5)
+
+  def test_process_detail(self):
+    process = self.create_processes(1, 20)
+    url = reverse('app:manufacturingprocess-detail', args=[process.pk])
+    with self.assertNumQueries(3):  # validator + process + its operations
+      response = self.client.get(url)
+    self.assertEqual(len(response.data['operations']), 20)
+
+  def test_operation_list(self):
+    process = self.create_processes(1, 10)
+    url = reverse('app:operation-list', args=[process.pk])
+    with self.assertNumQueries(3):  # validator + parent process + page of operations
+      response = self.client.get(url)
+    self.assertEqual(len(response.data['results']), 10)
+
+  def test_operation_detail(self):
+    process = self.create_processes(1, 1)
+    operation = process.operations.get()
+    url = reverse('app:operation-detail', args=[process.pk, operation.op_number])
+    with self.assertNumQueries(2):  # validator + operation
+      self.client.get(url)
+
+  def test_expand_operations(self):
+    self.create_processes(10, 5)
+    url = reverse('app:manufacturingprocess-list') + '?expand=operations'
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(url)
+    # Still one query for every page's operations
+    self.assertEqual(len(queries), 2)
+    process = ManufacturingProcess.objects.last()
+    # As the operation endpoints render them, without the link back to the process
+    expected = OperationSerializer(process.operations.order_by('op_number'), many=True, context={'request': None}).data
+    for operation in expected:
+      del operation['process']
+    self.assertEqual(response.data['results'][-1]['operations'], expected)
+
+  def test_sparse_fields(self):
+    process = self.create_processes(1, 3)
+    url = reverse('app:manufacturingprocess-detail', args=[process.pk])
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(url + '?fields=pk,name')
+    self.assertEqual(response.data, {'pk': process.pk, 'name': process.name})
+    # No operations query, and only the columns rendered
+    self.assertEqual(len(queries), 2)
+    self.assertNotIn('description', queries[-1]['sql'])
+
+    response = self.client.get(url + '?expand=operations&fields=name,operations.op_number,operations.cycle_time')
+    self.assertEqual(response.data['name'], process.name)
+    self.assertEqual(
+      [set(operation) for operation in response.data['operations']], [{'op_number', 'cycle_time'}] * 3
+    )
+
+    response = self.client.get(reverse('app:manufacturingprocess-list') + '?fields=pk')
+    self.assertEqual(response.data['results'], [{'pk': process.pk}])
+
+  def test_fieldset_errors(self):
+    process = self.create_processes(1, 1)
+    url = reverse('app:manufacturingprocess-detail', args=[process.pk])
+    for query, parameter in (
+      ('expand=nope', 'expand'),
+      ('fields=pk,nope', 'fields'),
+      ('fields=operations.name', 'fields'),
+      ('expand=operations&fields=operations.nope', 'fields'),
+    ):
+      response = self.client.get(f'{url}?{query}')
+      self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+      self.assertIn(parameter, response.data)
+
+  def test_templated_hyperlinks(self):
+    # Links built from the cached template must equal what reverse() produces
+    process = self.create_processes(1, 3)
+    response = self.client.get(reverse('app:operation-list', args=[process.pk]))
+    expected = 'http://testserver' + reverse('app:manufacturingprocess-detail', args=[process.pk])
+    self.assertEqual({item['process'] for item in response.data['results']}, {expected})
+    response = self.client.get(reverse('app:manufacturingprocess-detail', args=[process.pk]))
+    self.assertEqual(response.data['operations'], [
+      'http://testserver' + reverse('app:operation-list', args=[operation.pk])
+      for operation in process.operations.order_by('op_number')
+    ])
+
+class BatchReadTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.processes = [
+      ManufacturingProcess.objects.create(name=f"Process {i}", description="Batch") for i in range(3)
+    ]
+    for i, process in enumerate(self.processes):
+      Operation.objects.create(
+        name=f"Op {i}", description="Batch", op_number=10 + i, cycle_time=timedelta(seconds=5), process=process,
+      )
+    self.missing = self.processes[-1].pk + 100
+
+  def test_processes(self):
+    ids = [self.processes[2].pk, self.missing, self.processes[0].pk]
+    url = reverse('app:manufacturingprocess-batch') + '?ids=' + ','.join(map(str, ids))
+    # Processes + their prefetched operations
+    with self.assertNumQueries(2):
+      response = self.client.get(url)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    results = response.data['results']
+    self.assertEqual(list(results), [str(pk) for pk in ids])
+    self.assertIsNone(results[str(self.missing)])
+    detail = self.client.get(reverse('app:manufacturingprocess-detail', args=[self.processes[0].pk]))
+    self.assertEqual(results[str(self.processes[0].pk)], detail.data)
+
+    response = self.client.get(url + '&fields=name')
+    self.assertEqual(response.data['results'][str(ids[0])], {'name': 'Process 2'})
+
+  def test_operations(self):
+    first, second, _ = self.processes
+    keys = [f'{first.pk}:10', f'{second.pk}:11', f'{first.pk}:11', f'{first.pk}:99']
+    url = reverse('app:operation-batch') + '?keys=' + ','.join(keys)
+    with self.assertNumQueries(1):
+      response = self.client.get(url)
+    results = response.data['results']
+    self.assertEqual(list(results), keys)
+    self.assertEqual(results[keys[0]]['name'], 'Op 0')
+    self.assertEqual(results[keys[1]]['name'], 'Op 1')
+    # op_number 11 exists, but in another process
+    self.assertIsNone(results[keys[2]])
+    self.assertIsNone(results[keys[3]])
+
+  def test_invalid_keys(self):
+    for url in (
+      reverse('app:manufacturingprocess-batch'),
+      reverse('app:manufacturingprocess-batch') + '?ids=1,x',
+      reverse('app:operation-batch') + '?keys=1',
+      reverse('app:operation-batch') + '?keys=1:2:3',
+    ):
+      response = self.client.get(url)
+      self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+
+  @override_settings(BATCH_MAX_SIZE=2)
+  def test_batch_size(self):
+    url = reverse('app:manufacturingprocess-batch')
+    self.assertEqual(self.client.get(url + '?ids=1,2,2').status_code, status.HTTP_200_OK)
+    response = self.client.get(url + '?ids=1,2,3')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertIn('ids', response.data)
+
+class SearchTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.drilling = ManufacturingProcess.objects.create(name="Drilling line", description="Makes holes")
+    self.paint = ManufacturingProcess.objects.create(name="Paint shop", description="Drill prep, then paint")
+    self.drill = Operation.objects.create(
+      name="Drill", description="Drill the mounting holes", op_number=10,
+      cycle_time=timedelta(seconds=5), process=self.paint,
+    )
+    Operation.objects.create(
+      name="Sand", description="Sand by hand", op_number=20, cycle_time=timedelta(seconds=5), process=self.paint,
+    )
+
+  def get(self, query, **params):
+    return self.client.get(reverse('app:search'), {'q': query, **params})
+
+  def test_ranked_prefix_matches(self):
+    # Count + page; results from both tables come from one UNION query
+    with self.assertNumQueries(2):
+      response = self.get('DRIL')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data['count'], 3)
+    results = response.data['results']
+    self.assertEqual(
+      [(result['type'], result['pk']) for result in results],
+      [('operation', self.drill.pk), ('process', self.drilling.pk), ('process', self.paint.pk)],
+    )
+    # A match in the name ranks above one only in the description
+    self.assertGreater(results[1]['rank'], results[2]['rank'])
+    self.assertEqual(results[0]['op_number'], 10)
+    self.assertEqual(results[0]['url'], 'http://testserver' + reverse('app:operation-detail', args=[self.paint.pk, 10]))
+    self.assertEqual(results[0]['process'], 'http://testserver' + reverse('app:manufacturingprocess-detail', args=[self.paint.pk]))
+    self.assertEqual(results[1]['url'], 'http://testserver' + reverse('app:manufacturingprocess-detail', args=[self.drilling.pk]))
+
+  def test_every_word_matches(self):
+    results = self.get('drill holes').data['results']
+    self.assertEqual([result['pk'] for result in results], [self.drill.pk, self.drilling.pk])
+    self.assertEqual(self.get('drill nothing').data['results'], [])
+
+  def test_type_and_pagination(self):
+    response = self.get('drill', type='process', page_size=1)
+    self.assertEqual(response.data['count'], 2)
+    self.assertEqual([result['pk'] for result in response.data['results']], [self.drilling.pk])
+    response = self.client.get(response.data['next'])
+    self.assertEqual([result['pk'] for result in response.data['results']], [self.paint.pk])
+
+  def test_invalid(self):
+    self.assertEqual(self.get('  !? ').status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(self.client.get(reverse('app:search')).status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(self.get('drill', type='machine').status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_document_matches_index(self):
+    # PostgreSQL only uses the GIN indexes for the expression they were built on
+    migration = importlib.import_module('app.migrations.0006_search_indexes')
+    self.assertEqual(Document.template % {'name': 'name', 'description': 'description'}, migration.DOCUMENT)
+
+  @override_settings(SEARCH_MAX_RESULTS=1)
+  def test_results_capped_per_table(self):
+    self.assertEqual(self.get('drill').data['count'], 2)
+
+class FastSerializerTestCase(TestCase):
+  def setUp(self):
+    cycle_times = [
+      timedelta(0), timedelta(seconds=90), timedelta(hours=25, microseconds=5),
+      timedelta(days=-1, seconds=30), timedelta(hours=3, minutes=7, seconds=9, microseconds=120000),
+    ]
+    for i in range(3):
+      process = ManufacturingProcess.objects.create(name=f"Prozess {i} \u2713", description='"Quoted"\n')
+      for j, cycle_time in enumerate(cycle_times[i:]):
+        Operation.objects.create(
+          name=f"Op {j}", description="", op_number=100 * i + j, cycle_time=cycle_time, process=process,
+        )
+    ManufacturingProcess.objects.create(name="Empty", description="No operations")
+    self.request = Request(APIRequestFactory().get('/'))
+
+  def assertSameBytes(self, fast, expected):
+    self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+  def test_operations(self):
+    fast = FastOperationSerializer(self.request)
+    operations = Operation.objects.order_by('op_number')
+    expected = OperationSerializer(operations, many=True, context={'request': self.request}).data
+    self.assertSameBytes(fast.data(fast.rows(operations)), expected)
+
+  def test_processes(self):
+    processes = ManufacturingProcess.objects.order_by('pk')
+    for fields, expand in (
+      (None, None),
+      ({'pk', 'name'}, {}),
+      ({'description', 'operations'}, {}),
+      (None, {'operations': None}),
+      ({'pk', 'operations'}, {'operations': {'cycle_time', 'op_number'}}),
+      ({'operations'}, {'operations': {'name'}}),
+    ):
+      fast = FastManufacturingProcessSerializer(self.request, fields=fields, expand=expand)
+      rows = list(fast.rows(processes))
+      expected = ManufacturingProcessSerializer(
+        process_queryset(processes, fields=fields, expand=expand), many=True,
+        context={'request': self.request}, fields=fields, expand=expand,
+      ).data
+      self.assertSameBytes(fast.data(rows, fast.operations(rows)), expected)
+
+  def test_encode_duration(self):
+    for value in (
+      timedelta(0), timedelta(microseconds=1), timedelta(days=3, hours=4), timedelta(days=-2, microseconds=7),
+      timedelta(hours=23, minutes=59, seconds=59, microseconds=999999), timedelta.max, timedelta.min,
+    ):
+      self.assertEqual(encode_duration(value), duration_string(value))
+
+COLUMNAR = 'application/vnd.ozymandias.columnar+json'
+
+class ListFormatTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.process = ManufacturingProcess.objects.create(name="Paint", description="Formats")
+    for op_number, cycle_time in ((10, timedelta(seconds=90)), (20, timedelta(hours=1, microseconds=500))):
+      Operation.objects.create(
+        name=f"Op {op_number}", description="", op_number=op_number, cycle_time=cycle_time, process=self.process,
+      )
+    ManufacturingProcess.objects.create(name="Empty", description="")
+    self.urls = [
+      reverse('app:manufacturingprocess-list'),
+      reverse('app:manufacturingprocess-list') + '?expand=operations',
+      reverse('app:operation-list', args=[self.process.pk]),
+    ]
+
+  def test_msgpack(self):
+    for url in self.urls:
+      response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+      self.assertEqual(response['Content-Type'], 'application/msgpack')
+      self.assertEqual(msgpack.unpackb(response.content), self.client.get(url).json())
+
+  def test_columnar(self):
+    # Rebuilding the rows from the columns gives the JSON results back
+    def rows(columns):
+      return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    json_results = self.client.get(self.urls[2]).json()['results']
+    columns = self.client.get(self.urls[2], HTTP_ACCEPT=COLUMNAR).json()['results']
+    self.assertEqual(columns['process'], json_results[0]['process'])
+    self.assertEqual(columns['cycle_time'], [90.0, 3600.0005])
+    del columns['process'], columns['cycle_time']
+    self.assertEqual(rows(columns), [
+      {key: value for key, value in operation.items() if key not in ('process', 'cycle_time')}
+      for operation in json_results
+    ])
+
+    response = self.client.get(self.urls[0], HTTP_ACCEPT=COLUMNAR)
+    self.assertEqual(response['Content-Type'], COLUMNAR)
+    columns = response.json()['results']
+    template = columns.pop('operations_url')
+    columns['operations'] = [[template.format(pk=pk) for pk in pks] for pks in columns['operations']]
+    self.assertEqual(rows(columns), self.client.get(self.urls[0]).json()['results'])
+
+    columns = self.client.get(self.urls[1] + '&format=columnar').json()['results']
+    self.assertEqual(columns['operations'][0]['op_number'], [10, 20])
+    self.assertEqual(columns['operations'][1], {
+      'pk': [], 'op_number': [], 'name': [], 'description': [], 'cycle_time': [],
+    })
+
+  def test_columnar_cached_separately(self):
+    url = self.urls[2]
+    self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+    response = self.client.get(url + '?format=columnar')
+    self.assertEqual(response['X-Cache'], 'MISS')
+    self.assertIsInstance(response.json()['results']['pk'], list)
+
+class OperationBulkImportTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.process = ManufacturingProcess.objects.create(name="Machining", description="Bulk")
+    self.url = reverse('app:operation-list', args=[self.process.pk])
+
+  def payload(self, op_numbers):
+    return [
+      {
+        "name": f"Step {op_number}",
+        "description": "Imported",
+        "op_number": op_number,
+        "cycle_time": "00:01:30",
+      }
+      for op_number in op_numbers
+    ]
+
+  def test_bulk_import(self):
+    # Process lookup, one uniqueness query, savepoint, INSERT, change log, parent `updated_at` bump,
+    # release; independent of batch size
+    with self.assertNumQueries(7):
+      response = self.client.post(self.url, self.payload(range(10, 510, 10)), format='json')
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(len(response.data), 50)
+    self.assertEqual(self.process.operations.count(), 50)
+    self.assertEqual(response.data[0]['op_number'], 10)
+    self.assertEqual(response.data[0]['cycle_time'], '00:01:30')
+    self.assertEqual(
+      response.data[0]['process'],
+      'http://testserver' + reverse('app:manufacturingprocess-detail', args=[self.process.pk])
+    )
+
+  def test_per_item_errors(self):
+    Operation.objects.create(
+      name="Existing", description="Existing", op_number=20,
+      cycle_time=timedelta(seconds=1), process=self.process,
+    )
+    payload = self.payload([10, 20, 30, 30])
+    payload[0]['cycle_time'] = 'not a duration'
+    response = self.client.post(self.url, payload, format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(len(response.data), 4)
+    self.assertIn('cycle_time', response.data[0])
+    self.assertIn('op_number', response.data[1])
+    self.assertIn('op_number', response.data[2])
+    self.assertIn('op_number', response.data[3])
+    # All or nothing
+    self.assertEqual(self.process.operations.count(), 1)
+
+  def test_valid_items_report_empty_errors(self):
+    payload = self.payload([10, 20])
+    del payload[1]['name']
+    response = self.client.post(self.url, payload, format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(response.data[0], {})
+    self.assertIn('name', response.data[1])
+
+  def test_not_a_list(self):
+    response = self.client.post(self.url, self.payload([10])[0], format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_batch_size_limit(self):
+    with self.settings(BULK_IMPORT_MAX_SIZE=2):
+      response = self.client.post(self.url, self.payload([10, 20, 30]), format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_unknown_process(self):
+    url = reverse('app:operation-list', args=[self.process.pk + 1])
+    response = self.client.post(url, self.payload([10]), format='json')
+    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class ResequenceTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.process = ManufacturingProcess.objects.create(name="Assembly", description="Resequence")
+    self.other = ManufacturingProcess.objects.create(name="Other", description="Resequence")
+    for op_number, seconds in ((10, 5), (20, 9), (30, 7)):
+      Operation.objects.create(
+        name=f"Step {op_number}", description="Resequence", op_number=op_number,
+        cycle_time=timedelta(seconds=seconds), process=self.process,
+      )
+    Operation.objects.create(
+      name="Elsewhere", description="Resequence", op_number=50, cycle_time=timedelta(seconds=1), process=self.other,
+    )
+    self.url = reverse('app:operation-resequence', args=[self.process.pk])
+
+  def op_numbers(self):
+    return dict(self.process.operations.values_list('name', 'op_number'))
+
+  def test_shift_opens_a_gap(self):
+    # 20 -> 30 while 30 still exists: collides unless the rows move out of the way first
+    response = self.client.post(self.url, {'shift_from': 20, 'by': 10}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data, {'mapping': {20: 30, 30: 40}})
+    self.assertEqual(self.op_numbers(), {'Step 10': 10, 'Step 20': 30, 'Step 30': 40})
+    # Rollups follow the bottleneck to its new number
+    self.process.refresh_from_db()
+    self.assertEqual(self.process.bottleneck_op_number, 30)
+
+  def test_order(self):
+    response = self.client.post(self.url, {'order': [30, 20, 10], 'start': 100, 'step': 5}, format='json')
+    self.assertEqual(response.data, {'mapping': {10: 110, 20: 105, 30: 100}})
+    self.assertEqual(self.op_numbers(), {'Step 10': 110, 'Step 20': 105, 'Step 30': 100})
+    # Numbers swap places; unchanged ones are left out of the mapping
+    response = self.client.post(self.url, {'order': [110, 105, 100], 'start': 100, 'step': 5}, format='json')
+    self.assertEqual(response.data, {'mapping': {100: 110, 110: 100}})
+
+  def test_constant_queries(self):
+    Operation.objects.bulk_create(
+      Operation(
+        name=f"Bulk {i}", description="Resequence", op_number=1000 + i,
+        cycle_time=timedelta(seconds=1), process=self.process,
+      )
+      for i in range(200)
+    )
+    # Process lookup, savepoint, locked read, conflict check, max, two UPDATEs, change log, rollups,
+    # release
+    with self.assertNumQueries(10):
+      response = self.client.post(self.url, {'shift_from': 1000, 'by': 1000}, format='json')
+    self.assertEqual(len(response.data['mapping']), 200)
+    self.assertEqual(self.process.operations.filter(op_number__gte=2000).count(), 200)
+
+  def test_cached_responses_invalidated(self):
+    list_url = reverse('app:operation-list', args=[self.process.pk])
+    self.client.get(list_url)
+    self.client.post(self.url, {'shift_from': 10, 'by': 1}, format='json')
+    response = self.client.get(list_url)
+    self.assertEqual([operation['op_number'] for operation in response.data['results']], [11, 21, 31])
+
+  def test_numbers_in_use(self):
+    # 50 belongs to another process; 20 to an operation of this one that doesn't move
+    for payload in ({'shift_from': 30, 'by': 20}, {'order': [10], 'start': 20}):
+      response = self.client.post(self.url, payload, format='json')
+      self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(self.op_numbers(), {'Step 10': 10, 'Step 20': 20, 'Step 30': 30})
+
+  def test_invalid(self):
+    for payload in (
+      {}, {'order': [10], 'shift_from': 10, 'by': 1}, {'order': [10, 10]}, {'order': [50]},
+      {'shift_from': 10}, {'shift_from': 10, 'by': -20},
+    ):
+      response = self.client.post(self.url, payload, format='json')
+      self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, payload)
+    missing = reverse('app:operation-resequence', args=[self.other.pk + 100])
+    self.assertEqual(self.client.post(missing, {'shift_from': 10, 'by': 1}, format='json').status_code, 404)
+
+class CloneTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.template = ManufacturingProcess.objects.create(name="Template", description="Base routing")
+    for op_number, seconds in ((10, 5), (20, 9), (30, 7)):
+      Operation.objects.create(
+        name=f"Step {op_number}", description="Clone", op_number=op_number,
+        cycle_time=timedelta(seconds=seconds), process=self.template,
+      )
+    self.other = ManufacturingProcess.objects.create(name="Other", description="Clone")
+    Operation.objects.create(
+      name="Elsewhere", description="Clone", op_number=100, cycle_time=timedelta(seconds=1), process=self.other,
+    )
+    self.url = reverse('app:manufacturingprocess-clone')
+
+  def test_clone_after_highest_op_number(self):
+    response = self.client.post(self.url, [{'source': self.template.pk, 'name': "Variant"}], format='json')
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    result, = response.data
+    self.assertEqual(result['source'], self.template.pk)
+    self.assertEqual(result['op_numbers'], {10: 101, 20: 111, 30: 121})
+    clone = ManufacturingProcess.objects.get(pk=result['pk'])
+    self.assertEqual((clone.name, clone.description), ("Variant", "Base routing"))
+    self.assertEqual(
+      list(clone.operations.order_by('op_number').values_list('op_number', 'name', 'cycle_time')),
+      [(101, "Step 10", timedelta(seconds=5)), (111, "Step 20", timedelta(seconds=9)), (121, "Step 30", timedelta(seconds=7))],
+    )
+    self.assertEqual((clone.operation_count, clone.bottleneck_op_number), (3, 111))
+    self.assertEqual(self.client.get(result['url']).data['name'], "Variant")
+
+  def test_remapping(self):
+    response = self.client.post(self.url, [
+      {'source': self.template.pk, 'op_number_offset': 1000},
+      {'source': self.template.pk, 'op_number_start': 2000, 'op_number_step': 5},
+      {'source': self.other.pk},
+    ], format='json')
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    self.assertEqual([result['op_numbers'] for result in response.data], [
+      {10: 1010, 20: 1020, 30: 1030}, {10: 2000, 20: 2005, 30: 2010}, {100: 101},
+    ])
+    self.assertEqual(response.data[0]['source'], self.template.pk)
+
+  def test_constant_queries(self):
+    # Sources, their operations, highest op_number, savepoint, 2 INSERTs, 2 change log INSERTs,
+    # rollups, release
+    for clones in (1, 20):
+      with self.assertNumQueries(10):
+        response = self.client.post(self.url, [{'source': self.template.pk}] * clones, format='json')
+      self.assertEqual(len(response.data), clones)
+    self.assertEqual(Operation.objects.count(), 4 + 21 * 3)
+
+  def test_invalid(self):
+    processes = ManufacturingProcess.objects.count()
+    for payload in (
+      [], [{}], [{'source': self.template.pk, 'op_number_offset': 1, 'op_number_start': 1}],
+      [{'source': self.other.pk + 100}],
+      # 100 is in use; the two clones would share 1010..1030
+      [{'source': self.template.pk, 'op_number_offset': 90}],
+      [{'source': self.template.pk, 'op_number_offset': 1000}] * 2,
+      [{'source': self.template.pk, 'op_number_offset': -20}],
+    ):
+      response = self.client.post(self.url, payload, format='json')
+      self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, payload)
+    self.assertEqual(ManufacturingProcess.objects.count(), processes)
+
+  def test_step_without_start(self):
+    response = self.client.post(self.url, [{'source': self.template.pk, 'op_number_step': 5}], format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(response.json(), [{'non_field_errors': ['op_number_step needs op_number_start.']}])
+
+@override_settings(CHANGE_FEED_DELAY=0)
+class ChangeFeedTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.process = ManufacturingProcess.objects.create(name="Synced", description="Change feed")
+    self.operation = Operation.objects.create(
+      name="Drill", description="Change feed", op_number=10, cycle_time=timedelta(seconds=5), process=self.process,
+    )
+    self.url = reverse('app:change-feed')
+    self.cursor = self.client.get(self.url).data['cursor']
+
+  def poll(self, **params):
+    response = self.client.get(self.url, {'since': self.cursor, **params})
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.cursor = response.data['cursor']
+    return response.data
+
+  def changes(self, data):
+    return [(result['type'], result['pk'], result['action']) for result in data['results']]
+
+  def test_head_cursor(self):
+    data = self.client.get(self.url).data
+    self.assertEqual(data['results'], [])
+    self.assertEqual(self.poll()['results'], [])
+    self.assertEqual(self.cursor, data['cursor'])
+
+  def test_created_updated_and_deleted(self):
+    created = Operation.objects.create(
+      name="Ream", description="Change feed", op_number=20, cycle_time=timedelta(seconds=3), process=self.process,
+    )
+    created.name = "Ream twice"
+    created.save()
+    deleted = self.operation.pk
+    self.operation.delete()
+    data = self.poll()
+    self.assertEqual(self.changes(data), [
+      ('operation', created.pk, 'created'),
+      ('operation', deleted, 'deleted'),
+      ('process', self.process.pk, 'updated'),
+    ])
+    self.assertFalse(data['more'])
+    self.assertEqual(data['results'][0]['data']['name'], "Ream twice")
+    self.assertNotIn('data', data['results'][1])
+    self.assertEqual(data['results'][2]['data']['name'], "Synced")
+    self.assertEqual(len(data['results'][2]['data']['operations']), 1)
+    self.assertEqual(self.poll()['results'], [])
+
+  def test_process_delete_leaves_tombstones(self):
+    process_pk, operation_pk = self.process.pk, self.operation.pk
+    self.process.delete()
+    self.assertEqual(self.changes(self.poll()), [
+      ('process', process_pk, 'deleted'),
+      ('operation', operation_pk, 'deleted'),
+    ])
+
+  def test_bulk_writes(self):
+    response = self.client.post(
+      reverse('app:operation-list', args=[self.process.pk]),
+      [{'op_number': 20, 'name': "Tap", 'description': "Bulk", 'cycle_time': '00:00:04'}],
+      format='json',
+    )
+    self.client.post(reverse('app:operation-resequence', args=[self.process.pk]), {'shift_from': 10, 'by': 100}, format='json')
+    data = self.poll()
+    self.assertCountEqual(self.changes(data), [
+      ('operation', response.data[0]['pk'], 'created'),
+      ('operation', self.operation.pk, 'updated'),
+      ('process', self.process.pk, 'updated'),
+    ])
+    op_numbers = {result['pk']: result['data']['op_number'] for result in data['results'] if result['type'] == 'operation'}
+    self.assertEqual(op_numbers, {self.operation.pk: 110, response.data[0]['pk']: 120})
+
+    response = self.client.post(reverse('app:manufacturingprocess-clone'), [{'source': self.process.pk}], format='json')
+    clone = response.data[0]['pk']
+    changes = self.changes(self.poll())
+    self.assertIn(('process', clone, 'created'), changes)
+    self.assertEqual(len([change for change in changes if change[:1] == ('operation',)]), 2)
+
+  def test_pages(self):
+    for i in range(5):
+      self.operation.name = f"Drill {i}"
+      self.operation.save()
+    ManufacturingProcess.objects.create(name="Second", description="Change feed")
+    data = self.poll(page_size=4)
+    self.assertTrue(data['more'])
+    self.assertEqual(self.changes(data), [('operation', self.operation.pk, 'updated'), ('process', self.process.pk, 'updated')])
+    data = self.poll(page_size=4)
+    self.assertTrue(data['more'])
+    data = self.poll(page_size=4)
+    self.assertFalse(data['more'])
+    self.assertEqual([result['type'] for result in data['results']], ['operation', 'process', 'process'])
+
+  def test_constant_queries(self):
+    for i in range(20):
+      process = ManufacturingProcess.objects.create(name=f"Process {i}", description="Change feed")
+      Operation.objects.create(
+        name="Step", description="Change feed", op_number=100 + i, cycle_time=timedelta(seconds=1), process=process,
+      )
+    # Oldest change, the page, processes, their operations, operations
+    with self.assertNumQueries(5):
+      self.assertEqual(len(self.poll()['results']), 40)
+
+  @override_settings(CHANGE_FEED_DELAY=60)
+  def test_recent_changes_wait(self):
+    cursor = self.cursor
+    self.operation.save()
+    data = self.poll()
+    self.assertEqual((data['results'], data['cursor'], data['more']), ([], cursor, False))
+
+  def test_pruned_cursor(self):
+    self.operation.save()
+    self.operation.save()
+    call_command('prune_changes', days=0, stdout=io.StringIO())
+    response = self.client.get(self.url, {'since': 0})
+    self.assertEqual(response.status_code, status.HTTP_410_GONE)
+    self.assertEqual(response.data['cursor'], self.client.get(self.url).data['cursor'])
+
+  def test_invalid_parameters(self):
+    for params in ({'since': 'x'}, {'since': -1}, {'since': 0, 'page_size': 'all'}):
+      self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+class ExportTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.url = reverse('app:export')
+    self.empty = ManufacturingProcess.objects.create(name="Empty", description="No operations")
+    self.process = ManufacturingProcess.objects.create(name="Paint", description="Paint, cure")
+    for op_number, name in [(20, "Cure"), (10, "Spray")]:
+      Operation.objects.create(
+        name=name, description=f"{name} parts", op_number=op_number,
+        cycle_time=timedelta(minutes=5), process=self.process,
+      )
+
+  def test_ndjson(self):
+    response = self.client.get(self.url)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertTrue(response.streaming)
+    self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+    lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+    records = [json.loads(line) for line in lines]
+    self.assertEqual([record['pk'] for record in records], [self.empty.pk, self.process.pk])
+    self.assertEqual(records[0]['operations'], [])
+    self.assertEqual([op['op_number'] for op in records[1]['operations']], [10, 20])
+    self.assertEqual(records[1]['operations'][0]['cycle_time'], '00:05:00')
+
+  def test_csv(self):
+    response = self.client.get(self.url, {'format': 'csv'})
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertTrue(response['Content-Type'].startswith('text/csv'))
+    content = b''.join(response.streaming_content).decode('utf-8')
+    rows = list(csv.reader(io.StringIO(content)))
+    self.assertEqual(rows[0][0], 'process_pk')
+    self.assertEqual(len(rows), 4)  # header, empty process, two operations
+    self.assertEqual(rows[1][3:], [''] * 5)
+    self.assertEqual(rows[2][4], '10')
+
+  def test_requires_authentication(self):
+    self.client.force_authenticate(user=None)
+    response = self.client.get(self.url)
+    self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+# Under project/asgi.py's handler: the export's query runs as the client reads the stream
+class ASGIExportTestCase(TransactionTestCase):
+  def setUp(self):
+    self.token = Token.objects.create(user=User.objects.create_user(username='exporter', password='x'))
+    self.pks = [ManufacturingProcess.objects.create(name=f"Process {i}", description="ASGI").pk for i in range(3)]
+    Operation.objects.create(
+      name="Spray", description="ASGI", op_number=10, cycle_time=timedelta(minutes=5), process_id=self.pks[0],
+    )
+
+  def export(self, query_string):
+    application = ThreadPoolASGIHandler(2)
+    # Several thread hops per stream
+    application.stream_batch = 2
+    scope = {
+      'type': 'http', 'method': 'GET', 'path': reverse('app:export'), 'query_string': query_string,
+      'headers': [(b'host', b'testserver'), (b'authorization', f'Token {self.token.key}'.encode())],
+    }
+    messages = []
+
+    async def send(message):
+      messages.append(message)
+
+    try:
+      asyncio.run(application(scope, AsyncMock(return_value={'type': 'http.request'}), send))
+    finally:
+      for lane in application.lanes:
+        executor = SyncToAsync.context_to_thread_executor.pop(lane, None)
+        if executor:
+          executor.shutdown()
+    self.assertEqual(messages[0]['status'], status.HTTP_200_OK)
+    self.assertEqual(messages[-1], {'type': 'http.response.body'})
+    return dict(messages[0]['headers']), b''.join(message.get('body', b'') for message in messages[1:])
+
+  def test_ndjson(self):
+    headers, body = self.export(b'')
+    self.assertTrue(headers[b'Content-Type'].startswith(b'application/x-ndjson'))
+    records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    self.assertEqual([record['pk'] for record in records], self.pks)
+    self.assertEqual([op['op_number'] for op in records[0]['operations']], [10])
+
+  def test_csv(self):
+    headers, body = self.export(b'format=csv')
+    self.assertTrue(headers[b'Content-Type'].startswith(b'text/csv'))
+    rows = list(csv.reader(io.StringIO(body.decode('utf-8'))))
+    self.assertEqual([row[0] for row in rows], ['process_pk', *map(str, self.pks)])
+
+class TokenAuthenticationTestCase(TestCase):
+  def setUp(self):
+    token_cache.clear()
+    self.client = APIClient()
+    self.user = User.objects.create_user(username='tokenuser', password='tokenpass')
+    response = self.client.post(
+      reverse('app:auth-token'),
+      {'username': 'tokenuser', 'password': 'tokenpass'},
+      format='json'
+    )
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.token = response.data['token']
+    self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+    self.url = reverse('app:root-view')
+
+  def test_bad_credentials(self):
+    response = APIClient().post(
+      reverse('app:auth-token'),
+      {'username': 'tokenuser', 'password': 'wrong'},
+      format='json'
+    )
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_token_is_cached(self):
+    with self.assertNumQueries(1):  # token joined to its user
+      self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+    with self.assertNumQueries(0):
+      self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+  def test_password_change_revokes_token(self):
+    self.client.get(self.url)
+    self.user.set_password('newpass')
+    self.user.save()
+    self.assertEqual(len(token_cache), 0)
+    self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+  def test_deactivated_user(self):
+    self.client.get(self.url)
+    self.user.is_active = False
+    self.user.save()
+    self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+  def test_permission_change_invalidates(self):
+    self.client.get(self.url)
+    permission = Permission.objects.get(codename='add_operation')
+    self.user.user_permissions.add(permission)
+    self.assertEqual(len(token_cache), 0)
+    self.client.get(self.url)
+    group = Group.objects.create(name='planners')
+    group.user_set.add(self.user)
+    self.assertEqual(len(token_cache), 0)
+
+  def test_ttl_and_size_bounds(self):
+    now = [0]
+    cache = TTLCache(max_size=2, ttl=10, timer=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    self.assertIsNone(cache.get('b'))
+    self.assertEqual(cache.get('a'), 1)
+    now[0] = 10
+    self.assertIsNone(cache.get('a'))
+
+class ResponseCacheTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.process = ManufacturingProcess.objects.create(name="Assemble", description="Cached")
+    self.operation = Operation.objects.create(
+      name="Press fit", description="Press bearing", op_number=10,
+      cycle_time=timedelta(seconds=45), process=self.process,
+    )
+    self.detail_url = reverse('app:manufacturingprocess-detail', args=[self.process.pk])
+    self.list_url = reverse('app:operation-list', args=[self.process.pk])
+    self.operation_url = reverse('app:operation-detail', args=[self.process.pk, 10])
+
+  def test_hit_skips_database(self):
+    for url in [self.detail_url, self.list_url, self.operation_url]:
+      first = self.client.get(url)
+      self.assertEqual(first['X-Cache'], 'MISS')
+      with self.assertNumQueries(1):  # only the conditional GET validator
+        second = self.client.get(url)
+      self.assertEqual(second['X-Cache'], 'HIT')
+      self.assertEqual(first.content, second.content)
+    self.assertEqual(response_cache_stats.as_dict(), {'hits': 3, 'misses': 3, 'coalesced': 0})
+
+  def test_operation_save_invalidates(self):
+    self.client.get(self.list_url)
+    self.operation.name = "Press fit bearing"
+    self.operation.save()
+    response = self.client.get(self.list_url)
+    self.assertEqual(response['X-Cache'], 'MISS')
+    self.assertEqual(response.json()['results'][0]['name'], "Press fit bearing")
+
+  def test_process_update_invalidates(self):
+    self.client.get(self.detail_url)
+    self.client.put(self.detail_url, {'name': 'Assemble 2', 'description': 'Cached'}, format='json')
+    response = self.client.get(self.detail_url)
+    self.assertEqual(response.json()['name'], 'Assemble 2')
+
+  def test_delete_invalidates(self):
+    self.client.get(self.operation_url)
+    self.client.delete(self.operation_url)
+    self.assertEqual(self.client.get(self.operation_url).status_code, status.HTTP_404_NOT_FOUND)
+    self.assertEqual(self.client.get(self.detail_url).json()['operations'], [])
+
+  def test_bulk_import_invalidates(self):
+    self.client.get(self.list_url)
+    payload = [{"name": "Inspect", "description": "Inspect", "op_number": 20, "cycle_time": "00:00:10"}]
+    self.client.post(self.list_url, payload, format='json')
+    self.assertEqual(len(self.client.get(self.list_url).json()['results']), 2)
+
+  def test_moving_operation_invalidates_both_processes(self):
+    other = ManufacturingProcess.objects.create(name="Other", description="Other")
+    self.client.get(self.detail_url)
+    operation = Operation.objects.get(pk=self.operation.pk)
+    operation.process = other
+    operation.save()
+    self.assertEqual(self.client.get(self.detail_url).json()['operations'], [])
+
+  def test_write_without_version_bump(self):
+    # As when another worker, with its own cache, made the change: the stale entry isn't served,
+    # under the new ETag or at all
+    for url in [self.detail_url, self.list_url]:
+      stale = self.client.get(url)
+      name = f"Renamed for {url}"
+      Operation.objects.filter(pk=self.operation.pk).update(name=name)
+      ManufacturingProcess.objects.filter(pk=self.process.pk).update(
+        name=name, updated_at=ManufacturingProcess.objects.get(pk=self.process.pk).updated_at + timedelta(seconds=1)
+      )
+      response = self.client.get(url, HTTP_IF_NONE_MATCH=stale['ETag'])
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+      self.assertEqual(response['X-Cache'], 'MISS')
+      self.assertNotEqual(response['ETag'], stale['ETag'])
+      self.assertIn(name.encode(), response.content)
+
+  def test_per_process_backend_with_workers(self):
+    locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+    with override_settings(WORKERS=1, CACHES=locmem):
+      self.assertEqual(check_response_cache_shared(None), [])
+    with override_settings(WORKERS=4, CACHES=redis):
+      self.assertEqual(check_response_cache_shared(None), [])
+    with override_settings(WORKERS=4, CACHES=locmem):
+      self.assertEqual([error.id for error in check_response_cache_shared(None)], ['app.E001'])
+
+  def test_variants_are_cached_separately(self):
+    self.client.get(self.list_url)
+    response = self.client.get(self.list_url, {'page_size': 1})
+    self.assertEqual(response['X-Cache'], 'MISS')
+    # The browsable API is rendered per user and never cached
+    response = self.client.get(self.list_url, HTTP_ACCEPT='text/html')
+    self.assertNotIn('X-Cache', response)
+    self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+class CoalescingTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.calls = 0
+    self.release = threading.Event()
+
+  def compute(self):
+    self.calls += 1
+    self.release.wait(5)
+    return HttpResponse(b'{}', content_type='application/json'), (b'{}', 'application/json')
+
+  def fail(self):
+    self.compute()
+    raise ValueError('failed')
+
+  def start(self, compute, results):
+    def request():
+      try:
+        results.append(coalesce('key', compute))
+      except ValueError as exc:
+        results.append(exc)
+    thread = threading.Thread(target=request)
+    thread.start()
+    return thread
+
+  def run_flight(self, leader_compute):
+    # A leader computing until released, and four requests arriving meanwhile
+    leader, followers = [], []
+    threads = [self.start(leader_compute, leader)]
+    while not len(response_flights):
+      time.sleep(0.001)
+    threads += [self.start(self.compute, followers) for _ in range(4)]
+    time.sleep(0.05)
+    self.release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(len(response_flights), 0)
+    return leader[0], followers
+
+  def test_threads_share_one_computation(self):
+    leader, followers = self.run_flight(self.compute)
+    self.assertEqual(self.calls, 1)
+    self.assertNotIn('X-Cache', leader)
+    self.assertEqual([response['X-Cache'] for response in followers], ['COALESCED'] * 4)
+    self.assertEqual([response.content for response in followers], [b'{}'] * 4)
+    self.assertEqual(response_cache_stats.as_dict()['coalesced'], 4)
+
+  def test_failure_is_not_shared(self):
+    leader, followers = self.run_flight(self.fail)
+    self.assertIsInstance(leader, ValueError)
+    # Each follower computed its own
+    self.assertEqual(self.calls, 5)
+    self.assertEqual([response.content for response in followers], [b'{}'] * 4)
+    self.assertEqual(response_cache_stats.as_dict()['coalesced'], 0)
+
+  @override_settings(RESPONSE_COALESCE_TIMEOUT=0.01)
+  def test_waiting_times_out(self):
+    leader = self.start(self.compute, [])
+    while not len(response_flights):
+      time.sleep(0.001)
+    response = coalesce('key', lambda: (HttpResponse(b'own'), None))
+    self.release.set()
+    leader.join()
+    self.assertEqual(response.content, b'own')
+
+  @override_settings(ROOT_URLCONF='project.async_urls')
+  async def test_async_requests_share_one_computation(self):
+    process = await ManufacturingProcess.objects.acreate(name="Temper", description="Coalesced")
+    await Operation.objects.acreate(
+      name="Heat", description="Coalesced", op_number=10, cycle_time=timedelta(seconds=10), process=process,
+    )
+    token = await sync_to_async(Token.objects.create)(user=self.user)
+    calls = []
+
+    for view, name in (
+      (async_views.ManufacturingProcessDetail, 'app:manufacturingprocess-detail'),
+      (async_views.OperationList, 'app:operation-list'),
+    ):
+      async def slow_get(instance, request, view=view, get=view.get, **kwargs):
+        # Long enough for the other requests to find the flight
+        calls.append(view)
+        await asyncio.sleep(0.1)
+        return await get(instance, request, **kwargs)
+
+      with mock.patch.object(view, 'get', slow_get):
+        responses = await asyncio.gather(*(
+          self.async_client.get(reverse(name, args=[process.pk]), authorization=f'Token {token.key}') for _ in range(5)
+        ))
+      self.assertEqual(calls.count(view), 1)
+      self.assertEqual(sorted(response['X-Cache'] for response in responses), ['COALESCED'] * 4 + ['MISS'])
+      self.assertEqual(len({response.content for response in responses}), 1)
+      self.assertTrue(all(response.status_code == status.HTTP_200_OK for response in responses))
+    self.assertEqual(response_cache_stats.as_dict()['coalesced'], 8)
+
+class ConditionalGetTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.process = ManufacturingProcess.objects.create(name="Grind", description="Conditional")
+    self.operation = Operation.objects.create(
+      name="Rough grind", description="Rough", op_number=10,
+      cycle_time=timedelta(seconds=60), process=self.process,
+    )
+    self.urls = [
+      reverse('app:manufacturingprocess-list'),
+      reverse('app:manufacturingprocess-detail', args=[self.process.pk]),
+      reverse('app:operation-list', args=[self.process.pk]),
+      reverse('app:operation-detail', args=[self.process.pk, 10]),
+    ]
+
+  def test_if_none_match(self):
+    for url, queries in zip(self.urls, (0, 1, 1, 1)):
+      response = self.client.get(url)
+      self.assertIn('ETag', response)
+      with self.assertNumQueries(queries):  # the validator query only; the list's is cached
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+      self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+      self.assertEqual(response.content, b'')
+
+  def test_if_modified_since(self):
+    for url in self.urls[1:]:
+      response = self.client.get(url)
+      response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+      self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    # Deletions can't be seen through a timestamp, so the list only sends an ETag
+    self.assertNotIn('Last-Modified', self.client.get(self.urls[0]))
+
+  def test_operation_change_bumps_process(self):
+    before = ManufacturingProcess.objects.get(pk=self.process.pk).updated_at
+    etags = [self.client.get(url)['ETag'] for url in self.urls]
+    self.operation.cycle_time = timedelta(seconds=50)
+    self.operation.save()
+    self.assertGreater(ManufacturingProcess.objects.get(pk=self.process.pk).updated_at, before)
+    for url, etag in zip(self.urls, etags):
+      response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+  def test_list_etag_changes_on_delete(self):
+    other = ManufacturingProcess.objects.create(name="Other", description="Other")
+    etag = self.client.get(self.urls[0])['ETag']
+    other.delete()
+    response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+  def test_list_etag_changes_on_writes(self):
+    summary_url = reverse('app:manufacturingprocess-summary-list')
+    for write in (
+      lambda: ManufacturingProcess.objects.create(name="New", description="Conditional"),
+      lambda: self.client.put(self.urls[1], {'name': 'Grind 2', 'description': 'Conditional'}, format='json'),
+      lambda: self.client.put(self.urls[3], {
+        'name': 'Fine grind', 'description': 'Fine', 'op_number': 10, 'cycle_time': '00:01:30',
+        'process': f'http://testserver{self.urls[1]}',
+      }, format='json'),
+    ):
+      etags = [self.client.get(url)['ETag'] for url in (self.urls[0], summary_url)]
+      self.assertLess(getattr(write(), 'status_code', 200), 300)
+      for url, etag in zip((self.urls[0], summary_url), etags):
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+  def test_missing_object(self):
+    url = reverse('app:manufacturingprocess-detail', args=[self.process.pk + 100])
+    response = self.client.get(url, HTTP_IF_NONE_MATCH='"anything"')
+    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class SummaryTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.process = ManufacturingProcess.objects.create(name="Forge", description="Summary")
+    self.empty = ManufacturingProcess.objects.create(name="Empty", description="Summary")
+    for op_number, seconds in [(10, 30), (20, 90), (30, 60), (40, 90)]:
+      Operation.objects.create(
+        name=f"Op {op_number}", description="Summary", op_number=op_number,
+        cycle_time=timedelta(seconds=seconds), process=self.process,
+      )
+
+  def test_rollups_follow_operation_changes(self):
+    process = ManufacturingProcess.objects.get(pk=self.process.pk)
+    self.assertEqual(process.operation_count, 4)
+    self.assertEqual(process.total_cycle_time, timedelta(seconds=270))
+    self.assertEqual(process.min_cycle_time, timedelta(seconds=30))
+    self.assertEqual(process.max_cycle_time, timedelta(seconds=90))
+    self.assertEqual(process.mean_cycle_time, timedelta(seconds=67.5))
+    self.assertEqual(process.bottleneck_op_number, 20)  # tie with 40 goes to the lower op_number
+
+    Operation.objects.get(op_number=20).delete()
+    process.refresh_from_db()
+    self.assertEqual(process.operation_count, 3)
+    self.assertEqual(process.bottleneck_op_number, 40)
+
+    Operation.objects.filter(process=process).delete()
+    process.refresh_from_db()
+    self.assertEqual(process.operation_count, 0)
+    self.assertEqual(process.total_cycle_time, timedelta(0))
+    self.assertIsNone(process.bottleneck_op_number)
+    self.assertIsNone(process.mean_cycle_time)
+
+  def test_bulk_import_updates_rollups(self):
+    url = reverse('app:operation-list', args=[self.empty.pk])
+    payload = [
+      {"name": "A", "description": "A", "op_number": 100, "cycle_time": "00:02:00"},
+      {"name": "B", "description": "B", "op_number": 110, "cycle_time": "00:01:00"},
+    ]
+    self.client.post(url, payload, format='json')
+    self.empty.refresh_from_db()
+    self.assertEqual(self.empty.operation_count, 2)
+    self.assertEqual(self.empty.bottleneck_op_number, 100)
+
+  def test_process_save_keeps_rollups(self):
+    stale = ManufacturingProcess.objects.get(pk=self.process.pk)
+    Operation.objects.create(
+      name="Op 50", description="Summary", op_number=50,
+      cycle_time=timedelta(seconds=10), process=self.process,
+    )
+    stale.name = "Forge 2"
+    stale.save()
+    self.process.refresh_from_db()
+    self.assertEqual(self.process.name, "Forge 2")
+    self.assertEqual(self.process.operation_count, 5)
+
+  def test_summary_list(self):
+    with self.assertNumQueries(1):  # one page of processes
+      response = self.client.get(reverse('app:manufacturingprocess-summary-list'))
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    first, second = response.data['results']
+    self.assertEqual(first['operation_count'], 4)
+    self.assertEqual(first['total_cycle_time'], '00:04:30')
+    self.assertEqual(first['mean_cycle_time'], '00:01:07.500000')
+    self.assertEqual(first['bottleneck_op_number'], 20)
+    self.assertEqual(second['operation_count'], 0)
+    self.assertIsNone(second['mean_cycle_time'])
+
+  def test_summary_detail(self):
+    url = reverse('app:manufacturingprocess-summary', args=[self.process.pk])
+    response = self.client.get(url)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.json()['max_cycle_time'], '00:01:30')
+    url = reverse('app:manufacturingprocess-summary', args=[self.process.pk + 100])
+    self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+class ThroughputAnalysisTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.url = reverse('app:throughput-analysis')
+    self.line = ManufacturingProcess.objects.create(name="Line", description="Analysis")
+    self.other = ManufacturingProcess.objects.create(name="Other", description="Analysis")
+    self.empty = ManufacturingProcess.objects.create(name="Empty", description="Analysis")
+    for op_number, seconds, process in [
+      (10, 30, self.line), (20, 60, self.line), (30, 45, self.line), (100, 20, self.other),
+    ]:
+      Operation.objects.create(
+        name=f"Op {op_number}", description="Analysis", op_number=op_number,
+        cycle_time=timedelta(seconds=seconds), process=process,
+      )
+
+  def test_matrix(self):
+    matrix = CycleTimeMatrix.load()
+    self.assertEqual(matrix.cycle_times.shape, (3, 3))
+    self.assertEqual(matrix.operation_counts.tolist(), [3, 1, 0])
+    self.assertEqual(matrix.cycle_times[0].tolist(), [30, 60, 45])
+
+  def test_scenarios(self):
+    matrix = CycleTimeMatrix.load([self.line.pk])
+    result = evaluate(matrix, [
+      Scenario('double op 20', stations={20: 2}),
+      Scenario('faster op 20', cycle_time_deltas={20: -40}),
+    ], takt_time=50)
+    self.assertEqual(result.throughput_per_hour[:, 0].tolist(), [60.0, 80.0, 3600 / 45])
+    self.assertEqual(result.bottleneck_op_number[:, 0].tolist(), [20, 30, 30])
+    self.assertEqual(result.takt_compliant[:, 0].tolist(), [False, True, True])
+    self.assertEqual(result.operations_over_takt[:, 0].tolist(), [1, 0, 0])
+
+  def test_balance_counts_stations(self):
+    matrix = CycleTimeMatrix.load([self.line.pk])
+    result = evaluate(matrix, [
+      Scenario('double op 20', stations={20: 2}),
+      Scenario('faster op 20', cycle_time_deltas={20: -40}),
+    ])
+    # Work content 135 s over 3 stations x 60 s, 4 stations x 45 s, then 95 s over 3 x 45 s
+    self.assertEqual(np.round(result.balance_efficiency[:, 0], 6).tolist(), [0.75, 0.75, 0.703704])
+
+  def test_unknown_op_number(self):
+    matrix = CycleTimeMatrix.load([self.other.pk])
+    with self.assertRaises(ValueError):
+      evaluate(matrix, [Scenario('bad', stations={20: 2})])
+
+  def test_endpoint(self):
+    payload = {
+      'takt_time': 40,
+      'scenarios': [{'name': 'extra station', 'stations': {'20': 2}}],
+    }
+    with self.assertNumQueries(2):  # process ids + operations
+      response = self.client.post(self.url, payload, format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data['scenarios'], ['baseline', 'extra station'])
+    line, other, empty = response.data['results']
+    self.assertEqual(line['scenarios'][0]['throughput_per_hour'], 60.0)
+    self.assertEqual(line['scenarios'][1]['bottleneck_op_number'], 30)
+    self.assertFalse(line['scenarios'][1]['takt_compliant'])
+    self.assertTrue(other['scenarios'][0]['takt_compliant'])
+    self.assertIsNone(empty['scenarios'][0]['throughput_per_hour'])
+
+  def test_endpoint_validation(self):
+    response = self.client.post(self.url, {'scenarios': [{'name': 'x', 'stations': {'20': 0}}]}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    response = self.client.post(self.url, {'scenarios': [{'name': 'x', 'stations': {'999': 2}}]}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_request_size_limits(self):
+    for payload in (
+      {'processes': list(range(1, settings.BATCH_MAX_SIZE + 2))},
+      {'scenarios': [{'name': f'{i}'} for i in range(settings.ANALYSIS_MAX_SCENARIOS + 1)]},
+      {'scenarios': [{'name': 'many', 'cycle_time_deltas': {str(i): 1 for i in range(settings.BATCH_MAX_SIZE + 1)}}]},
+    ):
+      with self.assertNumQueries(0):
+        response = self.client.post(self.url, payload, format='json')
+      self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_unknown_processes(self):
+    missing = [self.empty.pk + 1, self.empty.pk + 2]
+    with self.assertNumQueries(1):
+      response = self.client.post(self.url, {'processes': [self.line.pk, *missing]}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(response.json(), {'processes': [f'No such processes: {missing}.']})
+    with self.assertNumQueries(2):  # processes + operations
+      response = self.client.post(self.url, {'processes': [self.line.pk, self.empty.pk]}, format='json')
+    self.assertEqual([result['operation_count'] for result in response.data['results']], [3, 0])
+
+class MetricsTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    for histogram in histograms.values():
+      histogram.clear()
+    self.process = ManufacturingProcess.objects.create(name="Etch", description="Metrics")
+    for op_number in (10, 20):
+      Operation.objects.create(
+        name=f"Op {op_number}", description="Metrics", op_number=op_number,
+        cycle_time=timedelta(seconds=op_number), process=self.process,
+      )
+
+  def server_timing(self, response):
+    entries = {}
+    for entry in response['Server-Timing'].split(', '):
+      name, *params = entry.split(';')
+      entries[name] = dict(param.split('=', 1) for param in params)
+    return entries
+
+  def test_server_timing(self):
+    url = reverse('app:manufacturingprocess-detail', args=[self.process.pk])
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get(url)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    timing = self.server_timing(response)
+    self.assertEqual(set(timing), {'db', 'auth', 'serialize', 'render', 'total', 'size'})
+    self.assertEqual(timing['db']['desc'], f'"{len(queries)} queries"')
+    self.assertEqual(timing['size']['desc'], f'"{len(response.content)} bytes"')
+    self.assertGreater(float(timing['serialize']['dur']) + float(timing['render']['dur']), 0)
+    self.assertGreaterEqual(float(timing['total']['dur']), float(timing['db']['dur']))
+
+  def test_auth_timed(self):
+    token = Token.objects.create(user=self.user)
+    self.client.force_authenticate(user=None)
+    self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    response = self.client.get(reverse('app:manufacturingprocess-list'))
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertGreater(float(self.server_timing(response)['auth']['dur']), 0)
+
+  # The test client's requests come from 127.0.0.1
+  @override_settings(METRICS_TOKEN=None, INTERNAL_IPS=['127.0.0.1'])
+  def test_metrics_endpoint(self):
+    self.client.get(reverse('app:manufacturingprocess-list'))
+    self.client.get(reverse('app:manufacturingprocess-list'))
+    response = self.client.get(reverse('app:metrics'))
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertTrue(response['Content-Type'].startswith('text/plain'))
+    self.assertIn('no-store', response['Cache-Control'])
+    lines = response.content.decode().splitlines()
+    labels = 'method="GET",view="app:manufacturingprocess-list"'
+    self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', lines)
+    self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 2', lines)
+    self.assertIn('# TYPE http_request_db_queries histogram', lines)
+    self.assertIn('# TYPE response_cache_requests_total counter', lines)
+    self.assertIn('response_coalesced_requests_total 0', lines)
+
+  @override_settings(METRICS_TOKEN='scraper')
+  def test_metrics_token(self):
+    url = reverse('app:metrics')
+    self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+    self.client.credentials(HTTP_AUTHORIZATION='Bearer scraper')
+    self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+  @override_settings(METRICS_TOKEN=None, INTERNAL_IPS=[])
+  def test_metrics_unconfigured(self):
+    url = reverse('app:metrics')
+    self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+    with override_settings(INTERNAL_IPS=['10.0.0.5']):
+      self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+      self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, status.HTTP_200_OK)
+
+  @override_settings(SLOW_REQUEST_SECONDS=1e-9)
+  def test_slow_request_log(self):
+    url = reverse('app:operation-list', args=[self.process.pk])
+    with self.assertLogs('app.metrics', 'WARNING') as logs:
+      self.client.get(url)
+    self.assertIn(f'Slow request: GET {url} -> 200', logs.output[0])
+    self.assertIn('app_operation', logs.output[0])
+
+  @override_settings(ROOT_URLCONF='project.async_urls')
+  async def test_async_views(self):
+    token = await sync_to_async(Token.objects.create)(user=self.user)
+    response = await self.async_client.get(
+      reverse('app:operation-list', args=[self.process.pk]), authorization=f'Token {token.key}'
+    )
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    timing = self.server_timing(response)
+    self.assertGreater(float(timing['render']['dur']), 0)
+    self.assertGreater(float(timing['auth']['dur']), 0)
+
+  def test_not_slow(self):
+    with self.assertNoLogs('app.metrics'):
+      self.client.get(reverse('app:manufacturingprocess-list'))
+
+# The query budgets of the endpoints benchmark (app/benchmarks/endpoints.py), on a small data set
+class EndpointBudgetTestCase(TestCase):
+  def setUp(self):
+    cache.clear()
+
+  def test_every_route_has_a_budget(self):
+    self.assertEqual(uncovered_routes(), [])
+
+  @override_settings(METRICS_TOKEN=None, INTERNAL_IPS=['127.0.0.1'])
+  def test_within_query_budgets(self):
+    token = seed(20, 5)
+    # Query budgets only: latency depends on the machine, so `./manage.py benchmark endpoints --check`
+    # checks it, with enough samples
+    rows = measure_endpoints(token_client(token), Targets('benchmark', 'benchmark'), 3, latency_scale=math.inf)
+    self.assertEqual({row['endpoint']: row['failures'] for row in rows if row['failures']}, {})
+
+@override_settings(ROOT_URLCONF='project.async_urls')
+class AsyncReadTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.token = Token.objects.create(user=self.user)
+    self.process = ManufacturingProcess.objects.create(name="Anodize", description="Async")
+    for op_number in (10, 20, 30):
+      Operation.objects.create(
+        name=f"Op {op_number}", description="Async", op_number=op_number,
+        cycle_time=timedelta(seconds=op_number), process=self.process,
+      )
+    self.urls = [
+      reverse('app:root-view'),
+      reverse('app:manufacturingprocess-list'),
+      reverse('app:manufacturingprocess-detail', args=[self.process.pk]),
+      reverse('app:operation-list', args=[self.process.pk]) + '?page_size=2',
+      reverse('app:operation-detail', args=[self.process.pk, 20]),
+      reverse('app:manufacturingprocess-list') + '?expand=operations&fields=pk,operations.op_number',
+      reverse('app:manufacturingprocess-detail', args=[self.process.pk]) + '?fields=name',
+    ]
+
+  def get(self, url, **headers):
+    return self.async_client.get(url, authorization=f'Token {self.token.key}', **headers)
+
+  def test_views_are_async(self):
+    for url in self.urls:
+      self.assertTrue(asyncio.iscoroutinefunction(resolve(url.split('?')[0]).func))
+
+  def test_get_is_required(self):
+    with self.assertRaises(TypeError):
+      class Incomplete(async_views.AsyncReadView):
+        sync_view = async_views.views.RootView
+    with self.assertRaises(TypeError):
+      class Blocking(async_views.AsyncReadView):
+        def get(self, request, **kwargs):
+          return {}
+
+  async def test_same_content_as_sync_views(self):
+    for url in self.urls:
+      await sync_to_async(cache.clear)()
+      response = await self.get(url)
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+      self.assertEqual(response['Content-Type'], 'application/json')
+      await sync_to_async(clear_responses)()
+      expected = await sync_to_async(self.client.get)(url, HTTP_ACCEPT='application/json')
+      self.assertEqual(response.content, expected.content)
+      self.assertEqual(response.get('ETag'), expected.get('ETag'))
+      self.assertEqual(response['Allow'], expected['Allow'])
+
+  async def test_pagination_links(self):
+    response = await self.get(self.urls[3])
+    self.assertEqual([op['op_number'] for op in response.json()['results']], [10, 20])
+    response = await self.get(response.json()['next'])
+    self.assertEqual([op['op_number'] for op in response.json()['results']], [30])
+    self.assertIsNone(response.json()['next'])
+
+  async def test_shares_cache_and_validators(self):
+    url = self.urls[2]
+    response = await self.get(url)
+    self.assertEqual(response['X-Cache'], 'MISS')
+    self.assertEqual((await self.get(url))['X-Cache'], 'HIT')
+    response = await self.get(url, **{'if-none-match': response['ETag']})
+    self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+  async def test_errors(self):
+    response = await self.async_client.get(self.urls[2])
+    self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    self.assertEqual(response['WWW-Authenticate'], 'Token')
+    response = await self.async_client.get(self.urls[2], authorization='Token nope')
+    self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    for url in (
+      reverse('app:manufacturingprocess-detail', args=[self.process.pk + 1]),
+      reverse('app:operation-list', args=[self.process.pk + 1]),
+      reverse('app:operation-detail', args=[self.process.pk, 40]),
+    ):
+      response = await self.get(url)
+      self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+      self.assertEqual(response.json(), {'detail': 'Not found.'})
+    response = await self.get(self.urls[1] + '?cursor=bogus')
+    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+  async def test_view_checks_apply(self):
+    # The synchronous view's permission and throttle classes, overrides included
+    url = self.urls[2]
+
+    class Nobody(permissions.BasePermission):
+      def has_permission(self, request, view):
+        return False
+
+    with mock.patch.object(async_views.views.ManufacturingProcessDetail, 'permission_classes', [Nobody]):
+      response = await self.get(url)
+    self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    throttled = []
+    class Once(BaseThrottle):
+      def allow_request(self, request, view):
+        throttled.append(request)
+        return len(throttled) == 1
+
+      def wait(self):
+        return 60
+
+    with mock.patch.object(async_views.views.ManufacturingProcessDetail, 'throttle_classes', [Once]):
+      self.assertEqual((await self.get(url)).status_code, status.HTTP_200_OK)
+      response = await self.get(url)
+    self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+    self.assertIn('Retry-After', response)
+
+  async def test_other_formats_use_sync_views(self):
+    process_list = reverse('app:manufacturingprocess-list')
+    operation_list = reverse('app:operation-list', args=[self.process.pk])
+    for url, content_type in (
+      (process_list + '?format=msgpack', 'application/msgpack'),
+      (operation_list + '?format=msgpack', 'application/msgpack'),
+      (process_list + '?format=columnar', COLUMNAR),
+      (operation_list + '?format=columnar', COLUMNAR),
+      (process_list + '?format=api', 'text/html; charset=utf-8'),
+      (operation_list + '?format=api', 'text/html; charset=utf-8'),
+    ):
+      response = await self.get(url)
+      self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+      self.assertEqual(response['Content-Type'], content_type)
+    response = await self.get(operation_list + '?format=msgpack')
+    self.assertEqual([op['op_number'] for op in msgpack.unpackb(response.content)['results']], [10, 20, 30])
+    response = await self.get(operation_list + '?format=columnar')
+    self.assertEqual(response.json()['results']['op_number'], [10, 20, 30])
+
+  def test_writes_and_browsable_api_use_sync_views(self):
+    url = reverse('app:operation-list', args=[self.process.pk])
+    response = self.client.post(url, [{
+      'name': 'Seal', 'description': 'Async', 'op_number': 40, 'cycle_time': '00:00:40',
+    }], format='json')
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    response = self.client.get(url, HTTP_ACCEPT='text/html')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+  def test_asgi_handler_bounds_threads(self):
+    application = ThreadPoolASGIHandler(2)
+    threads = set()
+
+    # Django sends request_started from the thread the request's sync code runs on
+    def record(**kwargs):
+      threads.add(threading.get_ident())
+    request_started.connect(record)
+
+    async def get():
+      scope = {
+        'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'headers': [(b'host', b'testserver')],
+      }
+      await application(scope, AsyncMock(return_value={'type': 'http.request'}), AsyncMock())
+
+    async def main():
+      await asyncio.gather(*(get() for _ in range(20)))
+
+    try:
+      asyncio.run(main())
+    finally:
+      request_started.disconnect(record)
+      for lane in application.lanes:
+        SyncToAsync.context_to_thread_executor.pop(lane).shutdown()
+    self.assertEqual(len(threads), 2)
+
+class EventStream:
+  # Drives app/events.py's ASGI app like a server would, without sockets
+  def __init__(self, query='', headers=(), method='GET', application=event_stream):
+    scope = {
+      'type': 'http', 'method': method, 'path': '/events/', 'root_path': '', 'query_string': query.encode(),
+      'headers': [(b'host', b'testserver'), *headers],
+    }
+    self.sent = asyncio.Queue()
+    self.requested = False
+    self.closed = asyncio.Event()
+    self.task = asyncio.ensure_future(application(scope, self.receive, self.sent.put))
+
+  async def receive(self):
+    if not self.requested:
+      self.requested = True
+      return {'type': 'http.request', 'body': b'', 'more_body': False}
+    await self.closed.wait()
+    return {'type': 'http.disconnect'}
+
+  async def read(self):
+    return await asyncio.wait_for(self.sent.get(), timeout=5)
+
+  async def events(self, count):
+    # The next `count` events, as (event, data), however they were split into chunks
+    events = []
+    while len(events) < count:
+      for block in (await self.read())['body'].decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+          events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+  async def close(self):
+    self.closed.set()
+    await asyncio.wait_for(self.task, timeout=5)
+
+@override_settings(EVENTS_HEARTBEAT=60)
+class EventStreamTestCase(TestCase):
+  def setUp(self):
+    setup_client(self)
+    self.token = Token.objects.create(user=self.user)
+    self.headers = [(b'authorization', f'Token {self.token.key}'.encode())]
+    self.first = ManufacturingProcess.objects.create(name="First", description="Events")
+    self.second = ManufacturingProcess.objects.create(name="Second", description="Events")
+
+  def commit(self, write):
+    # Runs the on_commit callbacks that would follow the write outside the test's transaction
+    with self.captureOnCommitCallbacks(execute=True):
+      write()
+    return Change.objects.latest('pk').pk
+
+  async def open(self, query=''):
+    stream = EventStream(query, self.headers)
+    start = await stream.read()
+    self.assertEqual(start['status'], status.HTTP_200_OK)
+    self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+    self.assertEqual((await stream.read())['body'], b'retry: 5000\n\n')
+    return stream
+
+  async def test_streams_subscribed_processes(self):
+    stream = await self.open(f'processes={self.first.pk}')
+    await sync_to_async(self.commit)(lambda: self.second.save())
+    cursor = await sync_to_async(self.commit)(lambda: self.first.save())
+    self.assertEqual((await stream.read())['body'].decode(), (
+      f'id: {cursor}\nevent: change\n'
+      f'data: {json.dumps({"process": self.first.pk, "action": "updated", "cursor": cursor})}\n\n'
+    ))
+    await stream.close()
+    self.assertEqual(broadcaster.subscribers, set())
+
+  async def test_operation_changes_and_deletes(self):
+    stream = await self.open()
+    created = await sync_to_async(self.commit)(lambda: Operation.objects.create(
+      name="Weld", description="Events", op_number=10, cycle_time=timedelta(seconds=5), process=self.second,
+    ))
+    pk = self.first.pk
+    deleted = await sync_to_async(self.commit)(lambda: self.first.delete())
+    self.assertEqual(await stream.events(2), [
+      ('change', {'process': self.second.pk, 'action': 'updated', 'cursor': created}),
+      ('change', {'process': pk, 'action': 'deleted', 'cursor': deleted}),
+    ])
+    await stream.close()
+
+  def test_slow_streams_merge_then_resync(self):
+    subscriber = Subscriber(None, max_pending=2)
+    subscriber.put({'process': 1, 'action': 'created', 'cursor': 1})
+    subscriber.put({'process': 2, 'action': 'updated', 'cursor': 2})
+    subscriber.put({'process': 1, 'action': 'updated', 'cursor': 3})
+    self.assertEqual(subscriber.take(), ([
+      {'process': 2, 'action': 'updated', 'cursor': 2},
+      {'process': 1, 'action': 'created', 'cursor': 3},
+    ], False))
+    for pk in range(3):
+      subscriber.put({'process': pk, 'action': 'updated', 'cursor': pk})
+    self.assertEqual(subscriber.take(), ([], True))
+    self.assertEqual(encode([], True), b'event: resync\ndata: {}\n\n')
+
+  @override_settings(EVENTS_HEARTBEAT=0.01)
+  async def test_heartbeat(self):
+    stream = await self.open()
+    self.assertEqual((await stream.read())['body'], b': heartbeat\n\n')
+    await stream.close()
+
+  async def test_errors(self):
+    for query, headers, method, expected in (
+      ('', [], 'GET', status.HTTP_401_UNAUTHORIZED),
+      ('', [(b'authorization', b'Token nope')], 'GET', status.HTTP_401_UNAUTHORIZED),
+      ('processes=1,x', self.headers, 'GET', status.HTTP_400_BAD_REQUEST),
+      ('', self.headers, 'POST', status.HTTP_405_METHOD_NOT_ALLOWED),
+    ):
+      stream = EventStream(query, headers, method)
+      self.assertEqual((await stream.read())['status'], expected)
+      await stream.close()
+    with override_settings(EVENTS_MAX_STREAMS=0):
+      stream = EventStream('', self.headers)
+      self.assertEqual((await stream.read())['status'], status.HTTP_503_SERVICE_UNAVAILABLE)
+      await stream.close()
+
+  async def test_token_parameter(self):
+    stream = EventStream(f'token={self.token.key}')
+    self.assertEqual((await stream.read())['status'], status.HTTP_200_OK)
+    await stream.close()
+
+  async def test_asgi_handler_serves_streams(self):
+    application = ThreadPoolASGIHandler(1)
+    stream = EventStream(application=application, headers=self.headers)
+    start = await stream.read()
+    self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+    await stream.close()
+    self.assertEqual(application.lanes[0].requests, 0)
+
+  def test_listener_survives_bad_notifications(self):
+    class Stop(BaseException):
+      pass
+    listener = mock.MagicMock(notifies=[])
+    notifications = [['{"process": 1', '"resync"', json.dumps([{'process': 1, 'action': 'updated', 'cursor': 7}])]]
+    def poll():
+      # One round of notifications, then an error outside psycopg2's own
+      if not notifications:
+        raise RuntimeError('poll failed')
+      listener.notifies.extend(mock.Mock(payload=payload) for payload in notifications.pop())
+    listener.poll.side_effect = poll
+    with mock.patch('psycopg2.connect', return_value=listener), \
+        mock.patch('app.events.select.select', side_effect=lambda r, w, x, timeout: (r, [], [])), \
+        mock.patch('app.events.time.sleep', side_effect=Stop), \
+        mock.patch.object(broadcaster, 'deliver') as deliver, \
+        self.assertLogs('app.events', 'ERROR') as logs:
+      with self.assertRaises(Stop):
+        PostgresBroker().listen()
+    deliver.assert_called_once_with([{'process': 1, 'action': 'updated', 'cursor': 7}])
+    self.assertEqual([record.getMessage().split(':')[0] for record in logs.records], [
+      'Event listener dropped a notification', 'Event listener dropped a notification', 'Event listener failed',
+    ])
+    listener.close.assert_called_once_with()
+
+class ConnectionPoolTestCase(TestCase):
+  def setUp(self):
+    self.now = [0]
+    self.opened = []
+    self.closed = []
+    self.healthy = set()
+
+    def connect():
+      connection = len(self.opened)
+      self.opened.append(connection)
+      self.healthy.add(connection)
+      return connection
+
+    self.pool = ConnectionPool(
+      connect=connect, close=self.closed.append, max_size=2, max_age=100, timeout=0.05,
+      check=lambda connection: connection in self.healthy, timer=lambda: self.now[0],
+    )
+
+  def test_reuses_connections(self):
+    for _ in range(3):
+      connection = self.pool.acquire()
+      self.pool.release(connection)
+    self.assertEqual(self.opened, [0])
+    stats = self.pool.stats()
+    self.assertEqual((stats['acquired'], stats['created'], stats['idle'], stats['in_use']), (3, 1, 1, 0))
+
+  def test_max_age_and_health_check(self):
+    self.pool.release(self.pool.acquire())
+    self.now[0] = 100
+    self.assertEqual(self.pool.acquire(), 1)  # 0 expired
+    self.assertEqual(self.closed, [0])
+    self.pool.release(1)
+    self.healthy.discard(1)
+    self.assertEqual(self.pool.acquire(), 2)  # 1 failed the checkout check
+    self.assertEqual(self.closed, [0, 1])
+    self.assertEqual(self.pool.stats()['size'], 1)
+
+  def test_waits_then_times_out(self):
+    self.pool.timer = time.monotonic
+    self.pool.max_age = None
+    first, second = self.pool.acquire(), self.pool.acquire()
+    with self.assertRaises(PoolTimeout):
+      self.pool.acquire()
+    # A connection released while a thread waits goes to that thread
+    threading.Timer(0.01, self.pool.release, [first]).start()
+    self.assertEqual(self.pool.acquire(), first)
+    stats = self.pool.stats()
+    self.assertEqual((stats['waits'], stats['timeouts'], stats['size']), (2, 1, 2))
+    self.assertGreater(stats['wait_time_max'], 0)
+
+  def test_discard_frees_slot(self):
+    connection = self.pool.acquire()
+    self.pool.release(connection, discard=True)
+    self.assertEqual(self.closed, [connection])
+    self.pool.acquire()
+    self.pool.acquire()
+    self.assertEqual(self.pool.stats()['size'], 2)
+
+class SchemaTestCase(TestCase):
+  def setUp(self):
+    schema_cache.clear()
+    self.addCleanup(schema_cache.clear)
+    self.client = APIClient()
+    self.url = reverse('app:schema-json', kwargs={'format': '.json'})
+
+  def test_generated_once(self):
+    response = self.client.get(self.url)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    # Same document as drf-yasg's own uncached view
+    uncached = get_schema_view(API_INFO, public=True, permission_classes=[]).without_ui()
+    expected = uncached(APIRequestFactory().get(self.url), format='.json')
+    expected.render()
+    self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+    with mock.patch.object(OpenAPISchemaGenerator, 'get_schema', side_effect=AssertionError):
+      again = self.client.get(self.url)
+      self.assertEqual(again.content, response.content)
+      self.assertEqual(again['ETag'], response['ETag'])
+      self.assertEqual(
+        self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+        status.HTTP_304_NOT_MODIFIED
+      )
+    # Each format is its own document
+    yaml = self.client.get(reverse('app:schema-json', kwargs={'format': '.yaml'}))
+    self.assertNotEqual(yaml['ETag'], response['ETag'])
+
+  def test_schema_file(self):
+    path = Path(tempfile.mkdtemp()) / 'schema.json'
+    self.addCleanup(shutil.rmtree, path.parent)
+    call_command('generate_schema', output=str(path), stdout=io.StringIO())
+    call_command('generate_schema', output=str(path), check=True, stdout=io.StringIO())
+
+    with override_settings(SCHEMA_FILE=str(path)):
+      with mock.patch.object(OpenAPISchemaGenerator, 'get_schema', side_effect=AssertionError):
+        response = self.client.get(self.url)
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+      self.assertEqual(json.loads(response.content)['info']['title'], API_INFO.title)
+
+      # A file generated from other code is ignored
+      document = json.loads(path.read_text())
+      document['fingerprint'] = 'stale'
+      path.write_text(json.dumps(document))
+      schema_cache.clear()
+      with mock.patch.object(OpenAPISchemaGenerator, 'get_schema', side_effect=RuntimeError('generated')):
+        with self.assertRaisesMessage(RuntimeError, 'generated'):
+          self.client.get(self.url)
+      with self.assertRaises(CommandError):
+        call_command('generate_schema', output=str(path), check=True)
+
+  def test_schema_document(self):
+    # In place of drf-yasg's generate_swagger
+    stdout = io.StringIO()
+    call_command('generate_schema', format='json', stdout=stdout)
+    self.assertEqual(json.loads(stdout.getvalue())['info']['title'], API_INFO.title)
+    path = Path(tempfile.mkdtemp()) / 'schema.yaml'
+    self.addCleanup(shutil.rmtree, path.parent)
+    call_command('generate_schema', format='yaml', output=str(path), stdout=io.StringIO())
+    self.assertIn(f'title: {API_INFO.title}', path.read_text())
+
+class StartupTestCase(TestCase):
+  def test_docs_stack_not_loaded_at_startup(self):
+    # In a fresh interpreter, as a worker would start
+    code = (
+      'import sys, django; django.setup(); '
+      'from django.urls import get_resolver; get_resolver().url_patterns; '
+      "print(sorted(m for m in ('drf_yasg', 'numpy') if m in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    self.assertEqual(output.stdout.strip(), '[]')
+
+  def test_deferred_schemas_applied(self):
+    # In a fresh process, where nothing has loaded the views before the schema is generated
+    path = Path(tempfile.mkdtemp()) / 'schema.json'
+    self.addCleanup(shutil.rmtree, path.parent)
+    code = f'import django; django.setup(); from app.schema import *; write_schema_file({str(path)!r}, render_schemas())'
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
+    paths = json.loads(json.loads(path.read_text())['formats']['.json']['content'])['paths']
+    body, = [
+      parameter for parameter in paths['/processes/{id}/operations/']['post']['parameters']
+      if parameter['in'] == 'body'
+    ]
+    self.assertEqual(body['schema']['type'], 'array')
+    self.assertEqual(body['schema']['items']['properties']['op_number']['format'], 'int32')
+
+  def test_ui_served_lazily(self):
+    response = APIClient().get(reverse('app:schema-swagger-ui'))
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertContains(response, 'swagger')
+
+  def test_import_profile(self):
+    root = Path(tempfile.mkdtemp())
+    self.addCleanup(shutil.rmtree, root)
+    (root / 'profiled_outer.py').write_text('import time; import profiled_inner; time.sleep(0.02)')
+    (root / 'profiled_inner.py').write_text('import time; time.sleep(0.02)')
+    sys.path.insert(0, str(root))
+    self.addCleanup(sys.path.remove, str(root))
+    self.addCleanup(sys.modules.pop, 'profiled_outer', None)
+    self.addCleanup(sys.modules.pop, 'profiled_inner', None)
+
+    profiler = ImportProfiler()
+    sys.meta_path.insert(0, profiler)
+    try:
+      import profiled_outer
+    finally:
+      sys.meta_path.remove(profiler)
+    outer_total, outer_self = profiler.modules['profiled_outer']
+    inner_total, inner_self = profiler.modules['profiled_inner']
+    self.assertGreaterEqual(inner_self, 0.02)
+    self.assertAlmostEqual(outer_total, outer_self + inner_total)
+    self.assertLess(outer_self, outer_total - 0.015)
+
+    stream = io.StringIO()
+    profiler.report(0.05, stream, limit=5)
+    self.assertIn('profiled_outer', stream.getvalue())
+    self.assertIn('Startup: ready in 50.0 ms; 2 modules imported', stream.getvalue())